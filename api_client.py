@@ -1,54 +1,382 @@
-# api_client.py
-# Gestiona toda la comunicación con la API de LMStudio.
-
-import requests
-import json
-from PyQt5.QtCore import QObject, pyqtSignal
-
-class APIClient(QObject):
-    """
-    Cliente para interactuar con la API de LMStudio.
-    Emite señales para comunicar el estado de la petición a la UI.
-    """
-    response_received = pyqtSignal(str)
-    error_occurred = pyqtSignal(str)
-
-    def __init__(self, api_base_url):
-        super().__init__()
-        self.api_base_url = api_base_url
-
-    def set_api_url(self, url):
-        """Actualiza la URL base de la API."""
-        self.api_base_url = url
-
-    def send_request(self, history):
-        """
-        Envía una petición POST al endpoint de chat/completions.
-        
-        Args:
-            history: Una lista de mensajes que representa el historial de la conversación.
-        """
-        headers = {"Content-Type": "application/json"}
-        endpoint = f"{self.api_base_url}/chat/completions"
-
-        data = {
-            "model": "local-model",  # Este es un valor de ejemplo, LM Studio lo ignora.
-            "messages": history,
-            "max_tokens": 2048,
-            "stream": False
-        }
-
-        try:
-            response = requests.post(endpoint, headers=headers, json=data, timeout=120)
-            response.raise_for_status()  # Lanza una excepción para códigos de error HTTP (4xx o 5xx)
-            response_json = response.json()
-            
-            if 'choices' in response_json and len(response_json['choices']) > 0:
-                self.response_received.emit(response_json['choices'][0]['message']['content'])
-            else:
-                self.error_occurred.emit(f"Respuesta inesperada de la API: {response.text}")
-        
-        except requests.exceptions.RequestException as e:
-            self.error_occurred.emit(f"Error de conexión con la API: {e}")
-        except json.JSONDecodeError:
-            self.error_occurred.emit(f"No se pudo decodificar la respuesta JSON de la API: {response.text}")
\ No newline at end of file
+# api_client.py
+# Gestiona toda la comunicación con la API de LMStudio.
+
+import json
+import threading
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from http_transport import HTTPTransport, RETRYABLE_STATUS_CODES
+from request_body import RequestBodyBuilder
+from response_cache import cache_key, replay_pieces
+
+class APIError(Exception):
+    """Error al comunicarse con la API. El mensaje está listo para mostrarse al usuario."""
+
+class RequestCancelled(Exception):
+    """La petición se canceló antes de producir una respuesta."""
+
+class APIClient(QObject):
+    """
+    Cliente para interactuar con la API de LMStudio.
+    Emite señales para comunicar el estado de la petición a la UI.
+    """
+    response_received = pyqtSignal(str)
+    delta_received = pyqtSignal(str)
+    error_occurred = pyqtSignal(str)
+
+    def __init__(self, api_base_url, transport=None, warm_up=False, blob_store=None, max_tokens=2048,
+                 sampling=None, response_cache=None, endpoint_pool=None):
+        super().__init__()
+        self.api_base_url = api_base_url
+        self.max_tokens = max_tokens
+        # Parámetros de muestreo adicionales (temperature, seed, top_p...) que se envían tal cual
+        self.sampling = dict(sampling or {})
+        # ResponseCache opcional; solo se consulta si el muestreo es determinista o se fuerza
+        self.response_cache = response_cache
+        # EndpointPool opcional; si se indica, cada petición va al servidor que elija el pool
+        # en lugar de a 'api_base_url'
+        self.endpoint_pool = endpoint_pool
+        # Serializa cada mensaje una sola vez; las referencias "blob:" se vuelcan como
+        # base64 durante el envío
+        self.body_builder = RequestBodyBuilder(blob_store)
+        # Sesión persistente compartida por todas las peticiones (pool keep-alive y reintentos)
+        self.transport = transport or HTTPTransport()
+        self.warm_up_enabled = warm_up
+        # Permite detener desde el hilo de la UI una respuesta que se está recibiendo en streaming
+        self._cancel_event = threading.Event()
+
+        if self.warm_up_enabled:
+            self.warm_up()
+
+    def set_api_url(self, url):
+        """Actualiza la URL base de la API."""
+        self.api_base_url = url
+        if self.warm_up_enabled:
+            self.warm_up()
+
+    def warm_up(self):
+        """Abre por adelantado una conexión con el servidor sin bloquear al llamador."""
+        # Con un pool, las sondas periódicas ya abren las conexiones
+        if self.endpoint_pool is None:
+            self.transport.warm_up(f"{self.api_base_url}/models")
+
+    def cancel(self):
+        """Solicita detener la generación iniciada con send_request."""
+        self._cancel_event.set()
+
+    def send_request(self, history, stream=False):
+        """
+        Envía una petición POST al endpoint de chat/completions y comunica el
+        resultado mediante las señales del cliente.
+        
+        Args:
+            history: Una lista de mensajes que representa el historial de la conversación.
+            stream: Si es True, la respuesta se consume como server-sent events y cada
+                fragmento se emite con 'delta_received' a medida que llega.
+        """
+        self._cancel_event.clear()
+        try:
+            content = self.complete(history, stream=stream, on_delta=self.delta_received.emit,
+                                    cancel_event=self._cancel_event)
+        except RequestCancelled:
+            return
+        except APIError as e:
+            self.error_occurred.emit(str(e))
+            return
+        self.response_received.emit(content)
+
+    def complete(self, history, stream=False, on_delta=None, cancel_event=None, usage=None, metrics=None):
+        """
+        Ejecuta una petición a chat/completions de forma síncrona. Es seguro llamarlo
+        desde varios hilos a la vez; cada llamada tiene su propio evento de cancelación.
+
+        Args:
+            history: La lista de mensajes a enviar.
+            stream: Si es True, consume la respuesta como server-sent events.
+            on_delta: Función opcional que recibe cada fragmento de texto en modo streaming.
+            cancel_event: threading.Event opcional para detener la petición.
+            usage: Diccionario opcional que se rellena con el bloque 'usage' de la respuesta
+                (prompt_tokens, completion_tokens...) si el servidor lo incluye.
+            metrics: RequestMetrics opcional que se rellena con el desglose de tiempos,
+                bytes y tokens de la petición. Sin él no se mide nada.
+
+        Returns:
+            El texto de la respuesta. En streaming, si se cancela a mitad, el texto parcial.
+
+        Raises:
+            RequestCancelled: Si se canceló antes de recibir ningún contenido útil.
+            APIError: Ante errores de conexión, HTTP o de formato de la respuesta.
+        """
+        # requests tarda en importarse; se carga con la primera petición, en un hilo de
+        # trabajo, y no al arrancar la aplicación
+        import requests
+        params = {
+            "model": "local-model",  # Este es un valor de ejemplo, LM Studio lo ignora.
+            "max_tokens": self.max_tokens,
+            **self.sampling,
+            "stream": stream
+        }
+
+        if cancel_event is not None and cancel_event.is_set():
+            raise RequestCancelled()
+
+        if usage is None and (metrics is not None or self.response_cache is not None):
+            usage = {}
+
+        key = None
+        if self.response_cache is not None and self.response_cache.accepts(params):
+            key = cache_key(self._cache_scope("/chat/completions"), params, history)
+            cached = self.response_cache.get(key)
+            if cached is not None:
+                return self._replay(cached, stream, on_delta, usage, metrics)
+
+        response = None
+        endpoint = None
+        error = None
+        try:
+            body = self.body_builder.build(history, params)
+            if metrics is not None:
+                metrics.serialize_s = metrics.elapsed()
+                metrics.bytes_sent = len(body)
+            response, endpoint = self._post("/chat/completions", body, stream, cancel_event)
+            if metrics is not None and endpoint is not None:
+                metrics.endpoint = endpoint.url
+            if metrics is not None:
+                self._record_upload(metrics, body, response)
+            response.raise_for_status()  # Lanza una excepción para códigos de error HTTP (4xx o 5xx)
+
+            if stream:
+                content = self._read_stream(response, on_delta, cancel_event, usage, metrics)
+            else:
+                content = self._read_json(response, cancel_event, usage, metrics)
+            if metrics is not None:
+                metrics.finish(usage)
+            # Una respuesta cortada al cancelar está incompleta y no se guarda
+            if key is not None and not (cancel_event is not None and cancel_event.is_set()):
+                self.response_cache.put(key, content, usage)
+            return content
+
+        # Va antes que RequestException: el JSONDecodeError de requests hereda de ambas, y una
+        # respuesta mal formada no es un fallo de conexión ni debe marcar el servidor como caído
+        except json.JSONDecodeError as e:
+            if stream:
+                raise APIError("No se pudo decodificar un fragmento del stream de la API.") from e
+            raise APIError(f"No se pudo decodificar la respuesta JSON de la API: {response.text}") from e
+        except requests.exceptions.RequestException as e:
+            if cancel_event is not None and cancel_event.is_set():
+                raise RequestCancelled() from e
+            # Un error HTTP (p. ej. 400 por un contexto demasiado largo) no indica que el servidor esté caído
+            if not isinstance(e, requests.exceptions.HTTPError):
+                error = str(e)
+            raise APIError(f"Error de conexión con la API: {e}") from e
+        finally:
+            if stream and response is not None:
+                response.close()
+            if endpoint is not None:
+                self.endpoint_pool.release(endpoint, error)
+
+    def prewarm(self, history, cancel_event=None):
+        """
+        Envía el historial pidiendo un único token para que el servidor procese su
+        prefijo y lo deje en su caché de prompt; la petición real que lo comparta
+        empezará a generar antes. No pasa por la caché de respuestas.
+
+        Returns:
+            True si el servidor procesó la petición. Los errores se ignoran: el
+            precalentado es solo una optimización.
+        """
+        import requests
+        params = {
+            "model": "local-model",
+            "max_tokens": 1,
+            **self.sampling,
+            # En streaming se puede cerrar la conexión en cuanto se cancela
+            "stream": True
+        }
+        response = None
+        endpoint = None
+        try:
+            body = self.body_builder.build(history, params)
+            response, endpoint = self._post("/chat/completions", body, stream=True, cancel_event=cancel_event)
+            if not response.ok:
+                return False
+            for _line in response.iter_lines(chunk_size=None):
+                if cancel_event is not None and cancel_event.is_set():
+                    return False
+            return True
+        except requests.exceptions.RequestException:
+            return False
+        finally:
+            if response is not None:
+                response.close()
+            if endpoint is not None:
+                self.endpoint_pool.release(endpoint)
+
+    def embed(self, texts, model, cancel_event=None):
+        """
+        Obtiene con /embeddings un vector por cada texto de 'texts', en el mismo orden.
+
+        Raises:
+            RequestCancelled: Si se canceló con 'cancel_event'.
+            APIError: Ante errores de conexión, HTTP o de formato de la respuesta.
+        """
+        import requests
+        texts = list(texts)
+        body = json.dumps({"model": model, "input": texts}, ensure_ascii=False).encode("utf-8")
+        response = None
+        endpoint = None
+        error = None
+        try:
+            response, endpoint = self._post("/embeddings", body, cancel_event=cancel_event)
+            response.raise_for_status()
+            data = response.json()["data"]
+            vectors = [item["embedding"] for item in sorted(data, key=lambda item: item.get("index", 0))]
+        # Como en complete(), el JSONDecodeError de requests se trata antes que RequestException
+        except (json.JSONDecodeError, KeyError, TypeError, AttributeError) as e:
+            raise APIError(f"Respuesta inesperada de la API: {response.text}") from e
+        except requests.exceptions.RequestException as e:
+            if cancel_event is not None and cancel_event.is_set():
+                raise RequestCancelled() from e
+            if not isinstance(e, requests.exceptions.HTTPError):
+                error = str(e)
+            raise APIError(f"Error de conexión con la API: {e}") from e
+        finally:
+            if endpoint is not None:
+                self.endpoint_pool.release(endpoint, error)
+        # Un vector de menos desalinearía el índice: cada texto tiene que tener el suyo
+        if len(vectors) != len(texts):
+            raise APIError(f"La API devolvió {len(vectors)} vectores para {len(texts)} textos.")
+        return vectors
+
+    def _post(self, path, body, stream=False, cancel_event=None):
+        """
+        Envía la petición y devuelve (respuesta, servidor del pool o None).
+
+        Con un pool, si el servidor elegido no acepta la conexión o responde que está
+        ocupado (502/503/504) se pasa sin esperar al siguiente; solo con el último se
+        aplican los reintentos normales del transporte.
+        """
+        import requests
+        headers = {"Content-Type": "application/json"}
+        if self.endpoint_pool is None:
+            response = self.transport.post(f"{self.api_base_url}{path}", headers=headers, data=body,
+                                           stream=stream, cancel_event=cancel_event)
+            return response, None
+
+        tried = []
+        while True:
+            endpoint = self.endpoint_pool.acquire(exclude=tried)
+            tried.append(endpoint)
+            last = self.endpoint_pool.remaining(exclude=tried) == 0
+            if len(tried) > 1 and hasattr(body, "seek"):
+                body.seek(0)
+            try:
+                response = self.transport.post(f"{endpoint.url}{path}", headers=headers, data=body, stream=stream,
+                                               cancel_event=cancel_event, max_retries=None if last else 0)
+            except requests.exceptions.ConnectionError as e:
+                self.endpoint_pool.release(endpoint, str(e))
+                if last or (cancel_event is not None and cancel_event.is_set()):
+                    raise
+                continue
+            except BaseException:
+                self.endpoint_pool.release(endpoint)
+                raise
+            if response.status_code in RETRYABLE_STATUS_CODES and not last:
+                response.close()
+                self.endpoint_pool.release(endpoint, f"HTTP {response.status_code}")
+                continue
+            return response, endpoint
+
+    def _cache_scope(self, path):
+        """Parte de la clave de caché que identifica al servidor (o al pool completo)."""
+        if self.endpoint_pool is None:
+            return f"{self.api_base_url}{path}"
+        return ",".join(sorted(endpoint.url for endpoint in self.endpoint_pool.endpoints)) + path
+
+    @staticmethod
+    def _replay(cached, stream, on_delta=None, usage=None, metrics=None):
+        """Devuelve una respuesta de la caché; en streaming se entrega por fragmentos como si llegara del servidor."""
+        content, cached_usage = cached
+        if usage is not None:
+            usage.update(cached_usage)
+        if metrics is not None:
+            metrics.cached = True
+        if stream and on_delta is not None:
+            for piece in replay_pieces(content):
+                if metrics is not None and metrics.ttft_s is None:
+                    metrics.ttft_s = metrics.elapsed()
+                on_delta(piece)
+        if metrics is not None:
+            if metrics.ttft_s is None:
+                metrics.ttft_s = metrics.elapsed()
+            metrics.finish(usage)
+        return content
+
+    @staticmethod
+    def _record_upload(metrics, body, response):
+        """Anota los tiempos de conexión y envío a partir de cuándo se leyó el cuerpo."""
+        metrics.status_code = response.status_code
+        metrics.connect_s = metrics.since_start(body.first_read_at)
+        if body.first_read_at is not None and body.finished_at is not None:
+            metrics.upload_s = body.finished_at - body.first_read_at
+
+    @staticmethod
+    def _read_json(response, cancel_event=None, usage=None, metrics=None):
+        """Lee una respuesta sin streaming y devuelve el texto generado."""
+        response_json = response.json()
+        if metrics is not None:
+            # Sin streaming el primer token llega junto con la respuesta completa
+            metrics.ttft_s = metrics.elapsed()
+            metrics.bytes_received = len(response.content)
+        # Sin streaming no se puede interrumpir la generación; solo se descarta el resultado
+        if cancel_event is not None and cancel_event.is_set():
+            raise RequestCancelled()
+
+        try:
+            if usage is not None and response_json.get('usage'):
+                usage.update(response_json['usage'])
+            content = response_json['choices'][0]['message']['content']
+        except (KeyError, IndexError, TypeError, AttributeError, ValueError) as e:
+            raise APIError(f"Respuesta inesperada de la API: {response.text}") from e
+        if not isinstance(content, str):
+            raise APIError(f"Respuesta inesperada de la API: {response.text}")
+        return content
+
+    @staticmethod
+    def _read_stream(response, on_delta=None, cancel_event=None, usage=None, metrics=None):
+        """
+        Consume el stream SSE de chat/completions pasando cada fragmento a 'on_delta'.
+        Devuelve el texto acumulado, que será parcial si la generación se canceló.
+        """
+        parts = []
+        # chunk_size=None entrega los datos en cuanto llegan en lugar de esperar a llenar un bloque
+        for line in response.iter_lines(chunk_size=None):
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            if metrics is not None:
+                # iter_lines quita el salto de línea que separa los eventos
+                metrics.bytes_received += len(line) + 1
+            if not line.startswith(b"data:"):
+                continue
+            payload = line[len(b"data:"):].strip()
+            if payload == b"[DONE]":
+                break
+
+            chunk = json.loads(payload)
+            # LM Studio envía el uso de tokens en el último fragmento
+            if usage is not None and chunk.get("usage"):
+                usage.update(chunk["usage"])
+            choices = chunk.get("choices") or []
+            if not choices:
+                continue
+            delta = choices[0].get("delta", {}).get("content")
+            if delta:
+                if metrics is not None and not parts:
+                    metrics.ttft_s = metrics.elapsed()
+                parts.append(delta)
+                if on_delta is not None:
+                    on_delta(delta)
+
+        if not parts and cancel_event is not None and cancel_event.is_set():
+            raise RequestCancelled()
+        return "".join(parts)
@@ -1,20 +1,35 @@
-# app.py
-# Punto de entrada para ejecutar la aplicación.
-
-# pip install PyQt5 requests
-
-import sys
-from PyQt5.QtWidgets import QApplication
-
-# Importación de la ventana principal desde el módulo gui
-from gui import ChatGUI
-
-def main():
-    """Punto de entrada principal de la aplicación."""
-    app = QApplication(sys.argv)
-    main_window = ChatGUI()
-    main_window.show()
-    sys.exit(app.exec_())
-
-if __name__ == '__main__':
-    main()
\ No newline at end of file
+# app.py
+# Punto de entrada para ejecutar la aplicación.
+
+# pip install PyQt5 requests
+
+# Primero de todo: su importación es el origen de los tiempos de arranque
+import startup_probe
+
+import sys
+from PyQt5.QtWidgets import QApplication
+
+startup_probe.mark("qt_imported")
+# Importación de la ventana principal desde el módulo gui
+from gui import ChatGUI
+startup_probe.mark("gui_imported")
+
+def main():
+    """
+    Punto de entrada principal de la aplicación. Con --profile-startup se escriben en
+    la salida estándar los tiempos del arranque y se sale en cuanto termina.
+    """
+    app = QApplication(sys.argv)
+    startup_probe.mark("qapplication_created")
+    main_window = ChatGUI()
+    startup_probe.mark("window_built")
+    if "--profile-startup" in sys.argv:
+        def finish():
+            print(startup_probe.report(), flush=True)
+            main_window.close()
+        main_window.startup_finished.connect(finish)
+    main_window.show()
+    sys.exit(app.exec_())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,288 @@
+# batch_runner.py
+# Ejecución sin interfaz gráfica de lotes de prompts leídos de un archivo JSONL.
+#
+# Uso: python batch_runner.py prompts.jsonl -o resultados.jsonl [--concurrency 4] [--stream]
+#
+# Cada línea de entrada es un objeto con "prompt" y, opcionalmente, "id", "system"
+# e "images" (lista de rutas). Los resultados se añaden a la salida a medida que
+# terminan; si la ejecución se interrumpe, al relanzarla con la misma salida se
+# omiten los prompts que ya tienen respuesta. Una línea mal formada o una respuesta
+# inesperada del servidor quedan como error de ese prompt, sin detener el lote.
+#
+# Solo usa QtCore; QtGui se importa únicamente si algún prompt lleva imágenes, así
+# que los lotes de texto funcionan en servidores sin pantalla ni bibliotecas gráficas.
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import config
+from api_client import APIClient, APIError, RequestCancelled
+from blob_store import BlobStore
+from context_window import estimate_tokens
+from endpoint_pool import EndpointPool
+from http_transport import HTTPTransport
+from response_cache import ResponseCache
+
+def read_prompts(path):
+    """
+    Devuelve los prompts del JSONL, asignando como id el número de línea si no lo tienen.
+    Una línea que no es un objeto JSON se devuelve marcada como 'malformed' para que
+    quede como error de ese prompt y no detenga el lote.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                record = None
+            # El id se usa para reanudar: tiene que poder compararse con los ya hechos
+            if not isinstance(record, dict) or not isinstance(record.get("id", line_number), (str, int)):
+                record = {"id": line_number, "malformed": line}
+            record.setdefault("id", line_number)
+            yield record
+
+def record_error(record):
+    """Motivo por el que un registro de entrada no se puede enviar, o None si es válido."""
+    if "malformed" in record:
+        return "La línea no es un objeto JSON con un id válido."
+    if not isinstance(record.get("prompt"), str):
+        return "El registro no tiene un 'prompt' de texto."
+    images = record.get("images", [])
+    if not isinstance(images, list) or not all(isinstance(image_path, str) for image_path in images):
+        return "'images' debe ser una lista de rutas."
+    return None
+
+def completed_ids(path):
+    """Ids que ya tienen una respuesta correcta en el archivo de salida."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Una línea a medias de una ejecución interrumpida se vuelve a procesar
+                continue
+            if "error" not in record:
+                done.add(record["id"])
+    return done
+
+def percentile(values, fraction):
+    """Percentil por rango más cercano de una lista ya ordenada."""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))
+    return values[index]
+
+class BatchStats:
+    """Acumula latencias y tokens para el resumen de rendimiento."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.latencies = []
+        self.completion_tokens = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def record(self, result):
+        with self._lock:
+            if "error" in result:
+                self.errors += 1
+                return
+            self.latencies.append(result["latency_s"])
+            self.completion_tokens += result["usage"].get("completion_tokens", 0)
+
+    def total(self):
+        """Resultados registrados, con y sin error (sin ordenar las latencias)."""
+        with self._lock:
+            return len(self.latencies) + self.errors
+
+    def summary(self):
+        with self._lock:
+            elapsed = max(time.perf_counter() - self.started, 1e-9)
+            latencies = sorted(self.latencies)
+            return {
+                "completed": len(latencies),
+                "errors": self.errors,
+                "elapsed_s": round(elapsed, 3),
+                "requests_per_s": round(len(latencies) / elapsed, 3),
+                "tokens_per_s": round(self.completion_tokens / elapsed, 2),
+                "latency_p50_s": round(percentile(latencies, 0.50), 3),
+                "latency_p95_s": round(percentile(latencies, 0.95), 3),
+            }
+
+class BatchRunner:
+    """Envía los prompts con concurrencia limitada usando el mismo cliente que la interfaz."""
+
+    def __init__(self, api_client, blob_store, stream=False):
+        self.api_client = api_client
+        self.blob_store = blob_store
+        self.stream = stream
+        self.cancel_event = threading.Event()
+
+    def build_messages(self, record):
+        messages = []
+        if record.get("system"):
+            messages.append({"role": "system", "content": record["system"]})
+
+        content = [{"type": "text", "text": record["prompt"]}]
+        if record.get("images"):
+            # QtGui solo se carga si el lote lleva imágenes: los lotes de texto
+            # funcionan en servidores sin las bibliotecas gráficas de Qt
+            from image_utils import prepare_image
+        for image_path in record.get("images", []):
+            prepared = prepare_image(image_path, config.IMAGE_MAX_EDGE, config.IMAGE_MAX_PIXELS,
+                                     config.IMAGE_JPEG_QUALITY)
+            ref = self.blob_store.put(prepared.data, prepared.mime_type)
+            content.append({"type": "image_url", "image_url": {"url": ref}})
+        messages.append({"role": "user", "content": content})
+        return messages
+
+    def run_one(self, record):
+        result = {"id": record["id"]}
+        started = time.perf_counter()
+        first_token = []
+        usage = {}
+
+        def on_delta(_delta):
+            if not first_token:
+                first_token.append(time.perf_counter())
+
+        error = record_error(record)
+        if error is not None:
+            result["error"] = error
+            return result
+        try:
+            messages = self.build_messages(record)
+            response = self.api_client.complete(messages, stream=self.stream, on_delta=on_delta,
+                                                cancel_event=self.cancel_event, usage=usage)
+        except (APIError, RequestCancelled, OSError, ValueError) as e:
+            result["error"] = str(e) or type(e).__name__
+            return result
+        if self.cancel_event.is_set():
+            # Una respuesta en streaming cortada al interrumpir está incompleta
+            result["error"] = "RequestCancelled"
+            return result
+
+        result["response"] = response
+        result["latency_s"] = round(time.perf_counter() - started, 4)
+        if first_token:
+            result["ttft_s"] = round(first_token[0] - started, 4)
+        # Si el servidor no informa del uso se estima a partir del texto
+        usage.setdefault("completion_tokens", estimate_tokens(response))
+        result["usage"] = usage
+        return result
+
+def run(args):
+    done = completed_ids(args.output)
+    pending = (record for record in read_prompts(args.input) if record["id"] not in done)
+
+    blob_store = BlobStore(memory_limit=config.BLOB_CACHE_MB * 1024 * 1024)
+    transport = HTTPTransport(
+        pool_size=args.concurrency,
+        connect_timeout=config.CONNECT_TIMEOUT,
+        read_timeout=config.READ_TIMEOUT,
+        max_retries=config.MAX_RETRIES,
+    )
+    response_cache = None
+    if args.cache:
+        response_cache = ResponseCache(args.cache, max_bytes=config.RESPONSE_CACHE_MB * 1024 * 1024,
+                                       max_age=config.RESPONSE_CACHE_MAX_DAYS * 24 * 3600, force=args.force_cache)
+    # Varias URLs (o API_ENDPOINTS en config.py) reparten los prompts entre varios servidores
+    if args.api_url:
+        endpoints = args.api_url.split(",") if "," in args.api_url else []
+    else:
+        endpoints = config.API_ENDPOINTS
+    endpoint_pool = None
+    if endpoints:
+        endpoint_pool = EndpointPool(endpoints, transport, routing=config.ENDPOINT_ROUTING,
+                                     probe_interval=config.ENDPOINT_PROBE_INTERVAL,
+                                     probe_timeout=config.ENDPOINT_PROBE_TIMEOUT)
+        endpoint_pool.start()
+    api_client = APIClient(args.api_url or config.API_BASE_URL, transport, blob_store=blob_store,
+                           max_tokens=args.max_tokens or config.MAX_RESPONSE_TOKENS,
+                           sampling=config.SAMPLING_PARAMS, response_cache=response_cache,
+                           endpoint_pool=endpoint_pool)
+    runner = BatchRunner(api_client, blob_store, stream=args.stream)
+    stats = BatchStats()
+
+    if done:
+        print(f"Reanudando: {len(done)} prompts ya completados en {args.output}", file=sys.stderr)
+
+    with open(args.output, "a", encoding="utf-8") as output, \
+            ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="batch") as pool:
+        in_flight = set()
+        try:
+            for record in pending:
+                # Solo se leen del archivo los prompts que caben en la ventana de concurrencia
+                if len(in_flight) >= args.concurrency:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    _write_results(finished, output, stats, args.progress_every)
+                in_flight.add(pool.submit(runner.run_one, record))
+            _write_results(in_flight, output, stats, args.progress_every)
+        except KeyboardInterrupt:
+            print("\nInterrumpido; se puede reanudar con el mismo archivo de salida.", file=sys.stderr)
+            runner.cancel_event.set()
+            for future in in_flight:
+                future.cancel()
+        finally:
+            blob_store.close()
+
+    summary = stats.summary()
+    if response_cache is not None:
+        summary["cache"] = response_cache.stats()
+        response_cache.close()
+    if endpoint_pool is not None:
+        endpoint_pool.stop()
+        summary["endpoints"] = endpoint_pool.stats()
+    print(json.dumps(summary), file=sys.stderr)
+    return summary
+
+def _write_results(futures, output, stats, progress_every):
+    for future in futures:
+        if future.cancelled():
+            continue
+        result = future.result()
+        # Los prompts cancelados al interrumpir no se guardan para que se repitan al reanudar
+        if result.get("error") == "RequestCancelled":
+            continue
+        output.write(json.dumps(result, ensure_ascii=False) + "\n")
+        output.flush()
+        stats.record(result)
+
+        total = stats.total()
+        if progress_every and total % progress_every == 0:
+            summary = stats.summary()
+            print(f"[{total}] {summary['requests_per_s']} req/s  {summary['tokens_per_s']} tok/s  "
+                  f"p50 {summary['latency_p50_s']}s  p95 {summary['latency_p95_s']}s  errores {summary['errors']}",
+                  file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ejecuta un lote de prompts contra la API de LM Studio.")
+    parser.add_argument("input", help="Archivo JSONL con los prompts.")
+    parser.add_argument("-o", "--output", required=True, help="Archivo JSONL de resultados (se reanuda si existe).")
+    parser.add_argument("-c", "--concurrency", type=int, default=2, help="Peticiones simultáneas (por defecto 2).")
+    parser.add_argument("--stream", action="store_true", help="Usa streaming para medir el tiempo hasta el primer token.")
+    parser.add_argument("--api-url", help="URL base de la API (por defecto la de config.py); "
+                                          "varias separadas por comas reparten la carga.")
+    parser.add_argument("--max-tokens", type=int, help="Máximo de tokens por respuesta.")
+    parser.add_argument("--cache", help="Caché de respuestas (SQLite) para no repetir prompts idénticos.")
+    parser.add_argument("--force-cache", action="store_true",
+                        help="Usa la caché aunque el muestreo no sea determinista.")
+    parser.add_argument("--progress-every", type=int, default=10, help="Frecuencia del informe de progreso.")
+    args = parser.parse_args(argv)
+    if args.concurrency < 1:
+        parser.error("--concurrency debe ser al menos 1")
+    run(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+# benchmark.py
+# Mide el coste de las partes críticas del cliente contra un servidor simulado
+# local (mock_server.py), sin necesidad de LM Studio.
+#
+# Uso: python benchmark.py [casos...] [--output resultados.json] [--compare anterior.json]
+#
+# Cada caso devuelve métricas numéricas planas ("metrics") y, opcionalmente, la
+# serie de muestras en la que se basan ("samples"). Con --compare se muestra la
+# variación de cada métrica respecto a una ejecución guardada anteriormente.
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from blob_store import BlobStore
+from request_body import RequestBodyBuilder
+
+def _drain(body):
+    """Lee el cuerpo en bloques como lo haría http.client y devuelve los bytes leídos."""
+    total = 0
+    while True:
+        chunk = body.read(8192)
+        if not chunk:
+            return total
+        total += len(chunk)
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(fraction * len(values))) - 1))
+    return values[index]
+
+def _ms(seconds):
+    return round(seconds * 1000, 3)
+
+def bench_turn_latency(turns=20, response_tokens=64, token_rate=400.0, prefill_ms=20.0):
+    """Latencia total y tiempo hasta el primer token de turnos completos contra el servidor simulado."""
+    from api_client import APIClient
+    from http_transport import HTTPTransport
+    from mock_server import MockServer, MockSettings
+
+    settings = MockSettings(prefill_ms=prefill_ms, token_rate=token_rate, response_tokens=response_tokens)
+    metrics = {}
+    with MockServer(settings) as server:
+        client = APIClient(server.base_url, HTTPTransport(), max_tokens=response_tokens)
+        for stream in (False, True):
+            history = []
+            totals, first_tokens = [], []
+            for turn in range(turns):
+                history.append({"role": "user", "content": [{"type": "text", "text": f"Pregunta {turn}"}]})
+                first_token = []
+
+                def on_delta(_delta):
+                    if not first_token:
+                        first_token.append(time.perf_counter())
+
+                start = time.perf_counter()
+                content = client.complete(history, stream=stream, on_delta=on_delta)
+                totals.append(time.perf_counter() - start)
+                first_tokens.append((first_token[0] if first_token else time.perf_counter()) - start)
+                history.append({"role": "assistant", "content": content})
+
+            mode = "stream" if stream else "blocking"
+            metrics[f"{mode}_total_p50_ms"] = _ms(_percentile(totals, 0.5))
+            metrics[f"{mode}_total_p95_ms"] = _ms(_percentile(totals, 0.95))
+            metrics[f"{mode}_ttft_p50_ms"] = _ms(_percentile(first_tokens, 0.5))
+            metrics[f"{mode}_ttft_p95_ms"] = _ms(_percentile(first_tokens, 0.95))
+        client.transport.close()
+    return {"name": "turn_latency", "metrics": metrics}
+
+def bench_prewarm(turns=8, history_kb=64, prefill_ms_per_kb=10.0):
+    """
+    Tiempo hasta el primer token con y sin precalentado del prefijo, contra un servidor
+    simulado con caché de prompt cuyo prefill cuesta 'prefill_ms_per_kb' por KB no cacheado.
+    """
+    from api_client import APIClient
+    from http_transport import HTTPTransport
+    from mock_server import MockServer, MockSettings
+
+    settings = MockSettings(prefill_ms=10, prefill_ms_per_kb=prefill_ms_per_kb, token_rate=0,
+                            response_tokens=16, prompt_cache=True)
+    filler = "Contexto de relleno para alargar el historial. " * (history_kb * 1024 // 48)
+    metrics = {}
+    with MockServer(settings) as server:
+        client = APIClient(server.base_url, HTTPTransport(), max_tokens=16)
+        for prewarm in (False, True):
+            first_tokens = []
+            for turn in range(turns):
+                # Cada turno parte de un historial distinto, así que nada está en caché de antemano
+                history = [{"role": "user", "content": f"{turn} {filler}"},
+                           {"role": "assistant", "content": "De acuerdo."}]
+                message = {"role": "user", "content": [{"type": "text", "text": f"Pregunta {turn}"}]}
+                if prewarm:
+                    # Lo que enviaría el precalentado con el borrador a medio escribir
+                    draft = {"role": "user", "content": [{"type": "text", "text": "Preg"}]}
+                    client.prewarm(history + [draft])
+                first_token = []
+
+                def on_delta(_delta):
+                    if not first_token:
+                        first_token.append(time.perf_counter())
+
+                start = time.perf_counter()
+                client.complete(history + [message], stream=True, on_delta=on_delta)
+                first_tokens.append(first_token[0] - start)
+            mode = "prewarmed" if prewarm else "cold"
+            metrics[f"{mode}_ttft_p50_ms"] = _ms(_percentile(first_tokens, 0.5))
+        client.transport.close()
+    return {"name": "prewarm", "metrics": metrics}
+
+def bench_image_encoding(megapixels=(1, 4, 12), repeats=3):
+    """Tiempo de preparar imágenes de distintos tamaños (decodificar, reducir y recodificar)."""
+    from PyQt5.QtGui import QImage
+    from image_utils import prepare_image
+    import config
+
+    samples = []
+    metrics = {}
+    with tempfile.TemporaryDirectory(prefix="lmstudio-bench-") as workdir:
+        for mp in megapixels:
+            width = int((mp * 1_000_000 * 4 / 3) ** 0.5)
+            height = int(width * 3 / 4)
+            # Ruido aleatorio para que el JPEG tenga un tamaño realista
+            image = QImage(os.urandom(width * height * 4), width, height, QImage.Format_RGB32)
+            path = os.path.join(workdir, f"bench_{mp}mp.jpg")
+            image.save(path, "JPEG", 92)
+            source_bytes = os.path.getsize(path)
+
+            timings = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                prepared = prepare_image(path, config.IMAGE_MAX_EDGE, config.IMAGE_MAX_PIXELS,
+                                         config.IMAGE_JPEG_QUALITY)
+                timings.append(time.perf_counter() - start)
+
+            best = min(timings)
+            samples.append({
+                "megapixels": mp,
+                "source_bytes": source_bytes,
+                "output_bytes": len(prepared.data),
+                "output_size": f"{prepared.width}x{prepared.height}",
+                "best_ms": _ms(best),
+            })
+            metrics[f"{mp}mp_ms"] = _ms(best)
+            metrics[f"{mp}mp_source_mb_per_s"] = round(source_bytes / best / 1e6, 2)
+    return {"name": "image_encoding", "metrics": metrics, "samples": samples}
+
+def bench_serialization(turns=400, image_every=10, image_kb=300, sample_every=50):
+    """
+    Compara el coste por turno de serializar el historial completo con json.dumps
+    frente a la construcción incremental con fragmentos cacheados.
+    """
+    blob_store = BlobStore(memory_limit=256 * 1024 * 1024)
+    builder = RequestBodyBuilder(blob_store)
+    params = {"model": "local-model", "max_tokens": 2048, "stream": True}
+    history = []
+    samples = []
+
+    try:
+        for turn in range(1, turns + 1):
+            content = [{"type": "text", "text": f"Pregunta número {turn}. " * 20}]
+            if image_every and turn % image_every == 0:
+                ref = blob_store.put(os.urandom(image_kb * 1024), "image/jpeg")
+                content.append({"type": "image_url", "image_url": {"url": ref}})
+            history.append({"role": "user", "content": content})
+
+            if turn % sample_every == 0:
+                start = time.perf_counter()
+                full = json.dumps({"messages": blob_store.resolve_messages(history), **params}).encode("utf-8")
+                naive = time.perf_counter() - start
+
+                start = time.perf_counter()
+                body = builder.build(history, params)
+                build = time.perf_counter() - start
+                _drain(body)
+                upload = time.perf_counter() - start
+
+                samples.append({
+                    "history_length": len(history),
+                    "body_bytes": len(full),
+                    "naive_ms": _ms(naive),
+                    "incremental_build_ms": _ms(build),
+                    "incremental_build_and_read_ms": _ms(upload),
+                })
+
+            history.append({"role": "assistant", "content": f"Respuesta número {turn}. " * 40})
+            # Cada turno construye su cuerpo, igual que en la aplicación
+            builder.build(history, params)
+    finally:
+        blob_store.close()
+
+    last = samples[-1]
+    metrics = {
+        "naive_ms_at_max_history": last["naive_ms"],
+        "incremental_build_ms_at_max_history": last["incremental_build_ms"],
+        "incremental_build_and_read_ms_at_max_history": last["incremental_build_and_read_ms"],
+    }
+    return {"name": "serialization", "metrics": metrics, "samples": samples}
+
+def bench_gui(messages=2000, scroll_steps=200):
+    """Tiempo de añadir N mensajes a la vista del chat y de recorrerla, con Qt en modo offscreen."""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication
+    from chat_display import ChatDisplay
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    display = ChatDisplay()
+    display.resize(800, 600)
+    display.show()
+    app.processEvents()
+
+    start = time.perf_counter()
+    for index in range(messages):
+        role = "user" if index % 2 == 0 else "assistant"
+        display.add_message(role, f"Mensaje {index}. " + "texto de relleno " * (index % 40 + 1))
+    app.processEvents()
+    append = time.perf_counter() - start
+
+    scrollbar = display.verticalScrollBar()
+    frame_times = []
+    start = time.perf_counter()
+    for step in range(scroll_steps):
+        frame_start = time.perf_counter()
+        scrollbar.setValue(scrollbar.maximum() * step // scroll_steps)
+        display.viewport().repaint()
+        frame_times.append(time.perf_counter() - frame_start)
+    scroll = time.perf_counter() - start
+
+    start = time.perf_counter()
+    display.clear_chat()
+    app.processEvents()
+    clear = time.perf_counter() - start
+    display.close()
+
+    return {"name": "gui", "metrics": {
+        "append_total_ms": _ms(append),
+        "append_per_message_us": round(append / messages * 1e6, 2),
+        "scroll_frame_p50_ms": _ms(statistics.median(frame_times)),
+        "scroll_frame_p95_ms": _ms(_percentile(frame_times, 0.95)),
+        "scroll_total_ms": _ms(scroll),
+        "clear_ms": _ms(clear),
+    }}
+
+def bench_semantic_search(messages=100_000, dimension=768, queries=20, k=20):
+    """
+    Tiempo de búsqueda en un índice semántico de N mensajes con vectores aleatorios.
+    Sin NumPy se usa un índice más pequeño: la búsqueda en Python puro no escala.
+    """
+    import random
+    from semantic_index import SemanticIndex, _load_numpy
+
+    numpy = _load_numpy()
+    if numpy is None:
+        messages, dimension = min(messages, 2000), min(dimension, 256)
+    rng = random.Random(0)
+    timings = []
+    with tempfile.TemporaryDirectory(prefix="lmstudio-bench-") as workdir:
+        index = SemanticIndex(workdir, model="bench")
+        start = time.perf_counter()
+        batch = 10_000
+        for first in range(0, messages, batch):
+            count = min(batch, messages - first)
+            if numpy is not None:
+                vectors = numpy.random.default_rng(first).standard_normal((count, dimension), dtype=numpy.float32)
+            else:
+                vectors = [[rng.gauss(0, 1) for _ in range(dimension)] for _ in range(count)]
+            index.append(range(first + 1, first + count + 1), vectors, first + count)
+        build = time.perf_counter() - start
+
+        for _ in range(queries):
+            query = [rng.gauss(0, 1) for _ in range(dimension)]
+            start = time.perf_counter()
+            results = index.search(query, k)
+            timings.append(time.perf_counter() - start)
+        assert len(results) == min(k, messages)
+
+    return {
+        "name": "semantic_search",
+        "metrics": {
+            "messages": messages,
+            "dimension": dimension,
+            "numpy": int(numpy is not None),
+            "build_s": round(build, 3),
+            "search_p50_ms": _ms(statistics.median(timings)),
+            "search_p95_ms": _ms(_percentile(timings, 0.95)),
+            # La primera búsqueda incluye mapear la matriz
+            "first_search_ms": _ms(timings[0]),
+        },
+        "samples": [_ms(value) for value in timings],
+    }
+
+def bench_cold_start(runs=10):
+    """
+    Arranques completos de la aplicación (python app.py --profile-startup) en procesos
+    nuevos, con Qt en modo offscreen: mediana de cada hito del arranque y del proceso entero.
+    """
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+    samples = []
+    # Las rutas relativas de config.py (sesiones, métricas) se crean en un directorio vacío
+    with tempfile.TemporaryDirectory() as directory:
+        for _ in range(runs):
+            start = time.perf_counter()
+            output = subprocess.run([sys.executable, app_path, "--profile-startup"], cwd=directory, env=env,
+                                    capture_output=True, text=True, check=True).stdout
+            milestones = json.loads(output.strip().splitlines()[-1])
+            milestones["process_total"] = _ms(time.perf_counter() - start)
+            samples.append(milestones)
+
+    metrics = {}
+    for name in samples[0]:
+        values = [sample[name] for sample in samples if name in sample]
+        metrics[f"{name}_p50_ms"] = round(statistics.median(values), 3)
+    return {"name": "cold_start", "metrics": metrics, "samples": samples}
+
+BENCHMARKS = {
+    "turn_latency": bench_turn_latency,
+    "prewarm": bench_prewarm,
+    "image_encoding": bench_image_encoding,
+    "serialization": bench_serialization,
+    "gui": bench_gui,
+    "semantic_search": bench_semantic_search,
+    "cold_start": bench_cold_start,
+}
+
+def _print_result(result, baseline=None):
+    print(f"== {result['name']}")
+    previous = (baseline or {}).get(result["name"], {})
+    for key, value in result["metrics"].items():
+        line = f"   {key:<48} {value:>12}"
+        if isinstance(previous.get(key), (int, float)) and previous[key]:
+            line += f"   ({(value - previous[key]) / previous[key] * 100:+.1f}%)"
+        print(line)
+
+def _load_baseline(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return {result["name"]: result["metrics"] for result in json.load(f)["results"]}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks del cliente de LM Studio.")
+    parser.add_argument("names", nargs="*", help=f"Casos a ejecutar (todos por defecto): {', '.join(BENCHMARKS)}.")
+    parser.add_argument("--output", help="Guarda los resultados en este archivo JSON.")
+    parser.add_argument("--compare", help="Resultados JSON anteriores con los que comparar.")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"Casos desconocidos: {', '.join(unknown)}")
+
+    baseline = _load_baseline(args.compare) if args.compare else None
+    results = []
+    for name in args.names or BENCHMARKS:
+        result = BENCHMARKS[name]()
+        _print_result(result, baseline)
+        results.append(result)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "timestamp": time.time(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "results": results,
+            }, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+# blob_store.py
+# Almacén de imágenes direccionado por contenido. El historial guarda solo una
+# referencia corta ("blob:sha256:<hash>") y el base64 se genera al construir la petición.
+
+import base64
+import hashlib
+import mimetypes
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+BLOB_URL_PREFIX = "blob:sha256:"
+
+def is_blob_ref(value):
+    return isinstance(value, str) and value.startswith(BLOB_URL_PREFIX)
+
+class BlobStore:
+    """
+    Guarda datos binarios indexados por su hash SHA-256.
+
+    Los blobs usados recientemente se mantienen en memoria hasta 'memory_limit'
+    bytes; los menos recientes se vuelcan a disco y se vuelven a leer bajo
+    demanda. Un mismo contenido se guarda una sola vez aunque se adjunte varias
+    veces. Es seguro usarlo desde varios hilos.
+
+    Con 'write_through' cada blob nuevo se escribe a disco al guardarse (la copia
+    en memoria queda como caché), de modo que sobrevive a la aplicación y puede
+    referenciarse desde las sesiones guardadas.
+    """
+
+    def __init__(self, directory=None, memory_limit=64 * 1024 * 1024, write_through=False):
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._tempdir = None
+            self.directory = directory
+        else:
+            self._tempdir = tempfile.TemporaryDirectory(prefix="lmstudio-blobs-")
+            self.directory = self._tempdir.name
+        self.memory_limit = memory_limit
+        self.write_through = write_through
+
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._mime_types = {}
+        self._on_disk = {}
+        self._lock = threading.Lock()
+
+        # Los blobs volcados en sesiones anteriores siguen disponibles si el directorio es persistente
+        for name in os.listdir(self.directory):
+            if not name.endswith(".tmp"):
+                self._on_disk[os.path.splitext(name)[0]] = os.path.join(self.directory, name)
+
+    def put(self, data, mime_type):
+        """Guarda los datos (si no existían ya) y devuelve su referencia."""
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            self._mime_types[digest] = mime_type
+            if digest in self._memory:
+                self._memory.move_to_end(digest)
+            elif digest not in self._on_disk:
+                if self.write_through:
+                    self._write(digest, data)
+                self._memory[digest] = data
+                self._memory_bytes += len(data)
+                self._evict()
+        return BLOB_URL_PREFIX + digest
+
+    def path(self, ref):
+        """Devuelve la ruta del blob en disco, o None si solo está en memoria o no existe."""
+        with self._lock:
+            return self._on_disk.get(self._digest(ref))
+
+    def get(self, ref):
+        """
+        Devuelve (datos, tipo MIME) de una referencia.
+
+        Raises:
+            KeyError: Si el blob no existe ni en memoria ni en disco.
+        """
+        digest = self._digest(ref)
+        with self._lock:
+            data = self._memory.get(digest)
+            if data is not None:
+                self._memory.move_to_end(digest)
+                return data, self._mime_types[digest]
+            path = self._on_disk.get(digest)
+        if path is None:
+            raise KeyError(ref)
+
+        with open(path, "rb") as blob_file:
+            data = blob_file.read()
+        mime_type = self._mime_types.get(digest) or mimetypes.guess_type(path)[0] or "application/octet-stream"
+        return data, mime_type
+
+    def info(self, ref):
+        """Devuelve (tamaño en bytes, tipo MIME) sin cargar el blob."""
+        digest = self._digest(ref)
+        with self._lock:
+            data = self._memory.get(digest)
+            if data is not None:
+                return len(data), self._mime_types[digest]
+            path = self._on_disk.get(digest)
+        if path is None:
+            raise KeyError(ref)
+        mime_type = self._mime_types.get(digest) or mimetypes.guess_type(path)[0] or "application/octet-stream"
+        return os.path.getsize(path), mime_type
+
+    def iter_chunks(self, ref, chunk_size):
+        """
+        Recorre el contenido del blob en bloques de 'chunk_size' bytes. Si está
+        volcado a disco se lee por partes, sin cargarlo entero en memoria.
+        """
+        digest = self._digest(ref)
+        with self._lock:
+            data = self._memory.get(digest)
+            path = self._on_disk.get(digest)
+        if data is not None:
+            for start in range(0, len(data), chunk_size):
+                yield data[start:start + chunk_size]
+            return
+        if path is None:
+            raise KeyError(ref)
+        with open(path, "rb") as blob_file:
+            while True:
+                chunk = blob_file.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def __contains__(self, ref):
+        digest = self._digest(ref)
+        with self._lock:
+            return digest in self._memory or digest in self._on_disk
+
+    def data_url(self, ref):
+        data, mime_type = self.get(ref)
+        return f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}"
+
+    def resolve_message(self, message):
+        """
+        Devuelve el mensaje con las referencias a blobs sustituidas por data URLs.
+        Solo se copian las partes que cambian; el mensaje original no se modifica.
+        """
+        content = message.get("content")
+        if not isinstance(content, list):
+            return message
+        if not any(is_blob_ref(part.get("image_url", {}).get("url")) for part in content):
+            return message
+
+        resolved_content = []
+        for part in content:
+            url = part.get("image_url", {}).get("url")
+            if is_blob_ref(url):
+                part = dict(part, image_url=dict(part["image_url"], url=self.data_url(url)))
+            resolved_content.append(part)
+        return dict(message, content=resolved_content)
+
+    def resolve_messages(self, messages):
+        return [self.resolve_message(message) for message in messages]
+
+    def close(self):
+        if self._tempdir is not None:
+            self._tempdir.cleanup()
+
+    def _evict(self):
+        """Vuelca a disco los blobs menos usados hasta respetar el límite de memoria."""
+        while self._memory_bytes > self.memory_limit and len(self._memory) > 1:
+            digest, data = self._memory.popitem(last=False)
+            self._memory_bytes -= len(data)
+            if digest not in self._on_disk:
+                self._write(digest, data)
+
+    def _write(self, digest, data):
+        extension = mimetypes.guess_extension(self._mime_types.get(digest, "")) or ""
+        path = os.path.join(self.directory, digest + extension)
+        # Se escribe a un temporal y se renombra para no dejar archivos a medias
+        with open(path + ".tmp", "wb") as blob_file:
+            blob_file.write(data)
+        os.replace(path + ".tmp", path)
+        self._on_disk[digest] = path
+
+    @staticmethod
+    def _digest(ref):
+        if not is_blob_ref(ref):
+            raise KeyError(ref)
+        return ref[len(BLOB_URL_PREFIX):]
@@ -1,89 +1,493 @@
-# chat_display.py
-# Componente de la UI que muestra la conversación del chat.
-
-from PyQt5.QtWidgets import QLabel, QVBoxLayout, QWidget, QScrollArea
-from PyQt5.QtGui import QPixmap
-from PyQt5.QtCore import Qt, pyqtSignal
-
-# Importación local del visor de imágenes
-from image_viewer import ImageViewer
-
-class ClickableImageLabel(QLabel):
-    """Un QLabel que emite una señal 'clicked' cuando se hace clic en él."""
-    # La señal no necesita pasar datos, ya que los gestionaremos en la conexión.
-    clicked = pyqtSignal()
-
-    def __init__(self, pixmap, parent=None):
-        super().__init__(parent)
-        self.setPixmap(pixmap)
-        self.setCursor(Qt.PointingHandCursor) # Cambia el cursor para indicar que es clickeable
-
-    def mousePressEvent(self, event):
-        self.clicked.emit()
-
-class ChatDisplay(QScrollArea):
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.setWidgetResizable(True)
-        
-        self.content_widget = QWidget()
-        self.setWidget(self.content_widget)
-        
-        self.layout = QVBoxLayout(self.content_widget)
-        self.layout.setAlignment(Qt.AlignTop)
-
-    def add_message(self, role, content, image_path=None):
-        message_widget = QWidget()
-        message_layout = QVBoxLayout(message_widget)
-        message_layout.setContentsMargins(5, 5, 5, 5)
-
-        role_label = QLabel(f"<b>{role.capitalize()}:</b>")
-        message_layout.addWidget(role_label)
-
-        if image_path:
-            # 1. Se crea el QPixmap con la imagen original a resolución completa.
-            #    Esta es la variable que queremos mostrar en pantalla completa.
-            original_pixmap = QPixmap(image_path)
-            
-            if not original_pixmap.isNull():
-                # 2. Se crea una versión escalada (miniatura) solo para mostrarla en el chat.
-                thumbnail_pixmap = original_pixmap.scaled(200, 200, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-                image_label = ClickableImageLabel(thumbnail_pixmap)
-                
-                # 3. Se conecta la señal 'clicked' del label. Usamos una lambda para asegurarnos
-                #    de que se llama a 'show_full_screen_image' con el pixmap ORIGINAL, no la miniatura.
-                image_label.clicked.connect(lambda pix=original_pixmap: self.show_full_screen_image(pix))
-                
-                message_layout.addWidget(image_label)
-
-        if content:
-            content_label = QLabel(content)
-            content_label.setWordWrap(True)
-            message_layout.addWidget(content_label)
-
-        # Estilo diferencial para usuario y asistente
-        style = "border-radius: 5px; margin-bottom: 5px; padding: 8px;"
-        if role == "user":
-            message_widget.setStyleSheet(f"background-color: #2E3440; {style}")
-        else:
-            message_widget.setStyleSheet(f"background-color: #4C566A; {style}")
-
-        self.layout.addWidget(message_widget)
-        
-        # Auto-scroll hacia el final para ver el último mensaje
-        self.verticalScrollBar().setValue(self.verticalScrollBar().maximum())
-
-    def show_full_screen_image(self, pixmap_to_show):
-        """
-        Esta función recibe el QPixmap que debe mostrar y lo pasa al visor.
-        Gracias a la lambda, siempre será el pixmap original.
-        """
-        viewer = ImageViewer(pixmap_to_show, self)
-        viewer.exec_()
-
-    def clear_chat(self):
-        """Limpia todos los widgets del layout de forma segura."""
-        while self.layout.count():
-            child = self.layout.takeAt(0)
-            if child.widget():
-                child.widget().deleteLater()
\ No newline at end of file
+# chat_display.py
+# Componente de la UI que muestra la conversación del chat.
+#
+# La conversación se muestra con un modelo/vista: cada mensaje es una fila de un
+# modelo de lista y un delegado dibuja solo las filas visibles. No hay widgets
+# por mensaje, así que el coste de desplazarse o redimensionar no crece con la
+# longitud de la conversación.
+
+from PyQt5.QtWidgets import QListView, QAbstractItemView, QStyledItemDelegate
+from PyQt5.QtGui import QColor, QFont, QFontMetrics, QPainter
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, QRect, QSize, QTimer, pyqtSignal
+
+# Importación local del visor de imágenes
+from thumbnail_loader import ThumbnailLoader, thumbnail_size
+from markdown_renderer import RenderedMarkdown
+
+# Tamaño máximo de las miniaturas mostradas en el chat
+THUMBNAIL_SIZE = 200
+
+class ChatItem:
+    """Un mensaje de la conversación tal como lo muestra la vista."""
+    __slots__ = ("role", "content", "image_paths", "image_sizes", "size_cache", "tooltip", "streaming", "markdown")
+
+    def __init__(self, role, content, image_paths=(), image_sizes=()):
+        self.role = role
+        self.content = content
+        self.image_paths = list(image_paths)
+        # Tamaño de cada miniatura, conocido antes de decodificarla para reservar su hueco
+        self.image_sizes = list(image_sizes)
+        # (ancho, alto) de la última altura calculada; se invalida al cambiar el contenido
+        self.size_cache = None
+        # Texto emergente opcional (p. ej. las métricas de la petición que generó el mensaje)
+        self.tooltip = None
+        # True mientras el mensaje se recibe en streaming: su último bloque de Markdown sigue abierto
+        self.streaming = False
+        # Maquetación Markdown (RenderedMarkdown), creada al medir o pintar el mensaje por primera vez
+        self.markdown = None
+
+class ChatModel(QAbstractListModel):
+    """Modelo de lista con los mensajes de la conversación."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._items = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._items)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole:
+            return self._items[index.row()].content
+        if role == Qt.ToolTipRole:
+            return self._items[index.row()].tooltip
+        return None
+
+    def item(self, row):
+        return self._items[row]
+
+    def items(self):
+        return list(self._items)
+
+    def insert(self, row, item):
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._items.insert(row, item)
+        self.endInsertRows()
+        return row
+
+    def append(self, item):
+        return self.insert(len(self._items), item)
+
+    def insert_items(self, row, items):
+        """Inserta varias filas de una vez (p. ej. una página de mensajes antiguos)."""
+        if not items:
+            return
+        self.beginInsertRows(QModelIndex(), row, row + len(items) - 1)
+        self._items[row:row] = items
+        self.endInsertRows()
+
+    def remove(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self._items[row]
+        self.endRemoveRows()
+
+    def set_content(self, row, content):
+        item = self._items[row]
+        item.content = content
+        item.size_cache = None
+        index = self.index(row)
+        self.dataChanged.emit(index, index)
+
+    def set_tooltip(self, row, tooltip):
+        self._items[row].tooltip = tooltip
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [Qt.ToolTipRole])
+
+    def clear(self):
+        self.beginResetModel()
+        self._items = []
+        self.endResetModel()
+
+class MessageDelegate(QStyledItemDelegate):
+    """
+    Dibuja cada mensaje como una burbuja con el rol, la miniatura y el texto. Con un
+    'code_highlighter' las respuestas del asistente se muestran como Markdown.
+    """
+    MARGIN = 5
+    PADDING = 8
+    SPACING = 6
+    RADIUS = 5
+    USER_BACKGROUND = QColor("#2E3440")
+    ASSISTANT_BACKGROUND = QColor("#4C566A")
+    TEXT_COLOR = QColor("#ffffff")
+    PLACEHOLDER_COLOR = QColor("#3b4048")
+
+    def __init__(self, thumbnail_loader, code_highlighter=None, parent=None):
+        super().__init__(parent)
+        self.thumbnail_loader = thumbnail_loader
+        self.code_highlighter = code_highlighter
+
+    def sizeHint(self, option, index):
+        item = index.model().item(index.row())
+        width = self.parent().viewport().width()
+        if item.size_cache is None or item.size_cache[0] != width:
+            item.size_cache = (width, self._content_height(item, option.font, width))
+        return QSize(width, item.size_cache[1])
+
+    def paint(self, painter, option, index):
+        item = index.model().item(index.row())
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+
+        bubble = option.rect.adjusted(self.MARGIN, 0, -self.MARGIN, -self.MARGIN)
+        background = self.USER_BACKGROUND if item.role == "user" else self.ASSISTANT_BACKGROUND
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(background)
+        painter.drawRoundedRect(bubble, self.RADIUS, self.RADIUS)
+
+        inner = bubble.adjusted(self.PADDING, self.PADDING, -self.PADDING, -self.PADDING)
+        role_font = QFont(option.font)
+        role_font.setBold(True)
+        painter.setPen(self.TEXT_COLOR)
+        painter.setFont(role_font)
+        painter.drawText(inner, Qt.AlignLeft | Qt.AlignTop, f"{item.role.capitalize()}:")
+        y = inner.top() + QFontMetrics(role_font).height()
+
+        if item.image_paths:
+            y += self.SPACING
+            image_rects = self._image_rects(item, inner.left(), y, inner.width())
+            for image_path, image_rect in zip(item.image_paths, image_rects):
+                # Mientras la miniatura se decodifica en segundo plano se dibuja un hueco del mismo tamaño
+                thumbnail = self.thumbnail_loader.thumbnail(image_path, THUMBNAIL_SIZE)
+                if thumbnail is not None:
+                    painter.drawPixmap(image_rect.topLeft(), thumbnail)
+                else:
+                    painter.fillRect(image_rect, self.PLACEHOLDER_COLOR)
+            y = max(image_rect.bottom() + 1 for image_rect in image_rects)
+
+        if item.content:
+            y += self.SPACING
+            markdown = self._markdown(item, option.font)
+            if markdown is not None:
+                # Solo se dibujan los bloques visibles, aunque la respuesta tenga miles de líneas
+                visible = inner.intersected(self.parent().viewport().rect())
+                markdown.paint(painter, inner.left(), y, inner.width(), visible, self.TEXT_COLOR)
+            else:
+                painter.setFont(option.font)
+                painter.drawText(QRect(inner.left(), y, inner.width(), inner.bottom() - y + 1),
+                                 Qt.AlignLeft | Qt.AlignTop | Qt.TextWordWrap, item.content)
+        painter.restore()
+
+    def image_at(self, rect, item, font, pos):
+        """Ruta de la miniatura bajo 'pos' dentro de la fila 'rect', o None."""
+        if not item.image_paths:
+            return None
+        role_font = QFont(font)
+        role_font.setBold(True)
+        top = rect.top() + self.PADDING + QFontMetrics(role_font).height() + self.SPACING
+        left = rect.left() + self.MARGIN + self.PADDING
+        width = rect.width() - 2 * (self.MARGIN + self.PADDING)
+        for image_path, image_rect in zip(item.image_paths, self._image_rects(item, left, top, width)):
+            if image_rect.contains(pos):
+                return image_path
+        return None
+
+    def _image_rects(self, item, left, top, width):
+        """Coloca las miniaturas en filas de izquierda a derecha dentro de 'width'."""
+        rects = []
+        x, y, row_height = left, top, 0
+        for size in item.image_sizes:
+            if x > left and x + size.width() > left + width:
+                x, y, row_height = left, y + row_height + self.SPACING, 0
+            rects.append(QRect(x, y, size.width(), size.height()))
+            x += size.width() + self.SPACING
+            row_height = max(row_height, size.height())
+        return rects
+
+    def _content_height(self, item, font, width):
+        role_font = QFont(font)
+        role_font.setBold(True)
+        height = self.PADDING + QFontMetrics(role_font).height()
+        text_width = max(1, width - 2 * (self.MARGIN + self.PADDING))
+        if item.image_paths:
+            image_rects = self._image_rects(item, 0, 0, text_width)
+            height += self.SPACING + max(image_rect.bottom() + 1 for image_rect in image_rects)
+        if item.content:
+            markdown = self._markdown(item, font)
+            if markdown is not None:
+                height += self.SPACING + markdown.height(text_width)
+            else:
+                text_rect = QFontMetrics(font).boundingRect(QRect(0, 0, text_width, 1 << 24),
+                                                            Qt.AlignLeft | Qt.TextWordWrap, item.content)
+                height += self.SPACING + text_rect.height()
+        return height + self.PADDING + self.MARGIN
+
+    def _markdown(self, item, font):
+        """Maquetación Markdown del mensaje al día con su contenido, o None si se muestra como texto plano."""
+        if self.code_highlighter is None or item.role != "assistant":
+            return None
+        if item.markdown is None:
+            item.markdown = RenderedMarkdown(self.code_highlighter, font)
+        # Solo procesa lo añadido desde la última vez
+        item.markdown.update(item.content, final=not item.streaming)
+        return item.markdown
+
+class ChatDisplay(QListView):
+    # Intervalo mínimo entre repintados mientras llega una respuesta en streaming (~60 fps)
+    STREAM_FRAME_MS = 16
+
+    # El usuario ha llegado al principio de la conversación; se pueden cargar mensajes anteriores
+    older_messages_requested = pyqtSignal()
+
+    def __init__(self, thumbnail_loader=None, code_highlighter=None, parent=None):
+        """
+        Args:
+            code_highlighter: CodeHighlighter con el que mostrar las respuestas como
+                Markdown con resaltado de código; sin él se muestran como texto plano.
+        """
+        super().__init__(parent)
+        self.thumbnail_loader = thumbnail_loader or ThumbnailLoader(parent=self)
+        self.thumbnail_loader.thumbnail_ready.connect(self._on_thumbnail_ready)
+        self.code_highlighter = code_highlighter
+        if code_highlighter is not None:
+            code_highlighter.highlighted.connect(self._on_code_highlighted)
+
+        self.chat_model = ChatModel(self)
+        self.setModel(self.chat_model)
+        self.setItemDelegate(MessageDelegate(self.thumbnail_loader, code_highlighter, self))
+
+        self.setSelectionMode(QAbstractItemView.NoSelection)
+        self.setFocusPolicy(Qt.NoFocus)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.verticalScrollBar().setSingleStep(20)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        # Con la barra siempre visible el ancho útil no cambia al aparecer, evitando recalcular alturas
+        self.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOn)
+        self.setResizeMode(QListView.Adjust)
+        self.setUniformItemSizes(False)
+        # Las conversaciones largas se maquetan por lotes para no bloquear la interfaz
+        self.setLayoutMode(QListView.Batched)
+        self.setBatchSize(200)
+        self.setMouseTracking(True)
+
+        # Se sigue el final de la conversación mientras el usuario no se desplace hacia arriba
+        self._stick_to_bottom = True
+        # Al insertar mensajes por arriba se conserva la distancia al final para que no salte la vista
+        self._keep_distance = None
+        self._adjusting_scroll = False
+        self.verticalScrollBar().rangeChanged.connect(self._on_range_changed)
+        self.verticalScrollBar().valueChanged.connect(self._on_scrolled)
+
+        # Estado del mensaje que se está recibiendo en streaming
+        self._stream_row = None
+        self._stream_text = ""
+        self._pending_deltas = []
+
+        # Los fragmentos se acumulan y se vuelcan al modelo una vez por frame,
+        # en lugar de repintar con cada token recibido.
+        self._stream_timer = QTimer(self)
+        self._stream_timer.setSingleShot(True)
+        self._stream_timer.setInterval(self.STREAM_FRAME_MS)
+        self._stream_timer.timeout.connect(self._flush_stream)
+
+    def add_message(self, role, content, image_paths=()):
+        # Auto-scroll hacia el final para ver el último mensaje
+        self._stick_to_bottom = True
+        self._keep_distance = None
+        self.chat_model.append(self._make_item(role, content, image_paths))
+
+    def prepend_messages(self, messages):
+        """
+        Inserta al principio mensajes más antiguos, dados como [(rol, contenido, imágenes)]
+        del más antiguo al más reciente, sin mover lo que el usuario está viendo.
+        """
+        if not messages:
+            return
+        scrollbar = self.verticalScrollBar()
+        if not self._stick_to_bottom:
+            self._keep_distance = scrollbar.maximum() - scrollbar.value()
+        self.chat_model.insert_items(0, [self._make_item(*message) for message in messages])
+        if self._stream_row is not None:
+            self._stream_row += len(messages)
+
+    @staticmethod
+    def _make_item(role, content, image_paths=()):
+        shown_paths, image_sizes = [], []
+        for image_path in image_paths:
+            # Solo se lee la cabecera; la miniatura se decodifica en segundo plano al pintarse
+            image_size = thumbnail_size(image_path, THUMBNAIL_SIZE)
+            if image_size.isValid():
+                shown_paths.append(image_path)
+                image_sizes.append(image_size)
+        return ChatItem(role, content, shown_paths, image_sizes)
+
+    def begin_stream_message(self, role, row=None):
+        """
+        Crea una burbuja vacía que irá creciendo con los fragmentos recibidos.
+
+        Args:
+            row: Posición en la que insertarla; por defecto, al final. Permite colocar
+                la respuesta antes de los mensajes del usuario que siguen en cola.
+        """
+        self._stream_text = ""
+        self._pending_deltas = []
+        self._stick_to_bottom = True
+        self._keep_distance = None
+        if row is None:
+            row = self.chat_model.rowCount()
+        item = ChatItem(role, "")
+        item.streaming = True
+        self._stream_row = self.chat_model.insert(row, item)
+
+    def append_stream_delta(self, delta):
+        """Encola un fragmento de texto; el repintado se agrupa en el siguiente frame."""
+        if self._stream_row is None:
+            return
+        self._pending_deltas.append(delta)
+        if not self._stream_timer.isActive():
+            self._stream_timer.start()
+
+    def end_stream_message(self, final_text, tooltip=None):
+        """
+        Cierra la burbuja en streaming con el texto definitivo y, opcionalmente, un texto emergente.
+        Si la respuesta quedó vacía (p. ej. se detuvo antes del primer token) se elimina la burbuja.
+        """
+        if self._stream_row is None:
+            return
+        self._stream_timer.stop()
+        self._pending_deltas = []
+        self.chat_model.item(self._stream_row).streaming = False
+        if final_text:
+            self._stream_text = final_text
+            self._set_row_content(self._stream_row, final_text)
+            if tooltip:
+                self.chat_model.set_tooltip(self._stream_row, tooltip)
+        else:
+            self.chat_model.remove(self._stream_row)
+        self._stream_row = None
+
+    def _flush_stream(self):
+        if self._stream_row is None or not self._pending_deltas:
+            return
+        self._stream_text += "".join(self._pending_deltas)
+        self._pending_deltas = []
+        self._set_row_content(self._stream_row, self._stream_text)
+
+    def _set_row_content(self, row, content):
+        self.chat_model.set_content(row, content)
+        # La altura de la fila ha cambiado; la vista debe recolocar las filas siguientes
+        self.scheduleDelayedItemsLayout()
+
+    def _on_thumbnail_ready(self, _image_path, size):
+        if size == THUMBNAIL_SIZE:
+            self.viewport().update()
+
+    def _on_code_highlighted(self, key):
+        highlighted = self.code_highlighter.highlight_cached(key)
+        if highlighted is None:
+            return
+        changed = False
+        for item in self.chat_model.items():
+            if item.markdown is not None and item.markdown.apply_highlight(key, highlighted):
+                # El bloque resaltado puede ocupar una altura distinta
+                item.size_cache = None
+                changed = True
+        if changed:
+            self.scheduleDelayedItemsLayout()
+            self.viewport().update()
+
+    def _on_range_changed(self, _minimum, maximum):
+        if self._stick_to_bottom:
+            self.verticalScrollBar().setValue(maximum)
+        elif self._keep_distance is not None:
+            self._adjusting_scroll = True
+            self.verticalScrollBar().setValue(maximum - self._keep_distance)
+            self._adjusting_scroll = False
+
+    def _on_scrolled(self, value):
+        if self._adjusting_scroll:
+            return
+        self._keep_distance = None
+        scrollbar = self.verticalScrollBar()
+        self._stick_to_bottom = value >= scrollbar.maximum() - 4
+        if value == scrollbar.minimum() and scrollbar.maximum() > 0:
+            self.older_messages_requested.emit()
+
+    def wheelEvent(self, event):
+        # Si la conversación cabe entera en pantalla no hay desplazamiento que avise de que se llegó arriba
+        scrollbar = self.verticalScrollBar()
+        if event.angleDelta().y() > 0 and scrollbar.value() == scrollbar.minimum():
+            self.older_messages_requested.emit()
+        super().wheelEvent(event)
+
+    def _item_at(self, pos):
+        """Devuelve (índice, ChatItem) bajo la posición, o (None, None)."""
+        index = self.indexAt(pos)
+        if not index.isValid():
+            return None, None
+        return index, self.chat_model.item(index.row())
+
+    def _image_at(self, pos):
+        index, item = self._item_at(pos)
+        if item is None:
+            return None
+        return self.itemDelegate().image_at(self.visualRect(index), item, self.font(), pos)
+
+    def mouseMoveEvent(self, event):
+        # Cambia el cursor para indicar que las miniaturas son clickeables
+        if self._image_at(event.pos()):
+            self.viewport().setCursor(Qt.PointingHandCursor)
+        else:
+            self.viewport().unsetCursor()
+        super().mouseMoveEvent(event)
+
+    def mousePressEvent(self, event):
+        image_path = self._image_at(event.pos())
+        if image_path:
+            self.show_full_screen_image(image_path)
+            return
+        super().mousePressEvent(event)
+
+    def show_full_screen_image(self, image_path):
+        """Abre el visor, que decodifica la imagen original al abrirse y la libera al cerrarse."""
+        # El visor se importa la primera vez que se usa, no al arrancar
+        from image_viewer import ImageViewer
+        viewer = ImageViewer(image_path, self)
+        viewer.exec_()
+
+    def message_count(self):
+        return self.chat_model.rowCount()
+
+    def remove_message(self, row):
+        self.chat_model.remove(row)
+
+    def items(self):
+        """Devuelve los mensajes mostrados, p. ej. para reconstruir la vista más tarde con set_items."""
+        return self.chat_model.items()
+
+    def take_items(self):
+        """Como items(), pero descartando su maquetación Markdown, que se rehace al volver a mostrarlos."""
+        items = self.chat_model.items()
+        for item in items:
+            item.markdown = None
+        return items
+
+    def set_items(self, items):
+        """Sustituye la conversación por 'items' (ChatItem) y se coloca al final."""
+        self.clear_chat()
+        for item in items:
+            # El ancho de la vista puede haber cambiado desde que se calcularon las alturas
+            item.size_cache = None
+        self.chat_model.insert_items(0, items)
+
+    def rendered_bytes(self):
+        """Estimación de la memoria que ocupa la vista: textos maquetados y miniaturas decodificadas."""
+        total = 0
+        for item in self.chat_model.items():
+            total += 2 * len(item.content) + 256
+            if item.markdown is not None:
+                total += item.markdown.memory_bytes()
+            for image_size in item.image_sizes:
+                total += image_size.width() * image_size.height() * 4
+        return total
+
+    def clear_chat(self):
+        """Vacía la conversación."""
+        self._stream_timer.stop()
+        self._stream_row = None
+        self._pending_deltas = []
+        self._stick_to_bottom = True
+        self._keep_distance = None
+        self.chat_model.clear()
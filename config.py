@@ -1,4 +1,114 @@
-# config.py
-# Contiene la configuración de la dirección de la API, que puede ser modificada.
-
-API_BASE_URL = "http://localhost:1234/v1"
\ No newline at end of file
+# config.py
+# Contiene la configuración de la dirección de la API, que puede ser modificada.
+
+API_BASE_URL = "http://localhost:1234/v1"
+
+# Si es True, las respuestas se reciben en streaming y se muestran a medida que se generan.
+STREAM_RESPONSES = True
+
+# Transporte HTTP: tiempos máximos (segundos) para conectar y para esperar datos del servidor.
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 120
+# Reintentos ante errores transitorios (conexión reiniciada, 503 mientras se carga un modelo).
+MAX_RETRIES = 3
+# Conexiones keep-alive que se mantienen abiertas con el servidor.
+HTTP_POOL_SIZE = 4
+# Abre una conexión al arrancar y al cambiar la URL para que el primer mensaje no la espere.
+WARM_UP_CONNECTION = True
+
+# Hilos persistentes que atienden las peticiones a la API.
+REQUEST_WORKERS = 2
+
+# Preprocesado de imágenes antes de enviarlas: lado mayor máximo y número máximo de píxeles
+# (0 = sin límite) y calidad JPEG al recodificar.
+IMAGE_MAX_EDGE = 1536
+IMAGE_MAX_PIXELS = 0
+IMAGE_JPEG_QUALITY = 85
+IMAGE_WORKERS = 2
+
+# Imágenes preparadas que se mantienen en memoria (MB); el resto se vuelca a disco.
+# Si BLOB_DIRECTORY está vacío se usa un directorio temporal que se borra al salir.
+BLOB_CACHE_MB = 64
+BLOB_DIRECTORY = ""
+
+# Memoria máxima (MB) para las miniaturas decodificadas del chat y de la vista previa.
+THUMBNAIL_CACHE_MB = 32
+
+# Gestión del contexto. CONTEXT_WINDOW_TOKENS es el contexto cargado en LM Studio (0 = no recortar)
+# y MAX_RESPONSE_TOKENS lo que se reserva para la respuesta. Al superarse, se recorta por bloques
+# de CONTEXT_TRIM_CHUNK_TOKENS para que el prefijo enviado no cambie en cada turno.
+# CONTEXT_TRIM_POLICY: "drop_images_first" (quita antes las imágenes antiguas) o "drop_oldest".
+MAX_RESPONSE_TOKENS = 2048
+CONTEXT_WINDOW_TOKENS = 8192
+CONTEXT_TRIM_CHUNK_TOKENS = 1024
+CONTEXT_TRIM_POLICY = "drop_images_first"
+CONTEXT_IMAGE_TOKENS = 768
+# Ruta opcional a un tokenizer.json (requiere 'pip install tokenizers') para contar tokens exactos.
+TOKENIZER_PATH = ""
+
+# Métricas por petición (tiempos, bytes y tokens) en la barra de estado y en cada respuesta.
+# Con METRICS_LOG_PATH se añaden además como líneas JSON a un archivo que rota al llegar a
+# METRICS_LOG_MAX_MB, conservando METRICS_LOG_BACKUPS copias ("" = no guardar).
+METRICS_ENABLED = True
+METRICS_LOG_PATH = "metrics.jsonl"
+METRICS_LOG_MAX_MB = 5
+METRICS_LOG_BACKUPS = 3
+
+# Conversaciones guardadas en disco ("" = no guardar). En SESSION_DIRECTORY se crea la base de
+# datos de sesiones y, si BLOB_DIRECTORY está vacío, también las imágenes, una vez por contenido.
+# Al reabrir una sesión se muestran sus últimos SESSION_PAGE_SIZE mensajes y los anteriores se
+# cargan al desplazarse hacia arriba.
+SESSION_DIRECTORY = "sessions"
+SESSION_PAGE_SIZE = 50
+SESSION_RESTORE_LAST = True
+
+# Parámetros de muestreo que se añaden a cada petición, p. ej. {"temperature": 0, "seed": 42}.
+# Vacío = los valores por defecto del modelo cargado en LM Studio.
+SAMPLING_PARAMS = {}
+
+# Caché de respuestas para peticiones repetidas. Solo se usa con muestreo determinista
+# (temperature 0 o seed fija) salvo que RESPONSE_CACHE_FORCE sea True. Las entradas que llevan
+# más de RESPONSE_CACHE_MAX_DAYS días o que exceden RESPONSE_CACHE_MB se expulsan (LRU).
+RESPONSE_CACHE_ENABLED = False
+RESPONSE_CACHE_PATH = "response_cache.sqlite3"
+RESPONSE_CACHE_MB = 64
+RESPONSE_CACHE_MAX_DAYS = 30
+RESPONSE_CACHE_FORCE = False
+
+# Varios servidores de LM Studio entre los que repartir las peticiones, p. ej.
+# [{"url": "http://192.168.1.10:1234/v1", "weight": 2}, {"url": "http://192.168.1.11:1234/v1"}].
+# Vacío = solo API_BASE_URL. ENDPOINT_ROUTING: "least_loaded" (menos peticiones en curso en
+# proporción al peso) o "lowest_latency" (menor latencia medida). Cada ENDPOINT_PROBE_INTERVAL
+# segundos se comprueba /models en todos los servidores.
+API_ENDPOINTS = []
+ENDPOINT_ROUTING = "least_loaded"
+ENDPOINT_PROBE_INTERVAL = 15
+ENDPOINT_PROBE_TIMEOUT = 3
+
+# Precalentado: tras PREWARM_DEBOUNCE_MS sin teclear se envía el historial con el borrador pidiendo
+# un solo token, para que el servidor tenga el prefijo en su caché de prompt al pulsar Enviar.
+# Como mucho uno cada PREWARM_MIN_INTERVAL segundos.
+PREWARM_ENABLED = False
+PREWARM_DEBOUNCE_MS = 800
+PREWARM_MIN_INTERVAL = 5
+
+# Pestañas: las que están en segundo plano liberan su vista (burbujas y miniaturas), empezando
+# por la que lleva más tiempo oculta, cuando entre todas superan TAB_MEMORY_BUDGET_MB. Se
+# reconstruyen al volver a ellas. REQUEST_WORKERS limita las peticiones simultáneas de todas.
+TAB_MEMORY_BUDGET_MB = 64
+
+# Las respuestas del asistente se muestran como Markdown. Los bloques de código se colorean
+# en segundo plano si está instalado pygments (CODE_HIGHLIGHT_STYLE es un estilo de pygments).
+MARKDOWN_ENABLED = True
+CODE_HIGHLIGHT_STYLE = "monokai"
+CODE_HIGHLIGHT_CACHE_MB = 4
+
+# Búsqueda semántica en las sesiones guardadas (necesita SESSION_DIRECTORY y un modelo de
+# embeddings cargado en LM Studio). Los mensajes se indexan en segundo plano por lotes de
+# EMBEDDING_BATCH_SIZE con /v1/embeddings; de cada uno se usan EMBEDDING_MAX_CHARS caracteres.
+# Con NumPy instalado la búsqueda es vectorizada; sin él solo es práctica con pocos mensajes.
+SEMANTIC_SEARCH_ENABLED = False
+EMBEDDING_MODEL = "text-embedding-nomic-embed-text-v1.5"
+EMBEDDING_BATCH_SIZE = 32
+EMBEDDING_MAX_CHARS = 2000
+SEMANTIC_SEARCH_RESULTS = 20
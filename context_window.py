@@ -0,0 +1,155 @@
+# context_window.py
+# Ajusta el historial al presupuesto de tokens del modelo antes de cada petición.
+
+# Texto que sustituye a las imágenes retiradas de los mensajes antiguos
+IMAGE_PLACEHOLDER = "[imagen omitida]"
+
+POLICY_DROP_OLDEST = "drop_oldest"
+POLICY_DROP_IMAGES_FIRST = "drop_images_first"
+
+def estimate_tokens(text):
+    """Estimación rápida: unos 4 caracteres por token en textos en inglés y español."""
+    return (len(text) + 3) // 4
+
+def load_tokenizer(path):
+    """
+    Carga un tokenizador exacto desde un tokenizer.json de Hugging Face. Devuelve una
+    función texto -> número de tokens, o None si no hay ruta o la librería
+    'tokenizers' no está instalada.
+    """
+    if not path:
+        return None
+    try:
+        from tokenizers import Tokenizer
+    except ImportError:
+        return None
+    tokenizer = Tokenizer.from_file(path)
+    return lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+class ContextWindow:
+    """
+    Decide qué parte del historial se envía en cada turno para no superar el contexto.
+
+    El recorte se hace por bloques y es "pegajoso": cuando el historial no cabe se
+    descarta de una vez bastante más de lo estrictamente necesario
+    ('trim_chunk_tokens'), y en los turnos siguientes se mantiene el mismo punto de
+    corte hasta que vuelve a no caber. Así el prefijo enviado es idéntico byte a
+    byte entre turnos y LM Studio puede reutilizar su caché de prompt en lugar de
+    volver a procesarlo entero.
+
+    Se usa una instancia por conversación; el historial solo debe crecer por el final.
+    """
+
+    def __init__(self, max_context_tokens=8192, max_response_tokens=2048, trim_chunk_tokens=1024,
+                 policy=POLICY_DROP_IMAGES_FIRST, image_tokens=768, tokenizer=None):
+        """
+        Args:
+            max_context_tokens: Tamaño del contexto del modelo. 0 desactiva el recorte.
+            max_response_tokens: Tokens reservados para la respuesta.
+            trim_chunk_tokens: Margen adicional que se libera en cada recorte.
+            policy: POLICY_DROP_OLDEST o POLICY_DROP_IMAGES_FIRST.
+            image_tokens: Coste estimado de cada imagen.
+            tokenizer: Función opcional texto -> tokens exactos; por defecto se estima.
+        """
+        self.max_context_tokens = max_context_tokens
+        self.max_response_tokens = max_response_tokens
+        self.trim_chunk_tokens = trim_chunk_tokens
+        self.policy = policy
+        self.image_tokens = image_tokens
+        self.count_tokens = tokenizer or estimate_tokens
+
+        # Índice del primer mensaje enviado y de los que conservan sus imágenes
+        self.start = 0
+        self.image_cutoff = 0
+        # Cachés por identidad del mensaje; guardan el propio mensaje para que su id() no se reutilice
+        self._token_counts = {}
+        self._stripped = {}
+
+    @property
+    def budget(self):
+        return self.max_context_tokens - self.max_response_tokens
+
+    def reset(self):
+        self.start = 0
+        self.image_cutoff = 0
+        self._token_counts.clear()
+        self._stripped.clear()
+
+    def fit(self, history):
+        """Devuelve la lista de mensajes a enviar para el historial actual."""
+        if self.max_context_tokens <= 0 or not history:
+            return list(history)
+        if self.start >= len(history):
+            # El historial se ha vaciado o sustituido desde el último turno
+            self.reset()
+
+        total = sum(self._tokens(self._visible(history, index)) for index in range(self.start, len(history)))
+        if total > self.budget:
+            target = max(0, self.budget - self.trim_chunk_tokens)
+            if self.policy == POLICY_DROP_IMAGES_FIRST:
+                total = self._strip_images(history, total, target)
+            if total > target:
+                self._drop_oldest(history, total, target)
+
+        return [self._visible(history, index) for index in range(self.start, len(history))]
+
+    def _strip_images(self, history, total, target):
+        """Sustituye las imágenes de los mensajes más antiguos por un texto corto."""
+        last = len(history) - 1
+        index = max(self.image_cutoff, self.start)
+        while total > target and index < last:
+            total -= self._tokens(history[index]) - self._tokens(self._without_images(history[index]))
+            index += 1
+        self.image_cutoff = max(self.image_cutoff, index)
+        return total
+
+    def _drop_oldest(self, history, total, target):
+        """Descarta mensajes del principio; el mensaje nuevo siempre se conserva."""
+        last = len(history) - 1
+        start = self.start
+        while total > target and start < last:
+            total -= self._tokens(self._visible(history, start))
+            start += 1
+        # La conversación enviada debe empezar por un mensaje del usuario
+        while start < last and history[start].get("role") != "user":
+            start += 1
+
+        for message in history[self.start:start]:
+            self._token_counts.pop(id(message), None)
+            self._stripped.pop(id(message), None)
+        self.start = start
+
+    def _visible(self, history, index):
+        message = history[index]
+        return self._without_images(message) if index < self.image_cutoff else message
+
+    def _without_images(self, message):
+        content = message.get("content")
+        if not isinstance(content, list) or not any(part.get("type") == "image_url" for part in content):
+            return message
+
+        entry = self._stripped.get(id(message))
+        if entry is None or entry[0] is not message:
+            parts = [part if part.get("type") != "image_url" else {"type": "text", "text": IMAGE_PLACEHOLDER}
+                     for part in content]
+            entry = (message, dict(message, content=parts))
+            self._stripped[id(message)] = entry
+        return entry[1]
+
+    def _tokens(self, message):
+        entry = self._token_counts.get(id(message))
+        if entry is not None and entry[0] is message:
+            return entry[1]
+
+        content = message.get("content")
+        tokens = 4  # Separadores de rol y turno de la plantilla de chat
+        if isinstance(content, str):
+            tokens += self.count_tokens(content)
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    tokens += self.count_tokens(part.get("text", ""))
+                elif part.get("type") == "image_url":
+                    tokens += self.image_tokens
+        self._token_counts[id(message)] = (message, tokens)
+        return tokens
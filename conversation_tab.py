@@ -0,0 +1,436 @@
+# conversation_tab.py
+# Una conversación dentro de la ventana principal: su historial, su sesión guardada
+# y su vista del chat. Los servicios (ejecutor de peticiones, imágenes, sesiones...)
+# son de la ventana y se comparten entre todas las pestañas.
+
+import sqlite3
+import time
+from collections import deque
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QMessageBox
+from PyQt5.QtCore import QTimer, pyqtSignal
+
+import config
+from blob_store import is_blob_ref
+from chat_display import ChatDisplay
+from context_window import ContextWindow, estimate_tokens
+from request_executor import PRIORITY_FOREGROUND, PRIORITY_BACKGROUND
+from request_metrics import RequestMetrics
+from session_store import message_text, message_images, TITLE_LENGTH
+
+class ConversationTab(QWidget):
+    """
+    Estado y vista de una conversación.
+
+    Mientras la pestaña está en segundo plano su vista puede liberarse
+    (release_view) para no acumular memoria con muchas pestañas abiertas; los
+    mensajes mostrados se conservan y la vista se reconstruye al volver a ella.
+    """
+    # Nuevo título de la pestaña (el comienzo del primer mensaje)
+    title_changed = pyqtSignal(str)
+    # La pestaña empezó o terminó de esperar una respuesta
+    busy_changed = pyqtSignal(bool)
+    # Se guardó un mensaje en la base de datos de sesiones
+    message_saved = pyqtSignal()
+
+    DEFAULT_TITLE = "Nueva conversación"
+
+    def __init__(self, main_window, tokenizer=None, parent=None):
+        super().__init__(parent)
+        self.main_window = main_window
+        self.title = self.DEFAULT_TITLE
+        self.foreground = False
+        # Instante en que la pestaña dejó de estar visible; las más antiguas se liberan antes
+        self.last_visible = time.monotonic()
+
+        self.history = []
+        self.raw_history = []
+        # Mensajes escritos mientras se generaba una respuesta; se envían en orden al terminar
+        self.pending_messages = deque()
+        # Mensajes cuyas imágenes no se pudieron preparar: (texto, rutas, error). Se devuelven
+        # al área de entrada cuando la pestaña está (o vuelve a estar) en primer plano
+        self._failed_messages = []
+        # Evita que _dispatch_next_message se ejecute dentro de sí mismo
+        self._dispatching = False
+        self.active_request_id = None
+        # Métricas de la petición en curso; se adjuntan como texto emergente a su respuesta
+        self.active_metrics = None
+
+        # Sesión guardada en disco a la que se van añadiendo los mensajes; se crea con el primero
+        self.session_id = None
+        # Mensaje más antiguo mostrado de una sesión reabierta y si quedan otros anteriores
+        self._oldest_loaded_id = None
+        self._has_older = False
+
+        # Decide qué parte del historial cabe en el contexto del modelo en cada turno
+        self.context_window = ContextWindow(
+            max_context_tokens=config.CONTEXT_WINDOW_TOKENS,
+            max_response_tokens=config.MAX_RESPONSE_TOKENS,
+            trim_chunk_tokens=config.CONTEXT_TRIM_CHUNK_TOKENS,
+            policy=config.CONTEXT_TRIM_POLICY,
+            image_tokens=config.CONTEXT_IMAGE_TOKENS,
+            tokenizer=tokenizer,
+        )
+
+        self._layout = QVBoxLayout(self)
+        self._layout.setContentsMargins(0, 0, 0, 0)
+        self.chat_display = None
+        # Mensajes de la vista liberada, pendientes de volver a mostrarse
+        self._stored_items = []
+        self.ensure_view()
+
+        executor = self.main_window.executor
+        executor.delta_received.connect(self.handle_delta)
+        executor.response_received.connect(self.handle_response)
+        executor.error_occurred.connect(self.handle_error)
+        executor.request_cancelled.connect(self.handle_cancelled)
+        executor.metrics_ready.connect(self.handle_metrics)
+
+    # --- Vista -------------------------------------------------------------
+
+    def ensure_view(self):
+        """Crea la vista del chat si se había liberado, con los mensajes que mostraba."""
+        if self.chat_display is not None:
+            return
+        self.chat_display = ChatDisplay(self.main_window.thumbnail_loader, self.main_window.code_highlighter)
+        self.chat_display.older_messages_requested.connect(self.load_older_messages)
+        self.chat_display.set_items(self._stored_items)
+        self._stored_items = []
+        self._layout.addWidget(self.chat_display)
+
+    def release_view(self):
+        """
+        Destruye la vista del chat y suelta las miniaturas que solo ella usaba. No se
+        libera mientras hay una respuesta en curso, que necesita la vista para mostrarse.
+        """
+        if self.chat_display is None or self.is_busy():
+            return False
+        self._stored_items = self.chat_display.take_items()
+        # La caché de miniaturas es de toda la ventana: se conservan las que otros muestran
+        image_paths = {image_path for item in self._stored_items for image_path in item.image_paths}
+        self.main_window.thumbnail_loader.release(image_paths - self.main_window.image_paths_in_use(self))
+        self._layout.removeWidget(self.chat_display)
+        self.chat_display.deleteLater()
+        self.chat_display = None
+        return True
+
+    def set_tokenizer(self, tokenizer):
+        """Sustituye el contador de tokens (el tokenizador se carga después de abrir la ventana)."""
+        self.context_window.count_tokens = tokenizer or estimate_tokens
+
+    def displayed_image_paths(self):
+        """Rutas de las imágenes de los mensajes de la vista, o un conjunto vacío si está liberada."""
+        if self.chat_display is None:
+            return set()
+        return {image_path for item in self.chat_display.items() for image_path in item.image_paths}
+
+    def rendered_bytes(self):
+        return self.chat_display.rendered_bytes() if self.chat_display is not None else 0
+
+    def set_foreground(self, foreground):
+        """Marca la pestaña como visible o no y ajusta la prioridad de su petición en espera."""
+        self.foreground = foreground
+        if foreground:
+            self.ensure_view()
+            if self._failed_messages:
+                QTimer.singleShot(0, self._return_failed_messages)
+        else:
+            self.last_visible = time.monotonic()
+        if self.active_request_id is not None:
+            self.main_window.executor.set_priority(self.active_request_id, self._priority())
+
+    def is_busy(self):
+        return self.active_request_id is not None or bool(self.pending_messages)
+
+    def _priority(self):
+        return PRIORITY_FOREGROUND if self.foreground else PRIORITY_BACKGROUND
+
+    # --- Envío ---------------------------------------------------------------
+
+    def send_message(self, text, image_paths=()):
+        image_paths = list(image_paths)
+        for image_path in image_paths:
+            # Normalmente ya se están preparando desde que se adjuntaron; submit() no repite el trabajo
+            self.main_window.image_preprocessor.submit(image_path)
+        self.chat_display.add_message("user", text, image_paths)
+        if self.title == self.DEFAULT_TITLE and text:
+            self._set_title(text)
+
+        # Si hay una respuesta en curso, el mensaje espera su turno para incluirla en el contexto
+        self.pending_messages.append((text, image_paths))
+        if self.active_request_id is None:
+            self._dispatch_next_message()
+
+    def _dispatch_next_message(self):
+        """Envía el siguiente mensaje en cola, si lo hay y todas sus imágenes ya están preparadas."""
+        if self._dispatching:
+            return
+        self._dispatching = True
+        try:
+            self._dispatch_pending()
+        finally:
+            self._dispatching = False
+
+    def _dispatch_pending(self):
+        image_preprocessor = self.main_window.image_preprocessor
+        while self.pending_messages:
+            text, image_paths = self.pending_messages[0]
+            # Si alguna imagen aún se está procesando, se reintenta al recibir 'image_ready'
+            if not all(image_preprocessor.is_ready(image_path) for image_path in image_paths):
+                return
+            self.pending_messages.popleft()
+            # Las imágenes se preparan en paralelo: cuenta la que más tardó
+            encode_s = max((image_preprocessor.duration(image_path) for image_path in image_paths), default=0.0)
+            try:
+                user_message = self._build_user_message(text, image_paths)
+            except (OSError, ValueError) as e:
+                self._discard_failed_message(text, image_paths, e)
+                continue
+            break
+        else:
+            return
+
+        self.history.append(user_message)
+        self.raw_history.append({"sent": user_message})
+        self._save_message(user_message)
+
+        # Los mensajes aún en cola son las últimas burbujas; la respuesta se coloca justo antes
+        self.ensure_view()
+        response_row = self.chat_display.message_count() - len(self.pending_messages)
+        self.chat_display.begin_stream_message("assistant", response_row)
+        stream = self.main_window.settings_panel.stream_checkbox.isChecked()
+        # El precalentado pendiente ya no sirve y no debe competir con la petición real
+        prewarmer = self.main_window.prewarmer
+        prewarmed = prewarmer.consume() if prewarmer is not None and self.foreground else False
+        metrics = None
+        if config.METRICS_ENABLED:
+            metrics = RequestMetrics(stream)
+            metrics.encode_s = encode_s
+            metrics.prewarmed = prewarmed
+        self.active_request_id = self.main_window.executor.submit(
+            self.context_window.fit(self.history), stream=stream, metrics=metrics, priority=self._priority())
+        self.busy_changed.emit(True)
+
+    def _build_user_message(self, text, image_paths):
+        user_content = []
+        if text:
+            user_content.append({"type": "text", "text": text})
+        image_preprocessor = self.main_window.image_preprocessor
+        try:
+            image_refs = [image_preprocessor.result(image_path) for image_path in image_paths]
+        finally:
+            # Se olvidan las rutas para que un reenvío vuelva a leer los archivos (la caché por hash evita recodificar)
+            for image_path in image_paths:
+                image_preprocessor.discard(image_path)
+        for image_ref in image_refs:
+            user_content.append({
+                "type": "image_url",
+                "image_url": {"url": image_ref}
+            })
+        return {"role": "user", "content": user_content}
+
+    def draft_messages(self, text):
+        """Mensajes que se enviarían si el borrador 'text' se mandara ahora (para el precalentado)."""
+        # El borrador tiene la misma forma que tendrá el mensaje real, así el prefijo coincide
+        draft = {"role": "user", "content": [{"type": "text", "text": text}]}
+        return self.context_window.fit(self.history) + [draft]
+
+    def _discard_failed_message(self, text, image_paths, error):
+        """
+        Quita la burbuja de un mensaje que se acaba de sacar de la cola sin enviarlo y lo
+        guarda para devolverlo al área de entrada. Eso y el aviso se hacen fuera del
+        envío: el cuadro de diálogo abre su propio bucle de eventos.
+        """
+        self.ensure_view()
+        # Los mensajes aún en cola son las últimas burbujas; el descartado va justo antes
+        self.chat_display.remove_message(self.chat_display.message_count() - len(self.pending_messages) - 1)
+        if not self._failed_messages:
+            QTimer.singleShot(0, self._return_failed_messages)
+        self._failed_messages.append((text, image_paths, error))
+
+    def _return_failed_messages(self):
+        """
+        Devuelve al área de entrada el texto y las imágenes de los mensajes que no se
+        pudieron enviar, para corregirlos; lo que ya hubiera escrito va detrás. El área
+        de entrada es de la pestaña visible: en segundo plano esperan a que se muestre.
+        """
+        if not self.foreground or not self._failed_messages:
+            return
+        failed, self._failed_messages = self._failed_messages, []
+        input_area = self.main_window.input_area
+        draft = input_area.text_input.toPlainText().strip()
+        texts = [text for text, _image_paths, _error in failed] + [draft]
+        input_area.text_input.setPlainText("\n\n".join(text for text in texts if text))
+        for _text, image_paths, _error in failed:
+            input_area.add_images(image_paths)
+        errors = "\n".join(str(error) for _text, _image_paths, error in failed)
+        QMessageBox.critical(self, "Error de Imagen", f"No se pudo preparar la imagen: {errors}")
+
+    def on_image_ready(self):
+        if self.active_request_id is None and self.pending_messages:
+            self._dispatch_next_message()
+
+    def stop_generation(self):
+        """Detiene la respuesta en curso; en streaming se conserva el texto recibido hasta ahora."""
+        if self.active_request_id is not None:
+            self.main_window.executor.cancel(self.active_request_id)
+
+    # --- Resultados del ejecutor ----------------------------------------------
+
+    def handle_delta(self, request_id, delta):
+        if request_id == self.active_request_id:
+            self.chat_display.append_stream_delta(delta)
+
+    def handle_metrics(self, request_id, metrics):
+        if request_id != self.active_request_id:
+            return
+        self.active_metrics = metrics
+        if self.foreground:
+            self.main_window.show_request_metrics(metrics)
+
+    def handle_response(self, request_id, response_text):
+        if request_id != self.active_request_id:
+            return
+        tooltip = self.active_metrics.tooltip() if self.active_metrics is not None else None
+        self.chat_display.end_stream_message(response_text, tooltip)
+
+        # Una generación detenida antes del primer token no deja mensaje en el historial
+        if response_text:
+            assistant_message = {"role": "assistant", "content": response_text}
+            self.history.append(assistant_message)
+            if self.raw_history:
+                self.raw_history[-1]["received"] = assistant_message
+            self._save_message(assistant_message)
+        self._finish_request()
+
+    def handle_error(self, request_id, error_message):
+        if request_id != self.active_request_id:
+            return
+        self.chat_display.end_stream_message("")
+        self._finish_request()
+        QMessageBox.critical(self, "Error de API", error_message)
+
+    def handle_cancelled(self, request_id):
+        if request_id != self.active_request_id:
+            return
+        self.chat_display.end_stream_message("")
+        self._finish_request()
+
+    def _finish_request(self):
+        self.active_request_id = None
+        self.active_metrics = None
+        self.busy_changed.emit(False)
+        self._dispatch_next_message()
+
+    def clear(self):
+        """Vacía la conversación. La anterior queda guardada; el siguiente mensaje abre una sesión nueva."""
+        self.pending_messages.clear()
+        self._failed_messages = []
+        if self.active_request_id is not None:
+            self.main_window.executor.cancel(self.active_request_id)
+            self.active_request_id = None
+        # Se sustituyen las listas en lugar de vaciarlas por si un hilo aún está leyendo la anterior
+        self.history = []
+        self.raw_history = []
+        self.context_window.reset()
+        self._stored_items = []
+        if self.chat_display is not None:
+            self.chat_display.clear_chat()
+        self.session_id = None
+        self._oldest_loaded_id = None
+        self._has_older = False
+        self._set_title(self.DEFAULT_TITLE)
+        self.busy_changed.emit(False)
+
+    def _set_title(self, text):
+        self.title = " ".join(text.split())[:TITLE_LENGTH] or self.DEFAULT_TITLE
+        self.title_changed.emit(self.title)
+
+    # --- Sesiones --------------------------------------------------------------
+
+    def _save_message(self, message):
+        """Añade el mensaje a la sesión en disco, creándola si es el primero."""
+        session_store = self.main_window.session_store
+        if session_store is None:
+            return
+        try:
+            if self.session_id is None:
+                self.session_id = session_store.create_session()
+            session_store.append_message(self.session_id, message)
+            self.message_saved.emit()
+        except sqlite3.Error as e:
+            # Un fallo al guardar no debe interrumpir la conversación
+            self.main_window.statusBar().showMessage(f"No se pudo guardar la sesión: {e}")
+
+    def open_session(self, session_id, title=""):
+        """
+        Reabre una sesión guardada. Solo se muestra la última página de mensajes; las
+        anteriores se cargan al desplazarse hacia arriba (ver load_older_messages).
+        """
+        self.clear()
+        page = self.main_window.session_store.load_page(session_id, limit=config.SESSION_PAGE_SIZE)
+        self.session_id = session_id
+        self._oldest_loaded_id = page[0][0] if page else None
+        self._has_older = len(page) == config.SESSION_PAGE_SIZE
+        if title:
+            self._set_title(title)
+
+        self.history = self._load_context(session_id, page)
+        for message in self.history:
+            if message["role"] == "user":
+                self.raw_history.append({"sent": message})
+            elif self.raw_history:
+                self.raw_history[-1]["received"] = message
+        self.ensure_view()
+        self.chat_display.prepend_messages([self._display_message(message) for _, message in page])
+
+    def _load_context(self, session_id, page):
+        """
+        Devuelve los mensajes finales de la sesión que pueden caber en el contexto del
+        modelo, partiendo de la página ya leída. Lo que se lee depende del tamaño del
+        contexto, no de la longitud de la sesión.
+        """
+        session_store = self.main_window.session_store
+        messages = [message for _, message in page]
+        budget = config.CONTEXT_WINDOW_TOKENS
+        tokens = sum(estimate_tokens(message_text(message)) for message in messages)
+        oldest_id = page[0][0] if page else None
+        while oldest_id is not None and (budget <= 0 or tokens < budget):
+            older = session_store.load_page(session_id, before_id=oldest_id, limit=config.SESSION_PAGE_SIZE)
+            if not older:
+                break
+            messages[0:0] = [message for _, message in older]
+            tokens += sum(estimate_tokens(message_text(message)) for _, message in older)
+            oldest_id = older[0][0]
+        return messages
+
+    def _display_message(self, message):
+        """Convierte un mensaje guardado en (rol, texto, imágenes) para la vista del chat."""
+        blob_store = self.main_window.blob_store
+        image_paths = [blob_store.path(url) for url in message_images(message)
+                       if is_blob_ref(url) and url in blob_store]
+        return message["role"], message_text(message), image_paths
+
+    def load_older_messages(self):
+        """Muestra la página de mensajes anterior a la más antigua cargada de la sesión."""
+        if self.main_window.session_store is None or not self._has_older:
+            return
+        page = self.main_window.session_store.load_page(self.session_id, before_id=self._oldest_loaded_id,
+                                                        limit=config.SESSION_PAGE_SIZE)
+        self._has_older = len(page) == config.SESSION_PAGE_SIZE
+        if not page:
+            return
+        self._oldest_loaded_id = page[0][0]
+        self.chat_display.prepend_messages([self._display_message(message) for _, message in page])
+
+    def close_tab(self):
+        """Cancela lo pendiente antes de cerrar la pestaña."""
+        self.pending_messages.clear()
+        if self.active_request_id is not None:
+            self.main_window.executor.cancel(self.active_request_id)
+            self.active_request_id = None
+        executor = self.main_window.executor
+        executor.delta_received.disconnect(self.handle_delta)
+        executor.response_received.disconnect(self.handle_response)
+        executor.error_occurred.disconnect(self.handle_error)
+        executor.request_cancelled.disconnect(self.handle_cancelled)
+        executor.metrics_ready.disconnect(self.handle_metrics)
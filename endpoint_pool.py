@@ -0,0 +1,154 @@
+# endpoint_pool.py
+# Reparto de peticiones entre varios servidores de LM Studio.
+#
+# Un hilo en segundo plano sondea periódicamente /models en cada servidor para
+# conocer si responde y con qué latencia. APIClient pide un servidor al pool para
+# cada petición y, si no consigue conectar, pasa al siguiente sin que el usuario
+# vea el error.
+
+import threading
+import time
+from PyQt5.QtCore import QObject, pyqtSignal
+
+ROUTING_LEAST_LOADED = "least_loaded"
+ROUTING_LOWEST_LATENCY = "lowest_latency"
+
+class Endpoint:
+    """Un servidor del pool y sus estadísticas."""
+
+    def __init__(self, url, weight=1.0):
+        self.url = url.rstrip("/")
+        self.weight = max(float(weight), 1e-6)
+        self.healthy = True
+        self.in_flight = 0
+        # Media móvil exponencial de la latencia de las sondas, en segundos
+        self.latency = None
+        self.requests = 0
+        self.failures = 0
+        self.last_error = ""
+
+    def to_dict(self):
+        return {
+            "url": self.url,
+            "weight": self.weight,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "latency_ms": None if self.latency is None else round(self.latency * 1000, 1),
+            "requests": self.requests,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+class EndpointPool(QObject):
+    """
+    Conjunto de servidores con pesos entre los que se enruta cada petición.
+
+    Con ROUTING_LEAST_LOADED se elige el servidor sano con menos peticiones en curso
+    en proporción a su peso (un servidor con peso 2 recibe el doble); con
+    ROUTING_LOWEST_LATENCY, el de menor latencia medida. Es seguro usarlo desde
+    varios hilos. 'stats_changed' se emite al cambiar el estado de algún servidor.
+    """
+    stats_changed = pyqtSignal()
+
+    # Peso de cada nueva medida en la media móvil de la latencia
+    LATENCY_ALPHA = 0.3
+
+    def __init__(self, endpoints, transport, routing=ROUTING_LEAST_LOADED, probe_interval=15.0,
+                 probe_timeout=3.0, parent=None):
+        """
+        Args:
+            endpoints: Lista de URLs base o de diccionarios {"url": ..., "weight": ...}.
+            transport: HTTPTransport con el que se hacen las sondas.
+        """
+        super().__init__(parent)
+        self.endpoints = [Endpoint(item) if isinstance(item, str) else Endpoint(item["url"], item.get("weight", 1.0))
+                          for item in endpoints]
+        if not self.endpoints:
+            raise ValueError("El pool necesita al menos un servidor.")
+        self.transport = transport
+        self.routing = routing
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Arranca las sondas periódicas en un hilo en segundo plano."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._probe_loop, name="endpoint-probes", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def acquire(self, exclude=()):
+        """
+        Elige el servidor para una petición y lo cuenta como ocupado hasta release().
+        Devuelve None si todos están en 'exclude'. Si ninguno está sano se prueba igualmente
+        alguno: puede haberse recuperado desde la última sonda.
+        """
+        with self._lock:
+            candidates = [endpoint for endpoint in self.endpoints if endpoint not in exclude]
+            if not candidates:
+                return None
+            healthy = [endpoint for endpoint in candidates if endpoint.healthy]
+            endpoint = min(healthy or candidates, key=self._routing_key)
+            endpoint.in_flight += 1
+            endpoint.requests += 1
+        self.stats_changed.emit()
+        return endpoint
+
+    def remaining(self, exclude=()):
+        """Número de servidores que aún se podrían probar fuera de 'exclude'."""
+        return sum(1 for endpoint in self.endpoints if endpoint not in exclude)
+
+    def release(self, endpoint, error=None):
+        """Libera un servidor obtenido con acquire(). Con 'error' se marca como caído hasta la siguiente sonda."""
+        with self._lock:
+            endpoint.in_flight -= 1
+            if error is not None:
+                endpoint.healthy = False
+                endpoint.failures += 1
+                endpoint.last_error = error
+        self.stats_changed.emit()
+
+    def stats(self):
+        with self._lock:
+            return [endpoint.to_dict() for endpoint in self.endpoints]
+
+    def _routing_key(self, endpoint):
+        latency = endpoint.latency if endpoint.latency is not None else float("inf")
+        load = (endpoint.in_flight + 1) / endpoint.weight
+        if self.routing == ROUTING_LOWEST_LATENCY:
+            return latency, load
+        return load, latency
+
+    def _probe_loop(self):
+        while not self._stop_event.is_set():
+            for endpoint in self.endpoints:
+                if self._stop_event.is_set():
+                    return
+                self._probe(endpoint)
+            self.stats_changed.emit()
+            self._stop_event.wait(self.probe_interval)
+
+    def _probe(self, endpoint):
+        # Las sondas corren en su hilo: requests se importa ahí y no al arrancar
+        import requests
+        start = time.perf_counter()
+        try:
+            response = self.transport.get(f"{endpoint.url}/models", timeout=self.probe_timeout, max_retries=0)
+            response.close()
+            error = None if response.ok else f"HTTP {response.status_code}"
+        except requests.exceptions.RequestException as e:
+            error = str(e)
+        latency = time.perf_counter() - start
+
+        with self._lock:
+            endpoint.healthy = error is None
+            if error is None:
+                endpoint.latency = latency if endpoint.latency is None else (
+                    self.LATENCY_ALPHA * latency + (1 - self.LATENCY_ALPHA) * endpoint.latency)
+            else:
+                endpoint.last_error = error
@@ -1,260 +1,507 @@
-# gui.py
-# Ventana principal que integra todos los componentes de la aplicación.
-
-import json
-import copy 
-from PyQt5.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QTextEdit, QMessageBox, QDialog, QCheckBox
-from PyQt5.QtCore import QThread, pyqtSignal, QObject, Qt
-
-# Importaciones de los módulos locales
-import config
-from api_client import APIClient
-from image_utils import encode_image_to_base64
-from chat_display import ChatDisplay
-from input_area import InputArea
-from settings_panel import SettingsPanel
-
-# El Worker se encarga de ejecutar la llamada a la API en un hilo separado
-# para no congelar la interfaz de usuario.
-class Worker(QObject):
-    finished = pyqtSignal()
-    response_received = pyqtSignal(str)
-    error_occurred = pyqtSignal(str)
-
-    def __init__(self, api_client, history):
-        super().__init__()
-        self.api_client = api_client
-        self.history = history
-
-    def run(self):
-        # Conecta las señales del APIClient a las del worker
-        self.api_client.response_received.connect(self.response_received)
-        self.api_client.error_occurred.connect(self.error_occurred)
-        self.api_client.send_request(self.history)
-        self.finished.emit()
-
-class ChatGUI(QMainWindow):
-    def __init__(self):
-        super().__init__()
-        self.setWindowTitle("Cliente de LMStudio")
-        self.setGeometry(100, 100, 800, 700)
-
-        self.history = []
-        self.raw_history = []
-        self.api_client = APIClient(config.API_BASE_URL)
-
-        central_widget = QWidget()
-        self.setCentralWidget(central_widget)
-        main_layout = QVBoxLayout(central_widget)
-
-        # Creación de los componentes de la UI
-        self.settings_panel = SettingsPanel(config.API_BASE_URL)
-        self.chat_display = ChatDisplay()
-        self.input_area = InputArea()
-
-        control_layout = QHBoxLayout()
-        self.clear_chat_button = QPushButton("Limpiar Chat")
-        self.view_raw_button = QPushButton("Ver Mensajes Raw")
-        control_layout.addWidget(self.clear_chat_button)
-        control_layout.addWidget(self.view_raw_button)
-
-        # Añadir widgets al layout principal
-        main_layout.addWidget(self.settings_panel)
-        main_layout.addLayout(control_layout)
-        main_layout.addWidget(self.chat_display, 1) # El '1' hace que se expanda
-        main_layout.addWidget(self.input_area)
-
-        # Conexiones de señales y slots
-        self.input_area.send_button.clicked.connect(self.send_message)
-        self.clear_chat_button.clicked.connect(self.clear_chat)
-        self.view_raw_button.clicked.connect(self.view_raw_messages)
-        self.settings_panel.update_api_button.clicked.connect(self.update_api_url)
-
-        self.apply_dark_theme()
-
-    def send_message(self):
-        text, image_path = self.input_area.get_input()
-        if not text and not image_path:
-            return
-
-        user_content = []
-        if text:
-            user_content.append({"type": "text", "text": text})
-        if image_path:
-            base64_image = encode_image_to_base64(image_path)
-            user_content.append({
-                "type": "image_url",
-                "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}
-            })
-
-        user_message = {"role": "user", "content": user_content}
-        self.history.append(user_message)
-        self.raw_history.append({"sent": user_message})
-
-        self.chat_display.add_message("user", text, image_path)
-        self.input_area.clear_input()
-
-        # Inicia el hilo para la llamada a la API
-        self.thread = QThread()
-        self.worker = Worker(self.api_client, list(self.history))
-        self.worker.moveToThread(self.thread)
-        self.worker.response_received.connect(self.handle_response)
-        self.worker.error_occurred.connect(self.handle_error)
-        self.worker.finished.connect(self.thread.quit)
-        self.worker.finished.connect(self.worker.deleteLater)
-        self.thread.finished.connect(self.thread.deleteLater)
-        self.thread.started.connect(self.worker.run)
-        self.thread.start()
-        
-        self.input_area.send_button.setEnabled(False) # Deshabilita el botón mientras espera
-
-    def handle_response(self, response_text):
-        assistant_message = {"role": "assistant", "content": response_text}
-        self.history.append(assistant_message)
-        if self.raw_history:
-            self.raw_history[-1]["received"] = assistant_message
-        self.chat_display.add_message("assistant", response_text)
-        self.input_area.send_button.setEnabled(True) # Rehabilita el botón
-
-    def handle_error(self, error_message):
-        QMessageBox.critical(self, "Error de API", error_message)
-        self.input_area.send_button.setEnabled(True) # Rehabilita el botón en caso de error
-
-    def clear_chat(self):
-        self.history.clear()
-        self.raw_history.clear()
-        self.chat_display.clear_chat()
-    
-    def _get_sanitized_raw_history(self):
-        """
-        Crea una copia del historial raw y reemplaza el base64 por un placeholder.
-        """
-        sanitized_history = copy.deepcopy(self.raw_history)
-        for entry in sanitized_history:
-            if "sent" in entry and "content" in entry["sent"] and isinstance(entry["sent"]["content"], list):
-                for content_part in entry["sent"]["content"]:
-                    if content_part.get("type") == "image_url":
-                        url = content_part.get("image_url", {}).get("url", "")
-                        if "base64" in url:
-                            content_part["image_url"]["url"] = "<...Contenido de imagen base64 omitido...>"
-        return sanitized_history
-
-    def view_raw_messages(self):
-        raw_dialog = QDialog(self)
-        raw_dialog.setWindowTitle("Mensajes Raw (JSON)")
-        raw_dialog.setGeometry(150, 150, 700, 500)
-        
-        layout = QVBoxLayout(raw_dialog)
-        
-        # Layout horizontal para los checkboxes de control
-        controls_layout = QHBoxLayout()
-        
-        # Checkbox para mostrar/ocultar base64
-        base64_checkbox = QCheckBox("Mostrar contenido de imágenes (base64)")
-        base64_checkbox.setChecked(False)
-        
-        # Checkbox para habilitar/deshabilitar word wrap
-        wrap_checkbox = QCheckBox("Habilitar Word Wrap")
-        wrap_checkbox.setChecked(False)
-
-        controls_layout.addWidget(base64_checkbox)
-        controls_layout.addWidget(wrap_checkbox)
-        
-        raw_text = QTextEdit()
-        raw_text.setReadOnly(True)
-        # Estado inicial sin ajuste de línea para mejor rendimiento
-        raw_text.setLineWrapMode(QTextEdit.NoWrap)
-        
-        layout.addLayout(controls_layout)
-        layout.addWidget(raw_text)
-
-        # Preparar ambas versiones del historial
-        full_history_str = json.dumps(self.raw_history, indent=2, ensure_ascii=False)
-        sanitized_history_str = json.dumps(self._get_sanitized_raw_history(), indent=2, ensure_ascii=False)
-
-        # Función para actualizar el texto según el estado de la casilla de base64
-        def update_text_view(state):
-            if state == Qt.Checked:
-                raw_text.setText(full_history_str)
-            else:
-                raw_text.setText(sanitized_history_str)
-        
-        # Función para alternar el ajuste de línea (word wrap)
-        def toggle_word_wrap(state):
-            if state == Qt.Checked:
-                raw_text.setLineWrapMode(QTextEdit.WidgetWidth)
-            else:
-                raw_text.setLineWrapMode(QTextEdit.NoWrap)
-
-        # Conectar las señales de las casillas a sus funciones
-        base64_checkbox.stateChanged.connect(update_text_view)
-        wrap_checkbox.stateChanged.connect(toggle_word_wrap)
-        
-        # Establecer el texto inicial (la versión optimizada sin base64)
-        raw_text.setText(sanitized_history_str)
-        
-        raw_dialog.exec_()
-
-    def update_api_url(self):
-        new_url = self.settings_panel.api_input.text().strip()
-        if not new_url:
-            QMessageBox.warning(self, "URL Inválida", "La dirección de la API no puede estar vacía.")
-            return
-            
-        self.api_client.set_api_url(new_url)
-        # Actualiza el archivo config.py para persistencia
-        try:
-            with open("config.py", "w") as f:
-                f.write(f'API_BASE_URL = "{new_url}"')
-            QMessageBox.information(self, "API Actualizada", f"La dirección de la API es ahora: {new_url}")
-        except IOError as e:
-            QMessageBox.critical(self, "Error de Archivo", f"No se pudo escribir en config.py: {e}")
-
-    def apply_dark_theme(self):
-        self.setStyleSheet("""
-            QWidget { 
-                background-color: #282c34; 
-                color: #ffffff;
-            }
-            QTextEdit, QLineEdit {
-                background-color: #3b4048; 
-                color: #ffffff;
-                border: 1px solid #2c313a; 
-                border-radius: 4px; 
-                padding: 5px;
-            }
-            QPushButton {
-                background-color: #61afef; 
-                color: #ffffff;
-                border: none; 
-                padding: 8px 16px; 
-                border-radius: 4px; 
-                font-weight: bold;
-            }
-            QPushButton:hover { 
-                background-color: #528baf; 
-            }
-            QLabel, QCheckBox { 
-                color: #ffffff; 
-            }
-            QScrollArea { 
-                border: none; 
-            }
-            QScrollBar:vertical {
-                border: none; 
-                background: #2c313a; 
-                width: 10px; 
-                margin: 0px 0px 0px 0px;
-            }
-            QScrollBar::handle:vertical { 
-                background: #4b5263; 
-                min-height: 20px; 
-                border-radius: 5px; 
-            }
-            QScrollBar::add-line:vertical, QScrollBar::sub-line:vertical { 
-                height: 0px; 
-            }
-            QDialog { 
-                background-color: #282c34; 
-            }
-        """)
\ No newline at end of file
+# gui.py
+# Ventana principal que integra todos los componentes de la aplicación.
+
+import json
+import os
+import re
+import time
+from PyQt5.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QMessageBox, QMenu, QTabWidget
+from PyQt5.QtCore import QTimer, pyqtSignal
+
+# Importaciones de los módulos locales
+import config
+import startup_probe
+from api_client import APIClient
+from http_transport import HTTPTransport
+from blob_store import BlobStore
+from request_executor import RequestExecutor
+from request_metrics import MetricsLog
+from context_window import load_tokenizer
+from session_store import SessionStore
+from response_cache import ResponseCache
+from endpoint_pool import EndpointPool
+from prewarm import PrefixPrewarmer
+from semantic_index import SemanticIndex, EmbeddingIndexer
+from image_utils import ImagePreprocessor
+from conversation_tab import ConversationTab
+from thumbnail_loader import ThumbnailLoader
+from markdown_renderer import CodeHighlighter
+from input_area import InputArea
+from settings_panel import SettingsPanel
+
+def _persist_config_value(name, value, path="config.py"):
+    """
+    Reescribe en config.py únicamente la línea de la variable indicada,
+    conservando el resto de opciones y comentarios del archivo.
+    """
+    line = f"{name} = {json.dumps(value)}"
+    with open(path, "r", encoding="utf-8") as f:
+        source = f.read()
+
+    pattern = re.compile(rf"^{re.escape(name)}\s*=.*$", re.MULTILINE)
+    if pattern.search(source):
+        source = pattern.sub(lambda _: line, source, count=1)
+    else:
+        source = source.rstrip("\n") + f"\n{line}\n"
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(source)
+
+class ChatGUI(QMainWindow):
+    startup_finished = pyqtSignal()
+
+    def __init__(self):
+        super().__init__()
+        self._first_paint_pending = True
+        self.setWindowTitle("Cliente de LMStudio")
+        self.setGeometry(100, 100, 800, 700)
+
+        transport = HTTPTransport(
+            pool_size=config.HTTP_POOL_SIZE,
+            connect_timeout=config.CONNECT_TIMEOUT,
+            read_timeout=config.READ_TIMEOUT,
+            max_retries=config.MAX_RETRIES,
+        )
+        # Todo lo que lee de disco o sale a la red (base de datos de sesiones, caché de
+        # respuestas, tokenizador, índice semántico, conexiones) se prepara en
+        # _finish_startup(), después del primer frame; aquí solo se crea lo que se dibuja
+        sessions_enabled = bool(config.SESSION_DIRECTORY)
+        self.session_store = None
+        self.response_cache = None
+        self.semantic_index = None
+        self.embedding_indexer = None
+        # Ventana de búsqueda; se crea la primera vez que se abre y se reutiliza
+        self._search_dialog = None
+        self.metrics_log = None
+        self.tokenizer = None
+        blob_directory = config.BLOB_DIRECTORY
+        if sessions_enabled:
+            blob_directory = blob_directory or os.path.join(config.SESSION_DIRECTORY, "blobs")
+        # Las imágenes se guardan una sola vez; el historial solo contiene su referencia.
+        # Si hay sesiones, se escriben a disco al prepararse para que sigan disponibles al reabrirlas.
+        self.blob_store = BlobStore(blob_directory, memory_limit=config.BLOB_CACHE_MB * 1024 * 1024,
+                                    write_through=sessions_enabled)
+        # Con varios servidores configurados, cada petición va al más desocupado de los que responden
+        self.endpoint_pool = None
+        if config.API_ENDPOINTS:
+            self.endpoint_pool = EndpointPool(config.API_ENDPOINTS, transport, routing=config.ENDPOINT_ROUTING,
+                                              probe_interval=config.ENDPOINT_PROBE_INTERVAL,
+                                              probe_timeout=config.ENDPOINT_PROBE_TIMEOUT, parent=self)
+        # La conexión de calentamiento se abre al terminar el arranque
+        self.api_client = APIClient(config.API_BASE_URL, transport, warm_up=False,
+                                    blob_store=self.blob_store, max_tokens=config.MAX_RESPONSE_TOKENS,
+                                    sampling=config.SAMPLING_PARAMS, endpoint_pool=self.endpoint_pool)
+        # Las imágenes se reducen y recodifican en segundo plano en cuanto se adjuntan
+        self.image_preprocessor = ImagePreprocessor(
+            self.blob_store,
+            max_edge=config.IMAGE_MAX_EDGE,
+            max_pixels=config.IMAGE_MAX_PIXELS,
+            quality=config.IMAGE_JPEG_QUALITY,
+            max_workers=config.IMAGE_WORKERS,
+            parent=self,
+        )
+        # Hilos persistentes que atienden las peticiones de todas las pestañas. Su número es el
+        # límite global de peticiones simultáneas; la pestaña visible tiene prioridad.
+        self.executor = RequestExecutor(self.api_client, max_workers=config.REQUEST_WORKERS, parent=self)
+        self.prewarmer = None
+        if config.PREWARM_ENABLED:
+            self.prewarmer = PrefixPrewarmer(self.api_client, debounce_ms=config.PREWARM_DEBOUNCE_MS,
+                                             min_interval=config.PREWARM_MIN_INTERVAL, parent=self)
+
+        # La hoja de estilos se aplica antes de crear los widgets: aplicada al final,
+        # Qt vuelve a calcular el estilo de todos los que ya existen
+        self.apply_dark_theme()
+        central_widget = QWidget()
+        self.setCentralWidget(central_widget)
+        main_layout = QVBoxLayout(central_widget)
+
+        # Creación de los componentes de la UI
+        self.settings_panel = SettingsPanel(config.API_BASE_URL, config.STREAM_RESPONSES)
+        # Caché de miniaturas compartida por todas las pestañas y la vista previa de la imagen adjunta
+        self.thumbnail_loader = ThumbnailLoader(cache_limit=config.THUMBNAIL_CACHE_MB * 1024 * 1024, parent=self)
+        # Resaltado de los bloques de código de las respuestas, compartido también entre pestañas
+        self.code_highlighter = None
+        if config.MARKDOWN_ENABLED:
+            self.code_highlighter = CodeHighlighter(style=config.CODE_HIGHLIGHT_STYLE,
+                                                    cache_limit=config.CODE_HIGHLIGHT_CACHE_MB * 1024 * 1024,
+                                                    parent=self)
+        self.tabs = QTabWidget()
+        self.tabs.setTabsClosable(True)
+        self.tabs.setMovable(True)
+        self.tabs.setDocumentMode(True)
+        self.new_tab_button = QPushButton("+")
+        self.new_tab_button.setToolTip("Nueva pestaña")
+        self.tabs.setCornerWidget(self.new_tab_button)
+        self.input_area = InputArea(self.thumbnail_loader)
+
+        control_layout = QHBoxLayout()
+        self.clear_chat_button = QPushButton("Limpiar Chat")
+        self.view_raw_button = QPushButton("Ver Mensajes Raw")
+        control_layout.addWidget(self.clear_chat_button)
+        control_layout.addWidget(self.view_raw_button)
+        if sessions_enabled:
+            self.sessions_button = QPushButton("Sesiones")
+            self.sessions_menu = QMenu(self.sessions_button)
+            # La lista se consulta al abrir el menú, no al arrancar
+            self.sessions_menu.aboutToShow.connect(self._populate_sessions_menu)
+            self.sessions_button.setMenu(self.sessions_menu)
+            control_layout.addWidget(self.sessions_button)
+        if config.SEMANTIC_SEARCH_ENABLED and sessions_enabled:
+            self.search_button = QPushButton("Buscar")
+            self.search_button.setToolTip("Búsqueda semántica en las conversaciones guardadas")
+            # Se habilita cuando el índice está abierto
+            self.search_button.setEnabled(False)
+            self.search_button.clicked.connect(self.search_sessions)
+            control_layout.addWidget(self.search_button)
+
+        # Añadir widgets al layout principal
+        main_layout.addWidget(self.settings_panel)
+        main_layout.addLayout(control_layout)
+        main_layout.addWidget(self.tabs, 1) # El '1' hace que se expanda
+        main_layout.addWidget(self.input_area)
+
+        # Conexiones de señales y slots
+        self.input_area.send_button.clicked.connect(self.send_message)
+        self.input_area.stop_button.clicked.connect(self.stop_generation)
+        self.clear_chat_button.clicked.connect(self.clear_chat)
+        self.view_raw_button.clicked.connect(self.view_raw_messages)
+        self.settings_panel.update_api_button.clicked.connect(self.update_api_url)
+        self.new_tab_button.clicked.connect(self.new_tab)
+        self.tabs.currentChanged.connect(self._on_current_tab_changed)
+        self.tabs.tabCloseRequested.connect(self.close_tab)
+        self.input_area.image_selected.connect(self._on_image_selected)
+        self.input_area.image_removed.connect(self.image_preprocessor.discard)
+        self.image_preprocessor.image_progress.connect(self.input_area.set_image_progress)
+        self.image_preprocessor.image_ready.connect(self.input_area.set_image_ready)
+        self.image_preprocessor.image_failed.connect(self.input_area.set_image_failed)
+        self.image_preprocessor.image_ready.connect(self._on_image_ready)
+        self.image_preprocessor.image_failed.connect(self._on_image_ready)
+        if self.prewarmer is not None:
+            self.input_area.text_input.textChanged.connect(self._on_draft_changed)
+        if self.endpoint_pool is not None:
+            self.endpoint_pool.stats_changed.connect(self._update_endpoint_stats)
+            self._update_endpoint_stats()
+
+        self.current_tab = None
+        self.new_tab()
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self._first_paint_pending:
+            self._first_paint_pending = False
+            # El temporizador salta cuando el primer frame ya está en pantalla
+            QTimer.singleShot(0, self._finish_startup)
+
+    def _finish_startup(self):
+        """Segunda parte del arranque, con la ventana ya dibujada: disco, red y tareas de fondo."""
+        startup_probe.mark("first_paint")
+        if config.SESSION_DIRECTORY:
+            # Sesiones guardadas en disco; cada pestaña añade sus mensajes a la suya
+            os.makedirs(config.SESSION_DIRECTORY, exist_ok=True)
+            self.session_store = SessionStore(os.path.join(config.SESSION_DIRECTORY, "sessions.sqlite3"))
+        if config.RESPONSE_CACHE_ENABLED:
+            self.response_cache = ResponseCache(config.RESPONSE_CACHE_PATH,
+                                                max_bytes=config.RESPONSE_CACHE_MB * 1024 * 1024,
+                                                max_age=config.RESPONSE_CACHE_MAX_DAYS * 24 * 3600,
+                                                force=config.RESPONSE_CACHE_FORCE)
+            self.api_client.response_cache = self.response_cache
+        if config.METRICS_ENABLED and config.METRICS_LOG_PATH:
+            self.metrics_log = MetricsLog(config.METRICS_LOG_PATH,
+                                          max_bytes=config.METRICS_LOG_MAX_MB * 1024 * 1024,
+                                          backup_count=config.METRICS_LOG_BACKUPS)
+            self.executor.metrics_ready.connect(self._log_metrics)
+        # El tokenizador se carga una vez y lo comparten las ventanas de contexto de todas las pestañas
+        self.tokenizer = load_tokenizer(config.TOKENIZER_PATH)
+        for tab in self._all_tabs():
+            tab.set_tokenizer(self.tokenizer)
+        startup_probe.mark("storage_opened")
+
+        # Índice semántico de los mensajes guardados, actualizado en segundo plano
+        if config.SEMANTIC_SEARCH_ENABLED and self.session_store is not None:
+            self.semantic_index = SemanticIndex(os.path.join(config.SESSION_DIRECTORY, "embeddings"),
+                                                model=config.EMBEDDING_MODEL)
+            self.embedding_indexer = EmbeddingIndexer(self.semantic_index, self.api_client, self.session_store.path,
+                                                      batch_size=config.EMBEDDING_BATCH_SIZE,
+                                                      max_chars=config.EMBEDDING_MAX_CHARS, parent=self)
+            self.embedding_indexer.failed.connect(
+                lambda error: self.statusBar().showMessage(f"Índice de búsqueda en pausa: {error}"))
+            for tab in self._all_tabs():
+                tab.message_saved.connect(self.embedding_indexer.notify)
+            self.search_button.setEnabled(True)
+            self.embedding_indexer.start()
+        if config.WARM_UP_CONNECTION:
+            self.api_client.warm_up_enabled = True
+            self.api_client.warm_up()
+        if self.endpoint_pool is not None:
+            self.endpoint_pool.start()
+
+        # No se sustituye una conversación que el usuario ya haya empezado
+        if self.session_store is not None and config.SESSION_RESTORE_LAST and not self.current_tab.history:
+            latest_session = self.session_store.latest_session()
+            if latest_session is not None:
+                self.current_tab.open_session(latest_session, self._session_title(latest_session))
+        startup_probe.mark("startup_finished")
+        self.startup_finished.emit()
+
+    def _all_tabs(self):
+        return [self.tabs.widget(index) for index in range(self.tabs.count())]
+
+    # --- Pestañas -------------------------------------------------------------
+
+    def new_tab(self):
+        tab = ConversationTab(self, self.tokenizer)
+        tab.title_changed.connect(lambda title, tab=tab: self._set_tab_title(tab, title))
+        tab.busy_changed.connect(lambda _busy, tab=tab: self._on_tab_busy_changed(tab))
+        if self.embedding_indexer is not None:
+            tab.message_saved.connect(self.embedding_indexer.notify)
+        self.tabs.setCurrentIndex(self.tabs.addTab(tab, tab.title))
+        return tab
+
+    def close_tab(self, index):
+        tab = self.tabs.widget(index)
+        tab.close_tab()
+        self.tabs.removeTab(index)
+        tab.deleteLater()
+        # Siempre queda al menos una conversación abierta
+        if self.tabs.count() == 0:
+            self.new_tab()
+
+    def _set_tab_title(self, tab, title):
+        index = self.tabs.indexOf(tab)
+        if index >= 0:
+            self.tabs.setTabText(index, title if len(title) <= 24 else title[:23] + "…")
+            self.tabs.setTabToolTip(index, title)
+
+    def _on_current_tab_changed(self, index):
+        previous = self.current_tab
+        self.current_tab = self.tabs.widget(index)
+        if self.prewarmer is not None:
+            self.prewarmer.cancel()
+        if previous is not None and previous is not self.current_tab and self.tabs.indexOf(previous) >= 0:
+            previous.set_foreground(False)
+        if self.current_tab is not None:
+            self.current_tab.set_foreground(True)
+            self.input_area.stop_button.setEnabled(self.current_tab.active_request_id is not None)
+        self._enforce_memory_budget()
+
+    def _on_tab_busy_changed(self, tab):
+        if tab is self.current_tab:
+            self.input_area.stop_button.setEnabled(tab.active_request_id is not None)
+        elif not tab.is_busy():
+            # Una pestaña en segundo plano que termina puede liberar ya su vista
+            self._enforce_memory_budget()
+
+    def image_paths_in_use(self, exclude=None):
+        """Rutas de las imágenes que muestran el área de entrada y las vistas de las pestañas salvo 'exclude'."""
+        image_paths = set(self.input_area.get_input()[1])
+        for tab in self._all_tabs():
+            if tab is not exclude:
+                image_paths |= tab.displayed_image_paths()
+        return image_paths
+
+    def _enforce_memory_budget(self):
+        """
+        Libera la vista de las pestañas en segundo plano, empezando por las que llevan más
+        tiempo sin mostrarse, hasta que entre todas ocupen menos de TAB_MEMORY_BUDGET_MB.
+        """
+        background = [self.tabs.widget(index) for index in range(self.tabs.count())]
+        background = sorted((tab for tab in background if tab is not self.current_tab),
+                            key=lambda tab: tab.last_visible)
+        total = sum(tab.rendered_bytes() for tab in background)
+        budget = config.TAB_MEMORY_BUDGET_MB * 1024 * 1024
+        for tab in background:
+            if total <= budget:
+                return
+            rendered = tab.rendered_bytes()
+            if tab.release_view():
+                total -= rendered
+
+    # --- Acciones sobre la pestaña actual ---------------------------------------
+
+    def send_message(self):
+        text, image_paths = self.input_area.get_input()
+        if not text and not image_paths:
+            return
+        self.input_area.clear_input()
+        self.current_tab.send_message(text, image_paths)
+
+    def _on_draft_changed(self):
+        """Programa el precalentado de la pestaña actual con el borrador, solo si no tiene nada en curso."""
+        if self.current_tab is None or self.current_tab.is_busy():
+            return
+        text = self.input_area.text_input.toPlainText().strip()
+        if not text:
+            self.prewarmer.cancel()
+            return
+        self.prewarmer.schedule(self.current_tab.draft_messages(text))
+
+    def _on_image_selected(self, image_path):
+        """Empieza a preparar la imagen adjunta; si ya estaba preparada no habrá señal de progreso."""
+        future = self.image_preprocessor.submit(image_path)
+        if future.done():
+            if future.exception() is not None:
+                self.input_area.set_image_failed(image_path, str(future.exception()))
+            else:
+                self.input_area.set_image_ready(image_path)
+
+    def _on_image_ready(self, *_):
+        for index in range(self.tabs.count()):
+            self.tabs.widget(index).on_image_ready()
+
+    def stop_generation(self):
+        """Detiene la respuesta en curso; en streaming se conserva el texto recibido hasta ahora."""
+        self.current_tab.stop_generation()
+        self.input_area.stop_button.setEnabled(False)
+
+    def clear_chat(self):
+        if self.prewarmer is not None:
+            self.prewarmer.cancel()
+        self.current_tab.clear()
+
+    def show_request_metrics(self, metrics):
+        """Muestra en la barra de estado las métricas de la última petición de la pestaña visible."""
+        status = metrics.summary()
+        if self.prewarmer is not None:
+            self.prewarmer.record(metrics)
+            comparison = self.prewarmer.summary()
+            if comparison:
+                status += f"  ·  {comparison}"
+        if self.response_cache is not None:
+            status += f"  ·  caché: {self.response_cache.hits} aciertos, {self.response_cache.misses} fallos"
+        self.statusBar().showMessage(status)
+
+    def _log_metrics(self, _request_id, metrics):
+        self.metrics_log.write(metrics)
+
+    def _update_endpoint_stats(self):
+        self.settings_panel.set_endpoint_stats(self.endpoint_pool.stats())
+
+    # --- Sesiones -------------------------------------------------------------------
+
+    def _populate_sessions_menu(self):
+        self.sessions_menu.clear()
+        if self.session_store is None:
+            return
+        self.sessions_menu.addAction("Nueva sesión", self.clear_chat)
+        self.sessions_menu.addSeparator()
+        for session_id, title, updated_at in self.session_store.list_sessions():
+            label = f"{time.strftime('%d/%m/%Y %H:%M', time.localtime(updated_at))}  {title or 'Sin título'}"
+            action = self.sessions_menu.addAction(
+                label, lambda session_id=session_id, title=title: self.open_session(session_id, title))
+            action.setCheckable(True)
+            action.setChecked(session_id == self.current_tab.session_id)
+
+    def open_session(self, session_id, title=""):
+        """
+        Muestra una sesión guardada: si ya está abierta se cambia a su pestaña; si no, se
+        abre en la actual si está vacía o en una nueva.
+        """
+        for index in range(self.tabs.count()):
+            if self.tabs.widget(index).session_id == session_id:
+                self.tabs.setCurrentIndex(index)
+                return
+        tab = self.current_tab
+        if tab.history or tab.is_busy():
+            tab = self.new_tab()
+        tab.open_session(session_id, title)
+
+    def search_sessions(self):
+        if self._search_dialog is None:
+            from search_dialog import SemanticSearchDialog
+            self._search_dialog = SemanticSearchDialog(self.semantic_index, self.api_client, self.session_store,
+                                                       results=config.SEMANTIC_SEARCH_RESULTS, parent=self)
+            self._search_dialog.session_requested.connect(self.open_session)
+        self._search_dialog.exec_()
+
+    def _session_title(self, session_id):
+        for listed_id, title, _updated_at in self.session_store.list_sessions(limit=1):
+            if listed_id == session_id:
+                return title
+        return ""
+
+    def view_raw_messages(self):
+        # Ventanas poco usadas: se importan al abrirlas por primera vez, no al arrancar
+        from raw_inspector import RawMessagesDialog
+        RawMessagesDialog(self.current_tab.raw_history, self.blob_store, self).exec_()
+
+    def update_api_url(self):
+        new_url = self.settings_panel.api_input.text().strip()
+        if not new_url:
+            QMessageBox.warning(self, "URL Inválida", "La dirección de la API no puede estar vacía.")
+            return
+            
+        self.api_client.set_api_url(new_url)
+        # Actualiza el archivo config.py para persistencia
+        try:
+            _persist_config_value("API_BASE_URL", new_url)
+            QMessageBox.information(self, "API Actualizada", f"La dirección de la API es ahora: {new_url}")
+        except IOError as e:
+            QMessageBox.critical(self, "Error de Archivo", f"No se pudo escribir en config.py: {e}")
+
+    def closeEvent(self, event):
+        if self.endpoint_pool is not None:
+            self.endpoint_pool.stop()
+        if self.embedding_indexer is not None:
+            self.embedding_indexer.stop()
+        if self.prewarmer is not None:
+            self.prewarmer.cancel()
+        self.executor.shutdown()
+        self.image_preprocessor.shutdown()
+        self.thumbnail_loader.shutdown()
+        if self.code_highlighter is not None:
+            self.code_highlighter.shutdown()
+        self.blob_store.close()
+        if self.session_store is not None:
+            self.session_store.close()
+        if self.response_cache is not None:
+            self.response_cache.close()
+        super().closeEvent(event)
+
+    def apply_dark_theme(self):
+        self.setStyleSheet("""
+            QWidget { 
+                background-color: #282c34; 
+                color: #ffffff;
+            }
+            QTextEdit, QLineEdit {
+                background-color: #3b4048; 
+                color: #ffffff;
+                border: 1px solid #2c313a; 
+                border-radius: 4px; 
+                padding: 5px;
+            }
+            QPushButton {
+                background-color: #61afef; 
+                color: #ffffff;
+                border: none; 
+                padding: 8px 16px; 
+                border-radius: 4px; 
+                font-weight: bold;
+            }
+            QPushButton:hover { 
+                background-color: #528baf; 
+            }
+            QLabel, QCheckBox { 
+                color: #ffffff; 
+            }
+            QScrollArea { 
+                border: none; 
+            }
+            QScrollBar:vertical {
+                border: none; 
+                background: #2c313a; 
+                width: 10px; 
+                margin: 0px 0px 0px 0px;
+            }
+            QScrollBar::handle:vertical { 
+                background: #4b5263; 
+                min-height: 20px; 
+                border-radius: 5px; 
+            }
+            QScrollBar::add-line:vertical, QScrollBar::sub-line:vertical { 
+                height: 0px; 
+            }
+            QDialog { 
+                background-color: #282c34; 
+            }
+        """)
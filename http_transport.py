@@ -0,0 +1,129 @@
+# http_transport.py
+# Capa de transporte HTTP usada por APIClient: sesión persistente con pool de
+# conexiones keep-alive, timeouts separados de conexión/lectura y reintentos.
+
+import random
+import threading
+import time
+
+# Códigos que LM Studio (o un proxy delante) devuelve mientras carga o cambia de modelo
+RETRYABLE_STATUS_CODES = {502, 503, 504}
+
+class HTTPTransport:
+    """
+    Envuelve una requests.Session compartida por todas las peticiones del cliente.
+    La sesión (y el propio requests, que tarda en importarse) se crea con la primera
+    petición, normalmente en un hilo de trabajo, para no retrasar el arranque.
+
+    Reutilizar la sesión evita abrir una conexión TCP nueva en cada turno. Los
+    fallos transitorios (conexión rechazada o reiniciada, 502/503/504) se reintentan
+    con backoff exponencial con jitter. Las peticiones a chat/completions no tienen
+    efectos secundarios en el servidor, así que reenviarlas es seguro.
+    """
+
+    def __init__(self, pool_size=4, connect_timeout=5.0, read_timeout=120.0,
+                 max_retries=3, backoff_base=0.5, backoff_max=8.0):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_size = pool_size
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        with self._session_lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                # Los reintentos se gestionan aquí y no en urllib3, que no reintenta POST por defecto
+                adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=0)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._session = session
+            return self._session
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def request(self, method, url, cancel_event=None, max_retries=None, **kwargs):
+        """
+        Ejecuta la petición reintentando los fallos transitorios.
+
+        Args:
+            cancel_event: threading.Event opcional; si se activa durante la espera
+                entre reintentos se abandona y se relanza el último error.
+            max_retries: Sustituye al número de reintentos de la sesión para esta
+                petición (p. ej. 0 si el llamador puede pasar a otro servidor).
+
+        Returns:
+            El requests.Response de la última petición. Los errores HTTP no
+            reintentables se devuelven tal cual para que el llamador los trate.
+        """
+        import requests
+        kwargs.setdefault("timeout", self.timeout)
+        if max_retries is None:
+            max_retries = self.max_retries
+        body = kwargs.get("data")
+        attempt = 0
+        while True:
+            # Los cuerpos en streaming se rebobinan para poder reenviarlos en cada intento
+            if attempt and hasattr(body, "seek"):
+                body.seek(0)
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.exceptions.ConnectionError:
+                if attempt >= max_retries:
+                    raise
+                delay = self._backoff_delay(attempt)
+                if self._wait(delay, cancel_event):
+                    raise
+            else:
+                if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= max_retries:
+                    return response
+                delay = self._retry_after(response) or self._backoff_delay(attempt)
+                if self._wait(delay, cancel_event):
+                    return response
+                response.close()
+            attempt += 1
+
+    def warm_up(self, url):
+        """
+        Lanza en segundo plano una petición ligera para dejar abierta una conexión
+        en el pool. Los errores se ignoran: el servidor puede no estar disponible aún.
+        """
+        def ping():
+            import requests
+            try:
+                self.session.get(url, timeout=self.timeout).close()
+            except requests.exceptions.RequestException:
+                pass
+
+        threading.Thread(target=ping, name="http-warm-up", daemon=True).start()
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+
+    def _backoff_delay(self, attempt):
+        # "Full jitter": evita que varios clientes reintenten a la vez tras un cambio de modelo
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _retry_after(self, response):
+        try:
+            return min(self.backoff_max, float(response.headers.get("Retry-After", "")))
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _wait(delay, cancel_event):
+        """Espera 'delay' segundos. Devuelve True si se canceló durante la espera."""
+        if cancel_event is None:
+            time.sleep(delay)
+            return False
+        return cancel_event.wait(delay)
@@ -1,17 +1,209 @@
-# image_utils.py
-# Contiene funciones de utilidad para el manejo de imágenes.
-
-import base64
-
-def encode_image_to_base64(image_path: str) -> str:
-    """
-    Codifica un archivo de imagen a una cadena en formato base64.
-    
-    Args:
-        image_path: La ruta al archivo de imagen.
-        
-    Returns:
-        Una cadena con la imagen codificada en base64.
-    """
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
\ No newline at end of file
+# image_utils.py
+# Contiene funciones de utilidad para el manejo de imágenes.
+
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from PyQt5.QtCore import QObject, pyqtSignal, QBuffer, QByteArray, QIODevice, QSize
+from PyQt5.QtGui import QImage, QImageReader
+
+# Firmas de cabecera para detectar el tipo real del archivo, independientemente de su extensión
+_MAGIC_NUMBERS = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+)
+
+def detect_mime_type(data: bytes) -> str:
+    """Devuelve el tipo MIME según la cabecera de los datos, o 'application/octet-stream'."""
+    for magic, mime in _MAGIC_NUMBERS:
+        if data.startswith(magic):
+            return mime
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+def target_size(width: int, height: int, max_edge: int = 0, max_pixels: int = 0):
+    """
+    Calcula el tamaño final manteniendo la proporción para que el lado mayor no supere
+    'max_edge' ni el área supere 'max_pixels'. Un límite a 0 se ignora. Nunca amplía.
+    """
+    scale = 1.0
+    if max_edge and max(width, height) > max_edge:
+        scale = min(scale, max_edge / max(width, height))
+    if max_pixels and width * height > max_pixels:
+        scale = min(scale, math.sqrt(max_pixels / (width * height)))
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+class PreparedImage:
+    """Imagen lista para enviarse a la API."""
+
+    def __init__(self, data: bytes, mime_type: str, width: int, height: int):
+        self.data = data
+        self.mime_type = mime_type
+        self.width = width
+        self.height = height
+
+def prepare_image(image_path: str, max_edge: int = 0, max_pixels: int = 0, quality: int = 85,
+                  raw: bytes = None) -> PreparedImage:
+    """
+    Reduce y recodifica una imagen para enviarla a un modelo de visión.
+
+    La orientación EXIF se aplica al decodificar y la imagen se decodifica
+    directamente al tamaño reducido (en JPEG esto evita materializar la
+    resolución completa). Si no hace falta reducir ni rotar, se envían los
+    bytes originales sin recodificar.
+
+    Args:
+        image_path: Ruta al archivo de imagen.
+        max_edge: Longitud máxima del lado mayor en píxeles (0 = sin límite).
+        max_pixels: Número máximo de píxeles (0 = sin límite).
+        quality: Calidad JPEG (1-100) usada al recodificar.
+        raw: Contenido del archivo si ya se ha leído.
+
+    Raises:
+        ValueError: Si el archivo no es una imagen que se pueda decodificar.
+    """
+    if raw is None:
+        with open(image_path, "rb") as image_file:
+            raw = image_file.read()
+
+    buffer = QBuffer()
+    buffer.setData(QByteArray(raw))
+    buffer.open(QIODevice.ReadOnly)
+    reader = QImageReader(buffer)
+    reader.setAutoTransform(True)
+
+    source_size = reader.size()
+    if not source_size.isValid():
+        raise ValueError(f"No se pudo leer la imagen: {image_path}")
+    width, height = target_size(source_size.width(), source_size.height(), max_edge, max_pixels)
+    needs_resize = (width, height) != (source_size.width(), source_size.height())
+    needs_rotation = bool(int(reader.transformation()))
+
+    mime_type = detect_mime_type(raw)
+    if not needs_resize and not needs_rotation and mime_type in ("image/jpeg", "image/png", "image/webp"):
+        return PreparedImage(raw, mime_type, width, height)
+
+    if needs_resize:
+        reader.setScaledSize(QSize(width, height))
+    image = reader.read()
+    if image.isNull():
+        raise ValueError(f"No se pudo decodificar la imagen {image_path}: {reader.errorString()}")
+
+    # Las imágenes con transparencia se mantienen en PNG; el resto se comprime en JPEG
+    if image.hasAlphaChannel():
+        output_format, output_mime, output_quality = "PNG", "image/png", -1
+    else:
+        output_format, output_mime, output_quality = "JPEG", "image/jpeg", quality
+        image = image.convertToFormat(QImage.Format_RGB32)
+
+    output = QBuffer()
+    output.open(QIODevice.WriteOnly)
+    if not image.save(output, output_format, output_quality):
+        raise ValueError(f"No se pudo recodificar la imagen: {image_path}")
+    return PreparedImage(bytes(output.data()), output_mime, image.width(), image.height())
+
+class ImagePreprocessor(QObject):
+    """
+    Prepara imágenes en un pool de hilos para no bloquear la interfaz.
+
+    El resultado se guarda en un BlobStore y se devuelve su referencia. La
+    correspondencia entre el hash del archivo original (más los ajustes de
+    preprocesado) y esa referencia se cachea, así que reenviar la misma imagen
+    no vuelve a decodificarla ni a recodificarla.
+
+    'image_progress' lleva el porcentaje aproximado de cada imagen según la etapa
+    terminada (leída, recodificada); al acabar se emite 'image_ready' o 'image_failed'.
+    """
+    image_ready = pyqtSignal(str)
+    image_failed = pyqtSignal(str, str)
+    image_progress = pyqtSignal(str, int)
+
+    # Porcentaje que se indica al terminar cada etapa de la preparación
+    PROGRESS_STARTED = 5
+    PROGRESS_READ = 30
+    PROGRESS_ENCODED = 90
+
+    def __init__(self, blob_store, max_edge=0, max_pixels=0, quality=85, max_workers=2, cache_size=256,
+                 parent=None):
+        super().__init__(parent)
+        self.blob_store = blob_store
+        self.max_edge = max_edge
+        self.max_pixels = max_pixels
+        self.quality = quality
+        self.cache_size = cache_size
+
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-prep")
+        self._cache = OrderedDict()
+        self._futures = {}
+        self._durations = {}
+        self._lock = threading.Lock()
+
+    def submit(self, image_path):
+        """Empieza a preparar la imagen (si no se está preparando ya) y devuelve su Future."""
+        with self._lock:
+            future = self._futures.get(image_path)
+            if future is None:
+                future = self._pool.submit(self._prepare, image_path)
+                self._futures[image_path] = future
+                # Se notifica desde el callback para que el Future ya conste como terminado
+                future.add_done_callback(partial(self._notify, image_path))
+        return future
+
+    def is_ready(self, image_path):
+        return self.submit(image_path).done()
+
+    def result(self, image_path):
+        """Devuelve la referencia al blob preparado, esperando si aún se está procesando."""
+        return self.submit(image_path).result()
+
+    def duration(self, image_path):
+        """Segundos que tardó en prepararse la imagen (0 si salió de la caché)."""
+        with self._lock:
+            return self._durations.get(image_path, 0.0)
+
+    def discard(self, image_path):
+        """Olvida el Future de una ruta (p. ej. si el archivo ha cambiado). La caché se conserva."""
+        with self._lock:
+            self._futures.pop(image_path, None)
+            self._durations.pop(image_path, None)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
+
+    def _notify(self, image_path, future):
+        if future.exception() is not None:
+            self.image_failed.emit(image_path, str(future.exception()))
+        else:
+            self.image_ready.emit(image_path)
+
+    def _prepare(self, image_path):
+        start = time.perf_counter()
+        self.image_progress.emit(image_path, self.PROGRESS_STARTED)
+        with open(image_path, "rb") as image_file:
+            raw = image_file.read()
+        key = (hashlib.sha256(raw).hexdigest(), self.max_edge, self.max_pixels, self.quality)
+        self.image_progress.emit(image_path, self.PROGRESS_READ)
+
+        with self._lock:
+            ref = self._cache.get(key)
+            if ref is not None and ref in self.blob_store:
+                self._cache.move_to_end(key)
+                return ref
+
+        prepared = prepare_image(image_path, self.max_edge, self.max_pixels, self.quality, raw=raw)
+        self.image_progress.emit(image_path, self.PROGRESS_ENCODED)
+        ref = self.blob_store.put(prepared.data, prepared.mime_type)
+        with self._lock:
+            self._durations[image_path] = time.perf_counter() - start
+            self._cache[key] = ref
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return ref
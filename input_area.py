@@ -1,55 +1,251 @@
-# input_area.py
-# Componente de la UI para la entrada de texto e imagen del usuario.
-
-from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QTextEdit, QPushButton, QLabel, QFileDialog
-from PyQt5.QtGui import QPixmap
-from PyQt5.QtCore import Qt
-
-class InputArea(QWidget):
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.image_path = None
-
-        layout = QVBoxLayout(self)
-        text_layout = QHBoxLayout()
-
-        self.text_input = QTextEdit()
-        self.text_input.setPlaceholderText("Escribe tu mensaje aquí...")
-        self.text_input.setFixedHeight(80)
-        text_layout.addWidget(self.text_input)
-
-        self.image_preview = QLabel()
-        self.image_preview.setFixedSize(80, 80)
-        self.image_preview.setAlignment(Qt.AlignCenter)
-        self.image_preview.setStyleSheet("border: 1px solid #565c64; border-radius: 4px;")
-        text_layout.addWidget(self.image_preview)
-
-        layout.addLayout(text_layout)
-
-        button_layout = QHBoxLayout()
-        self.add_image_button = QPushButton("Añadir Imagen")
-        self.send_button = QPushButton("Enviar")
-
-        button_layout.addWidget(self.add_image_button)
-        button_layout.addWidget(self.send_button)
-        layout.addLayout(button_layout)
-
-        self.add_image_button.clicked.connect(self.add_image)
-
-    def add_image(self):
-        """Abre un diálogo para seleccionar un archivo de imagen."""
-        file_path, _ = QFileDialog.getOpenFileName(self, "Seleccionar Imagen", "", "Images (*.png *.jpg *.jpeg)")
-        if file_path:
-            self.image_path = file_path
-            pixmap = QPixmap(file_path)
-            self.image_preview.setPixmap(pixmap.scaled(80, 80, Qt.KeepAspectRatio, Qt.SmoothTransformation))
-
-    def get_input(self):
-        """Devuelve el texto y la ruta de la imagen seleccionada."""
-        return self.text_input.toPlainText().strip(), self.image_path
-
-    def clear_input(self):
-        """Limpia el área de entrada después de enviar un mensaje."""
-        self.text_input.clear()
-        self.image_preview.clear()
-        self.image_path = None
\ No newline at end of file
+# input_area.py
+# Componente de la UI para la entrada de texto e imágenes del usuario.
+
+import os
+import tempfile
+from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QTextEdit, QPushButton, QLabel, QFileDialog,
+                             QFrame, QProgressBar, QScrollArea, QToolButton, QSizePolicy)
+from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtGui import QImage
+
+from thumbnail_loader import ThumbnailLoader
+
+# Tamaño de la vista previa de cada imagen adjunta
+PREVIEW_SIZE = 80
+# Extensiones que se aceptan al soltar o pegar archivos
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp", ".gif")
+
+def _image_files(mime_data):
+    """Rutas locales de imágenes entre las URLs de un arrastre o del portapapeles."""
+    return [url.toLocalFile() for url in mime_data.urls()
+            if url.isLocalFile() and url.toLocalFile().lower().endswith(IMAGE_EXTENSIONS)]
+
+def _has_images(mime_data):
+    return mime_data.hasImage() or bool(_image_files(mime_data))
+
+class _MessageEdit(QTextEdit):
+    """Cuadro de texto que entrega a InputArea las imágenes pegadas o soltadas en lugar de insertarlas."""
+    images_inserted = pyqtSignal(object)
+
+    def canInsertFromMimeData(self, source):
+        return _has_images(source) or super().canInsertFromMimeData(source)
+
+    def insertFromMimeData(self, source):
+        if _has_images(source):
+            self.images_inserted.emit(source)
+        else:
+            super().insertFromMimeData(source)
+
+class _AttachmentView(QFrame):
+    """Miniatura de una imagen adjunta con su progreso de preparación y un botón para quitarla."""
+
+    def __init__(self, image_path, parent=None):
+        super().__init__(parent)
+        self.image_path = image_path
+        self.ready = False
+        self.failed = False
+        self.setToolTip(os.path.basename(image_path))
+        self.setFixedSize(PREVIEW_SIZE, PREVIEW_SIZE + 6)
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(2)
+        self.preview = QLabel()
+        self.preview.setFixedSize(PREVIEW_SIZE, PREVIEW_SIZE)
+        self.preview.setAlignment(Qt.AlignCenter)
+        self.preview.setStyleSheet("border: 1px solid #565c64; border-radius: 4px;")
+        self.progress = QProgressBar()
+        self.progress.setRange(0, 100)
+        self.progress.setTextVisible(False)
+        self.progress.setFixedSize(PREVIEW_SIZE, 4)
+        layout.addWidget(self.preview)
+        layout.addWidget(self.progress)
+
+        # El botón se coloca encima de la esquina de la miniatura
+        self.remove_button = QToolButton(self)
+        self.remove_button.setText("×")
+        self.remove_button.setToolTip("Quitar imagen")
+        self.remove_button.setFixedSize(18, 18)
+        self.remove_button.move(PREVIEW_SIZE - 20, 2)
+
+    def set_progress(self, percent):
+        if not self.ready and not self.failed:
+            self.progress.setValue(percent)
+
+    def set_ready(self):
+        self.ready = True
+        self.progress.setValue(100)
+
+    def set_failed(self, error):
+        self.failed = True
+        self.progress.setValue(100)
+        self.progress.setStyleSheet("QProgressBar::chunk { background-color: #e06c75; }")
+        self.setToolTip(f"{os.path.basename(self.image_path)}\nNo se pudo preparar: {error}")
+
+class InputArea(QWidget):
+    """
+    Texto del mensaje y sus imágenes adjuntas. Las imágenes se añaden con el botón,
+    pegándolas o soltándolas sobre el área; cada una se muestra con su progreso.
+    """
+    # Se emite con la ruta en cuanto se adjunta una imagen, para empezar a prepararla antes de enviar
+    image_selected = pyqtSignal(str)
+    # Se emite con la ruta de una imagen que el usuario quita antes de enviar
+    image_removed = pyqtSignal(str)
+
+    def __init__(self, thumbnail_loader=None, parent=None):
+        super().__init__(parent)
+        # Ruta -> vista de cada imagen adjunta, en el orden en que se añadieron
+        self._attachments = {}
+        # Directorio para las imágenes pegadas desde el portapapeles; se borra al salir
+        self._paste_directory = None
+        self._paste_count = 0
+        self.thumbnail_loader = thumbnail_loader or ThumbnailLoader(parent=self)
+        self.thumbnail_loader.thumbnail_ready.connect(self._on_thumbnail_ready)
+        self.setAcceptDrops(True)
+        # No crece más de lo necesario: al ocultar la tira de imágenes el espacio vuelve al chat
+        self.setSizePolicy(QSizePolicy.Preferred, QSizePolicy.Maximum)
+
+        layout = QVBoxLayout(self)
+
+        self.text_input = _MessageEdit()
+        self.text_input.setPlaceholderText("Escribe tu mensaje aquí...")
+        self.text_input.setFixedHeight(80)
+        layout.addWidget(self.text_input)
+
+        # Tira de imágenes adjuntas con desplazamiento horizontal; oculta mientras no hay ninguna
+        attachments_widget = QWidget()
+        self._attachments_layout = QHBoxLayout(attachments_widget)
+        self._attachments_layout.setContentsMargins(0, 0, 0, 0)
+        self._attachments_layout.addStretch()
+        self.attachments_area = QScrollArea()
+        self.attachments_area.setWidget(attachments_widget)
+        self.attachments_area.setWidgetResizable(True)
+        self.attachments_area.setFrameShape(QFrame.NoFrame)
+        self.attachments_area.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.attachments_area.setFixedHeight(PREVIEW_SIZE + 26)
+        self.attachments_area.hide()
+        layout.addWidget(self.attachments_area)
+
+        button_layout = QHBoxLayout()
+        self.add_image_button = QPushButton("Añadir Imágenes")
+        self.attachments_status = QLabel()
+        self.send_button = QPushButton("Enviar")
+        # Permite cortar una respuesta en streaming; solo está activo mientras se genera
+        self.stop_button = QPushButton("Detener")
+        self.stop_button.setEnabled(False)
+
+        button_layout.addWidget(self.add_image_button)
+        button_layout.addWidget(self.attachments_status)
+        button_layout.addWidget(self.send_button)
+        button_layout.addWidget(self.stop_button)
+        layout.addLayout(button_layout)
+
+        self.add_image_button.clicked.connect(self.add_image)
+        self.text_input.images_inserted.connect(self.add_images_from_mime)
+
+    def add_image(self):
+        """Abre un diálogo para seleccionar uno o varios archivos de imagen."""
+        file_paths, _ = QFileDialog.getOpenFileNames(self, "Seleccionar Imágenes", "",
+                                                     "Images (*.png *.jpg *.jpeg *.webp *.bmp *.gif)")
+        self.add_images(file_paths)
+
+    def add_images(self, image_paths):
+        """Adjunta las imágenes que aún no lo estaban y avisa para que empiecen a prepararse."""
+        for image_path in image_paths:
+            if image_path in self._attachments:
+                continue
+            view = _AttachmentView(image_path)
+            view.remove_button.clicked.connect(lambda _checked, path=image_path: self.remove_image(path))
+            self._attachments[image_path] = view
+            self._attachments_layout.insertWidget(self._attachments_layout.count() - 1, view)
+            # La vista previa se decodifica en segundo plano directamente a su tamaño final
+            self._show_preview(image_path)
+            self.image_selected.emit(image_path)
+        self._update_status()
+
+    def add_images_from_mime(self, mime_data):
+        """Adjunta los archivos de imagen de un arrastre o pegado, o la imagen del portapapeles."""
+        image_paths = _image_files(mime_data)
+        if not image_paths and mime_data.hasImage():
+            image_path = self._save_pasted_image(QImage(mime_data.imageData()))
+            if image_path:
+                image_paths = [image_path]
+        self.add_images(image_paths)
+
+    def _save_pasted_image(self, image):
+        if image.isNull():
+            return None
+        if self._paste_directory is None:
+            self._paste_directory = tempfile.TemporaryDirectory(prefix="lmstudio-paste-")
+        self._paste_count += 1
+        image_path = os.path.join(self._paste_directory.name, f"pegada-{self._paste_count}.png")
+        # Calidad 100 en PNG es sin compresión: se guarda al momento y la recodificación la hace el preprocesado
+        if not image.save(image_path, "PNG", 100):
+            return None
+        return image_path
+
+    def remove_image(self, image_path):
+        view = self._attachments.pop(image_path, None)
+        if view is None:
+            return
+        view.deleteLater()
+        self._update_status()
+        self.image_removed.emit(image_path)
+
+    def set_image_progress(self, image_path, percent):
+        view = self._attachments.get(image_path)
+        if view is not None:
+            view.set_progress(percent)
+
+    def set_image_ready(self, image_path):
+        view = self._attachments.get(image_path)
+        if view is not None:
+            view.set_ready()
+            self._update_status()
+
+    def set_image_failed(self, image_path, error):
+        view = self._attachments.get(image_path)
+        if view is not None:
+            view.set_failed(error)
+            self._update_status()
+
+    def _update_status(self):
+        views = list(self._attachments.values())
+        self.attachments_area.setVisible(bool(views))
+        if not views:
+            self.attachments_status.clear()
+            return
+        status = f"{sum(view.ready for view in views)}/{len(views)} imágenes listas"
+        failed = sum(view.failed for view in views)
+        if failed:
+            status += f", {failed} con error"
+        self.attachments_status.setText(status)
+
+    def _show_preview(self, image_path):
+        pixmap = self.thumbnail_loader.thumbnail(image_path, PREVIEW_SIZE)
+        if pixmap is not None:
+            self._attachments[image_path].preview.setPixmap(pixmap)
+
+    def _on_thumbnail_ready(self, image_path, size):
+        if image_path in self._attachments and size == PREVIEW_SIZE:
+            self._show_preview(image_path)
+
+    def dragEnterEvent(self, event):
+        if _has_images(event.mimeData()):
+            event.acceptProposedAction()
+
+    def dropEvent(self, event):
+        self.add_images_from_mime(event.mimeData())
+        event.acceptProposedAction()
+
+    def get_input(self):
+        """Devuelve el texto y las rutas de las imágenes adjuntas."""
+        return self.text_input.toPlainText().strip(), list(self._attachments)
+
+    def clear_input(self):
+        """Limpia el área de entrada después de enviar un mensaje."""
+        self.text_input.clear()
+        for view in self._attachments.values():
+            view.deleteLater()
+        self._attachments.clear()
+        self._update_status()
@@ -0,0 +1,363 @@
+# markdown_renderer.py
+# Renderizado incremental de Markdown para las respuestas del asistente.
+#
+# El texto se divide en bloques (párrafos, listas, bloques de código...) y cada
+# bloque cerrado se maqueta una sola vez en su propio QTextDocument. Mientras la
+# respuesta llega en streaming solo se vuelve a procesar el último bloque, el que
+# sigue abierto, así que el coste de cada frame no crece con la longitud de la
+# respuesta. El resaltado de sintaxis de los bloques de código se hace en un hilo
+# aparte con pygments (opcional) y se guarda en caché por bloque.
+
+import hashlib
+import html
+import importlib.util
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5.QtCore import QObject, QPointF, QRectF, pyqtSignal
+from PyQt5.QtGui import QAbstractTextDocumentLayout, QFont, QPalette, QTextCursor, QTextDocument
+
+# Apertura de un bloque de código: tres o más ` o ~ y, opcionalmente, el lenguaje
+_FENCE = re.compile(r"^ {0,3}(`{3,}|~{3,})[ \t]*([^`\s]*)")
+# Elemento de lista de primer nivel: punto donde se puede partir una lista larga
+_LIST_ITEM = re.compile(r"^(?:[-*+]|\d{1,9}[.)])[ \t]")
+
+def highlight_code(code, language, style="monokai"):
+    """
+    Devuelve el código como HTML con colores, sin envolver en <pre>, o None si
+    pygments no está instalado.
+    """
+    try:
+        from pygments import highlight
+        from pygments.formatters import HtmlFormatter
+        from pygments.lexers import TextLexer, get_lexer_by_name
+        from pygments.util import ClassNotFound
+    except ImportError:
+        return None
+    try:
+        lexer = get_lexer_by_name(language) if language else TextLexer()
+    except ClassNotFound:
+        lexer = TextLexer()
+    try:
+        formatter = HtmlFormatter(nowrap=True, noclasses=True, style=style)
+    except ClassNotFound:
+        formatter = HtmlFormatter(nowrap=True, noclasses=True)
+    return highlight(code, lexer, formatter)
+
+class MarkdownBlock:
+    """Un bloque de Markdown de primer nivel. Los bloques de código guardan su lenguaje y su código."""
+    __slots__ = ("source", "language", "code")
+
+    def __init__(self, source, fence=None):
+        self.source = source
+        self.language = None
+        self.code = None
+        if fence is not None:
+            marker, self.language = fence
+            lines = source.split("\n")[1:]
+            # Se quita la valla de cierre, si la hay
+            while lines and not lines[-1].strip():
+                lines.pop()
+            if lines and lines[-1].strip().startswith(marker) and set(lines[-1].strip()) == {marker[0]}:
+                lines.pop()
+            self.code = "\n".join(lines)
+
+class MarkdownStream:
+    """
+    Divide en bloques un texto Markdown que crece por el final.
+
+    feed() recibe el texto completo, pero solo recorre las líneas nuevas: los bloques
+    ya cerrados no se vuelven a mirar. Un bloque se cierra con una línea en blanco o,
+    en los de código, con su valla de cierre. Una lista sin líneas en blanco se parte
+    en bloques de unas SPLIT_LINES líneas, siempre al comienzo de un elemento, para
+    que el bloque abierto (que se vuelve a maquetar en cada frame) no crezca sin límite.
+    """
+    SPLIT_LINES = 50
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.text = ""
+        self.final = False
+        # Comienzo de la primera línea aún no procesada y del bloque abierto
+        self._scan = 0
+        self._block_start = 0
+        # (valla, lenguaje) mientras se está dentro de un bloque de código
+        self._fence = None
+        # Líneas del bloque abierto (fuera de bloques de código)
+        self._block_lines = 0
+
+    def feed(self, text, final=False):
+        """
+        Procesa el texto y devuelve (reiniciado, bloques cerrados nuevos). 'reiniciado'
+        es True si el texto no continúa el anterior y hay que descartar los bloques previos.
+        Con 'final' el texto está completo y el último bloque también se cierra.
+        """
+        if text == self.text and final == self.final:
+            return False, []
+        restarted = self.final or not text.startswith(self.text)
+        if restarted:
+            self.reset()
+        self.text = text
+        self.final = final
+
+        blocks = []
+        while self._scan < len(text):
+            end = text.find("\n", self._scan)
+            if end < 0:
+                # La última línea está incompleta hasta que llega su salto o termina el texto
+                if not final:
+                    break
+                end = len(text)
+            self._process_line(text, self._scan, end, blocks)
+            self._scan = end + 1
+        if final:
+            self._close_block(text, len(text), blocks)
+            self._block_start = len(text)
+        return restarted, blocks
+
+    def open_block(self):
+        """Bloque aún abierto al final del texto (puede estar vacío)."""
+        return MarkdownBlock(self.text[self._block_start:], self._fence)
+
+    def _process_line(self, text, start, end, blocks):
+        line = text[start:end]
+        stripped = line.strip()
+        if self._fence is not None:
+            marker = self._fence[0]
+            if stripped.startswith(marker) and set(stripped) == {marker[0]}:
+                self._close_block(text, end, blocks)
+                self._block_start = end + 1
+            return
+        if not stripped:
+            self._close_block(text, start, blocks)
+            self._block_start = end + 1
+            self._block_lines = 0
+            return
+        match = _FENCE.match(line)
+        if match:
+            # Un bloque de código empieza aunque no lo preceda una línea en blanco
+            self._close_block(text, start, blocks)
+            self._block_start = start
+            self._block_lines = 0
+            self._fence = (match.group(1), match.group(2))
+            return
+        if self._block_lines >= self.SPLIT_LINES and _LIST_ITEM.match(line):
+            self._close_block(text, start, blocks)
+            self._block_start = start
+            self._block_lines = 0
+        self._block_lines += 1
+
+    def _close_block(self, text, end, blocks):
+        source = text[self._block_start:end]
+        if source.strip():
+            blocks.append(MarkdownBlock(source, self._fence))
+        self._fence = None
+
+class CodeHighlighter(QObject):
+    """
+    Resalta bloques de código en un hilo aparte y guarda el HTML en una caché LRU
+    limitada en bytes, indexada por el hash del lenguaje y el código.
+
+    'highlight()' devuelve (clave, HTML) si ya está en caché; si no, lo encarga y el
+    HTML es None. Cuando está listo se emite 'highlighted' con la clave. Sin pygments
+    el código se devuelve escapado al momento, sin colores.
+    """
+    highlighted = pyqtSignal(str)
+    # Uso interno: lleva el HTML del hilo de trabajo al hilo de la UI
+    _highlight_done = pyqtSignal(str, str)
+
+    def __init__(self, style="monokai", cache_limit=4 * 1024 * 1024, parent=None):
+        super().__init__(parent)
+        self.style = style
+        self.cache_limit = cache_limit
+        # Se comprueba sin importarlo: pygments solo se carga en el hilo de trabajo
+        self.available = importlib.util.find_spec("pygments") is not None
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="code-highlight")
+        self._highlight_done.connect(self._store)
+
+    def highlight(self, code, language):
+        key = hashlib.sha1(f"{language}\0{code}".encode("utf-8")).hexdigest()
+        if not self.available:
+            return key, html.escape(code)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            return key, cached
+        with self._lock:
+            if key not in self._pending:
+                self._pending.add(key)
+                self._pool.submit(self._highlight, key, code, language)
+        return key, None
+
+    def highlight_cached(self, key):
+        """HTML ya resaltado de 'key', o None si no está en caché."""
+        return self._cache.get(key)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
+
+    def _highlight(self, key, code, language):
+        highlighted = highlight_code(code, language, self.style)
+        self._highlight_done.emit(key, highlighted if highlighted is not None else html.escape(code))
+
+    def _store(self, key, highlighted):
+        with self._lock:
+            self._pending.discard(key)
+        self._cache[key] = highlighted
+        self._cache_bytes += len(highlighted)
+        while self._cache_bytes > self.cache_limit and len(self._cache) > 1:
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_bytes -= len(evicted)
+        self.highlighted.emit(key)
+
+class RenderedMarkdown:
+    """
+    Maquetación de un mensaje: un QTextDocument por bloque cerrado más el del bloque
+    abierto. Los bloques de código se muestran sin colores hasta que llega su resaltado.
+
+    Mientras llega un bloque de código, a su documento solo se le añaden las líneas
+    nuevas: maquetar cada frame el bloque entero haría que el coste creciera con su
+    longitud. Se maqueta completo y se resalta una sola vez, al cerrarse.
+    """
+    BLOCK_SPACING = 6
+    CODE_BACKGROUND = "#272822"
+
+    def __init__(self, highlighter, font):
+        self.highlighter = highlighter
+        self.font = QFont(font)
+        self._stream = MarkdownStream()
+        self._documents = []
+        self._open_document = None
+        # Código ya volcado en el documento del bloque abierto, si es de código
+        self._open_code = None
+        self._width = None
+        # Clave de resaltado -> posiciones de los bloques que lo esperan
+        self._pending = {}
+
+    def update(self, text, final=True):
+        """Añade lo nuevo de 'text'; solo se vuelve a maquetar el último bloque."""
+        if text == self._stream.text and final == self._stream.final:
+            return
+        restarted, blocks = self._stream.feed(text, final)
+        if restarted:
+            self._documents = []
+            self._pending = {}
+        for block in blocks:
+            self._documents.append(self._block_document(block, len(self._documents)))
+        open_block = self._stream.open_block()
+        if (not restarted and not blocks and self._open_code and open_block.code is not None
+                and open_block.code.startswith(self._open_code)):
+            # El mismo bloque de código ha crecido: solo se añade el final
+            self._append_code(open_block.code[len(self._open_code):])
+            self._open_code = open_block.code
+            return
+        self._open_document = None
+        self._open_code = None
+        if open_block.source.strip():
+            # El bloque abierto cambia en cada frame; su código se resalta cuando se cierre
+            self._open_document = self._make_document(open_block, self._plain_code(open_block))
+            self._open_code = open_block.code
+
+    def apply_highlight(self, key, highlighted):
+        """Sustituye los bloques que esperaban el resaltado 'key'. Devuelve True si cambió algo."""
+        positions = self._pending.pop(key, None)
+        if not positions:
+            return False
+        for position in positions:
+            document = self._documents[position]
+            document.setHtml(self._code_html(highlighted))
+        return True
+
+    def height(self, width):
+        self._set_width(width)
+        documents = self._all_documents()
+        if not documents:
+            return 0
+        total = sum(document.size().height() for document in documents)
+        return int(total + self.BLOCK_SPACING * (len(documents) - 1)) + 1
+
+    def paint(self, painter, left, top, width, clip, color):
+        """Dibuja los bloques que caen dentro de 'clip' a partir de (left, top)."""
+        self._set_width(width)
+        context = QAbstractTextDocumentLayout.PaintContext()
+        context.palette.setColor(QPalette.Text, color)
+        y = top
+        for document in self._all_documents():
+            height = document.size().height()
+            if y > clip.bottom():
+                break
+            if y + height >= clip.top():
+                painter.save()
+                painter.translate(QPointF(left, y))
+                context.clip = QRectF(clip.translated(-left, -int(y)))
+                document.documentLayout().draw(painter, context)
+                painter.restore()
+            y += height + self.BLOCK_SPACING
+
+    def memory_bytes(self):
+        """Estimación de lo que ocupan los documentos maquetados."""
+        return sum(4 * document.characterCount() + 1024 for document in self._all_documents())
+
+    def _all_documents(self):
+        if self._open_document is None:
+            return self._documents
+        return self._documents + [self._open_document]
+
+    def _set_width(self, width):
+        if width == self._width:
+            return
+        self._width = width
+        for document in self._all_documents():
+            document.setTextWidth(width)
+
+    def _block_document(self, block, position):
+        if block.code is None:
+            return self._make_document(block, None)
+        key, highlighted = self.highlighter.highlight(block.code, block.language)
+        if highlighted is None:
+            self._pending.setdefault(key, []).append(position)
+            highlighted = self._plain_code(block)
+        return self._make_document(block, highlighted)
+
+    def _make_document(self, block, code_html):
+        document = QTextDocument()
+        document.setDefaultFont(self.font)
+        document.setDocumentMargin(0)
+        if block.code is None:
+            document.setMarkdown(block.source)
+        else:
+            document.setHtml(self._code_html(code_html))
+        if self._width is not None:
+            document.setTextWidth(self._width)
+        return document
+
+    def _append_code(self, code):
+        """Añade 'code' al final del documento del bloque abierto con el formato del <pre>."""
+        cursor = QTextCursor(self._open_document)
+        cursor.movePosition(QTextCursor.End)
+        first, *lines = code.split("\n")
+        cursor.insertText(first)
+        for line in lines:
+            # Cada línea es un párrafo: el margen inferior del <pre> pasa a la nueva última
+            block_format = cursor.blockFormat()
+            bottom_margin = block_format.bottomMargin()
+            block_format.setBottomMargin(0)
+            cursor.setBlockFormat(block_format)
+            block_format.setTopMargin(0)
+            block_format.setBottomMargin(bottom_margin)
+            cursor.insertBlock(block_format, cursor.charFormat())
+            cursor.insertText(line)
+
+    @staticmethod
+    def _plain_code(block):
+        return html.escape(block.code) if block.code is not None else None
+
+    def _code_html(self, code_html):
+        return f'<pre style="background-color: {self.CODE_BACKGROUND}; font-family: monospace;">{code_html}</pre>'
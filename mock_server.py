@@ -0,0 +1,218 @@
+# mock_server.py
+# Servidor local que imita la API compatible con OpenAI de LM Studio, para
+# benchmarks y pruebas sin un modelo real.
+#
+# Uso: python mock_server.py [--port 1234] [--token-rate 50] [--prefill-ms 200]
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+class MockSettings:
+    """Comportamiento simulado del servidor."""
+
+    def __init__(self, prefill_ms=50.0, prefill_ms_per_kb=0.0, token_rate=200.0, response_tokens=64,
+                 models=("local-model",), prompt_cache=False, embedding_dimension=64):
+        """
+        Args:
+            prefill_ms: Espera fija antes del primer token.
+            prefill_ms_per_kb: Espera adicional por cada KB del cuerpo de la petición.
+            token_rate: Tokens generados por segundo (0 = sin espera).
+            response_tokens: Tokens de cada respuesta si la petición no pide menos.
+            models: Ids devueltos por /v1/models.
+            prompt_cache: Si es True, imita la caché de prompt de llama.cpp: la espera por KB
+                solo se aplica a la parte de los mensajes que no coincide con la petición anterior.
+            embedding_dimension: Longitud de los vectores de /v1/embeddings.
+        """
+        self.prefill_ms = prefill_ms
+        self.prefill_ms_per_kb = prefill_ms_per_kb
+        self.token_rate = token_rate
+        self.response_tokens = response_tokens
+        self.models = list(models)
+        self.prompt_cache = prompt_cache
+        self.embedding_dimension = embedding_dimension
+
+def mock_embedding(text, dimension=64):
+    """
+    Vector de una "bolsa de palabras" con hashing: textos que comparten palabras se
+    parecen, lo suficiente para probar la búsqueda semántica sin un modelo real.
+    """
+    vector = [0.0] * dimension
+    for word in re.findall(r"\w+", text.lower()):
+        digest = hashlib.md5(word.encode("utf-8")).digest()
+        vector[int.from_bytes(digest[:4], "little") % dimension] += 1.0 if digest[4] & 1 else -1.0
+    return vector
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def settings(self):
+        return self.server.settings
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/v1/models":
+            self._send_json({"object": "list", "data": [{"id": model, "object": "model"} for model in self.settings.models]})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        body = self._read_body()
+        self.server.record_request(self.path, len(body))
+        path = self.path.rstrip("/")
+        if path not in ("/v1/chat/completions", "/v1/embeddings"):
+            self._send_json({"error": "not found"}, status=404)
+            return
+        try:
+            request = json.loads(body)
+        except json.JSONDecodeError:
+            self._send_json({"error": "invalid json"}, status=400)
+            return
+        if path == "/v1/embeddings":
+            self._send_embeddings(request)
+            return
+
+        settings = self.settings
+        tokens = min(settings.response_tokens, request.get("max_tokens") or settings.response_tokens)
+        usage = {"prompt_tokens": len(body) // 4, "completion_tokens": tokens,
+                 "total_tokens": len(body) // 4 + tokens}
+        uncached = len(body)
+        if settings.prompt_cache:
+            prompt = json.dumps(request.get("messages", []), separators=(",", ":")).encode("utf-8")
+            uncached -= self.server.cached_prefix(prompt)
+        time.sleep((settings.prefill_ms + settings.prefill_ms_per_kb * uncached / 1024) / 1000)
+        delay = 1 / settings.token_rate if settings.token_rate else 0
+
+        if request.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for index in range(tokens):
+                if delay:
+                    time.sleep(delay)
+                chunk = {"choices": [{"index": 0, "delta": {"content": f"tok{index} "}}]}
+                self._send_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            final = {"choices": [{"index": 0, "delta": {}, "finish_reason": "length"}], "usage": usage}
+            self._send_chunk(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+            self._send_chunk(b"data: [DONE]\n\n")
+            self._send_chunk(b"")
+        else:
+            if delay:
+                time.sleep(delay * tokens)
+            content = "".join(f"tok{index} " for index in range(tokens))
+            self._send_json({"choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                          "finish_reason": "length"}], "usage": usage})
+
+    def _send_embeddings(self, request):
+        inputs = request.get("input", "")
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        time.sleep(self.settings.prefill_ms / 1000)
+        data = [{"object": "embedding", "index": index,
+                 "embedding": mock_embedding(text, self.settings.embedding_dimension)}
+                for index, text in enumerate(inputs)]
+        tokens = sum(len(text) for text in inputs) // 4
+        self._send_json({"object": "list", "data": data, "model": request.get("model", "local-model"),
+                         "usage": {"prompt_tokens": tokens, "total_tokens": tokens}})
+
+    def _read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            parts = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return b"".join(parts)
+                parts.append(self.rfile.read(size))
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _send_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, payload, status=200):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+class MockServer(ThreadingHTTPServer):
+    """
+    Servidor de pruebas. Con port=0 se elige un puerto libre; la URL base queda en 'base_url'.
+    Puede usarse como gestor de contexto para arrancarlo y pararlo en segundo plano.
+    """
+    daemon_threads = True
+
+    def __init__(self, settings=None, host="127.0.0.1", port=0):
+        super().__init__((host, port), _Handler)
+        self.settings = settings or MockSettings()
+        self.requests = []
+        self._requests_lock = threading.Lock()
+        self._last_prompt = b""
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def record_request(self, path, body_bytes):
+        with self._requests_lock:
+            self.requests.append((path, body_bytes))
+
+    def cached_prefix(self, prompt):
+        """Devuelve cuántos bytes del prompt coinciden con el anterior y lo guarda como nuevo prefijo en caché."""
+        with self._requests_lock:
+            cached = len(os.path.commonprefix([self._last_prompt, prompt]))
+            self._last_prompt = prompt
+        return cached
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor simulado compatible con la API de LM Studio.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1234)
+    parser.add_argument("--prefill-ms", type=float, default=50.0)
+    parser.add_argument("--prefill-ms-per-kb", type=float, default=0.0)
+    parser.add_argument("--token-rate", type=float, default=50.0, help="Tokens por segundo (0 = instantáneo).")
+    parser.add_argument("--response-tokens", type=int, default=64)
+    parser.add_argument("--prompt-cache", action="store_true", help="Simula la caché de prompt del servidor.")
+    args = parser.parse_args(argv)
+
+    settings = MockSettings(args.prefill_ms, args.prefill_ms_per_kb, args.token_rate, args.response_tokens,
+                            prompt_cache=args.prompt_cache)
+    server = MockServer(settings, args.host, args.port)
+    print(f"Servidor simulado en {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
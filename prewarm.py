@@ -0,0 +1,103 @@
+# prewarm.py
+# Precalentado de la caché de prompt del servidor mientras el usuario escribe.
+#
+# En equipos modestos el procesado del historial (prefill) domina el tiempo hasta
+# el primer token. Si mientras se redacta el mensaje se envía ese mismo historial
+# pidiendo un solo token, el servidor lo deja en su caché de prompt y, al pulsar
+# Enviar, solo tiene que procesar lo que falta.
+
+import threading
+import time
+from PyQt5.QtCore import QObject, QTimer
+
+class PrefixPrewarmer(QObject):
+    """
+    Lanza, tras una pausa al escribir, una petición de precalentado con el prefijo actual.
+
+    Solo hay un precalentado en curso a la vez y nunca más de uno cada
+    'min_interval' segundos. Se ejecuta en un hilo propio, así que no ocupa los
+    hilos de las peticiones reales; cancel() lo descarta al enviar el mensaje.
+    El servidor no puede interrumpir un prefill ya empezado, pero ese trabajo es
+    el mismo prefijo que necesita la petición real.
+    """
+
+    def __init__(self, api_client, debounce_ms=800, min_interval=5.0, parent=None):
+        super().__init__(parent)
+        self.api_client = api_client
+        self.debounce_ms = debounce_ms
+        self.min_interval = min_interval
+        self._messages = None
+        self._cancel_event = None
+        self._thread = None
+        self._last_started = float("-inf")
+        # Se activa cuando un precalentado termina; consume() lo consulta y lo reinicia
+        self._warmed = threading.Event()
+        # TTFT acumulado (suma, número de peticiones) con y sin precalentado
+        self._ttft = {True: [0.0, 0], False: [0.0, 0]}
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._fire)
+
+    def schedule(self, messages):
+        """Programa el precalentado de 'messages'; cada llamada reinicia la espera."""
+        self._messages = messages
+        self._timer.start(self.debounce_ms)
+
+    def cancel(self):
+        """Anula el precalentado pendiente y abandona el que esté en curso."""
+        self._timer.stop()
+        self._messages = None
+        if self._cancel_event is not None:
+            self._cancel_event.set()
+
+    def consume(self):
+        """
+        Cancela lo pendiente y devuelve True si el servidor quedó precalentado desde la
+        última llamada. Se usa al enviar el mensaje real.
+        """
+        self.cancel()
+        warmed = self._warmed.is_set()
+        self._warmed.clear()
+        return warmed
+
+    def record(self, metrics):
+        """Acumula el tiempo hasta el primer token de una petición real para comparar."""
+        if metrics.ttft_s is None or metrics.cached:
+            return
+        totals = self._ttft[bool(metrics.prewarmed)]
+        totals[0] += metrics.ttft_s
+        totals[1] += 1
+
+    def summary(self):
+        """Compara el TTFT medio con y sin precalentado, o None si aún no hay datos."""
+        parts = []
+        for prewarmed, label in ((True, "con precalentado"), (False, "sin él")):
+            total, count = self._ttft[prewarmed]
+            if count:
+                parts.append(f"{total / count:.2f} s {label}")
+        return f"TTFT medio {' / '.join(parts)}" if parts else None
+
+    def _fire(self):
+        if self._messages is None:
+            return
+        if self._thread is not None and self._thread.is_alive():
+            # Ya hay uno en curso; se vuelve a intentar con el borrador más reciente al terminar la espera
+            self._timer.start(self.debounce_ms)
+            return
+        wait = self._last_started + self.min_interval - time.monotonic()
+        if wait > 0:
+            self._timer.start(int(wait * 1000))
+            return
+
+        messages, self._messages = self._messages, None
+        self._last_started = time.monotonic()
+        self._cancel_event = cancel_event = threading.Event()
+        self._warmed.clear()
+
+        def run():
+            if self.api_client.prewarm(messages, cancel_event) and not cancel_event.is_set():
+                self._warmed.set()
+
+        self._thread = threading.Thread(target=run, name="prefix-prewarm", daemon=True)
+        self._thread.start()
@@ -0,0 +1,318 @@
+# raw_inspector.py
+# Inspector de los mensajes raw como un árbol navegable.
+#
+# En lugar de volcar todo el historial a un JSON indentado, cada nodo del árbol se
+# crea cuando la vista lo necesita (al desplegar su padre o al hacerse visible), y
+# solo el nodo seleccionado se serializa completo en el panel inferior. Abrir el
+# inspector cuesta lo mismo con diez mensajes que con veinte mil.
+
+import json
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QCheckBox, QLineEdit, QPushButton, QLabel,
+                             QTreeView, QTextEdit, QSplitter, QHeaderView)
+from PyQt5.QtCore import Qt, QAbstractItemModel, QModelIndex
+
+from blob_store import is_blob_ref
+from session_store import message_text
+
+class _Node:
+    """
+    Un valor del historial y los hijos ya creados. El número de hijos y las claves se
+    fijan al crear el nodo, así los mensajes que lleguen después no descuadran el modelo.
+    """
+    __slots__ = ("key", "value", "parent", "row", "_keys", "_count", "_children")
+
+    def __init__(self, key, value, parent, row):
+        self.key = key
+        self.value = value
+        self.parent = parent
+        self.row = row
+        self._keys = list(value) if isinstance(value, dict) else None
+        self._count = len(value) if isinstance(value, (dict, list)) else 0
+        self._children = {}
+
+    def child_count(self):
+        return self._count
+
+    def child(self, row):
+        node = self._children.get(row)
+        if node is None:
+            if self._keys is not None:
+                key = self._keys[row]
+            else:
+                key = row
+            node = self._children[row] = _Node(key, self.value[key], self, row)
+        return node
+
+    def child_row(self, key):
+        """Fila del hijo con la clave (o índice) 'key', o None si no existe."""
+        if self._keys is not None:
+            return self._keys.index(key) if key in self._keys else None
+        return key if isinstance(key, int) and 0 <= key < self._count else None
+
+    def path(self):
+        keys = []
+        node = self
+        while node.parent is not None:
+            keys.append(node.key)
+            node = node.parent
+        return tuple(reversed(keys))
+
+def _iter_matches(value, path, needle):
+    """
+    Recorre un valor en el mismo orden que el árbol y devuelve las rutas cuya clave o
+    valor contiene 'needle' (ya en minúsculas). Las referencias a imágenes no se buscan.
+    """
+    if isinstance(value, dict):
+        for key, child in value.items():
+            child_path = path + (key,)
+            if needle in str(key).lower():
+                yield child_path
+                continue
+            yield from _iter_matches(child, child_path, needle)
+    elif isinstance(value, list):
+        for index, child in enumerate(value):
+            yield from _iter_matches(child, path + (index,), needle)
+    elif isinstance(value, str):
+        if not is_blob_ref(value) and needle in value.lower():
+            yield path
+    elif value is not None and needle in str(value).lower():
+        yield path
+
+class RawMessagesModel(QAbstractItemModel):
+    """Modelo de árbol de dos columnas (clave y valor) sobre la lista de mensajes raw."""
+    COLUMNS = ("Clave", "Valor")
+    # Caracteres de una cadena que se muestran en el árbol; el resto, en el panel de detalle
+    PREVIEW_CHARS = 200
+    # Mensajes de primer nivel que se añaden a la vista cada vez que se llega al final
+    FETCH_BATCH = 200
+
+    def __init__(self, raw_history, parent=None):
+        super().__init__(parent)
+        self._root = _Node(None, raw_history, None, 0)
+        # La vista recorre todas las filas de primer nivel al organizarse, así que se le
+        # entregan por lotes (canFetchMore/fetchMore) a medida que se desplaza
+        self._fetched = min(self.FETCH_BATCH, self._root.child_count())
+
+    def total_messages(self):
+        return self._root.child_count()
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._fetched < self._root.child_count()
+
+    def fetchMore(self, parent=QModelIndex()):
+        self.fetch_until(self._fetched + self.FETCH_BATCH - 1)
+
+    def fetch_until(self, row):
+        """Entrega a la vista los mensajes de primer nivel hasta 'row' incluido."""
+        count = min(row + 1, self._root.child_count())
+        if count > self._fetched:
+            self.beginInsertRows(QModelIndex(), self._fetched, count - 1)
+            self._fetched = count
+            self.endInsertRows()
+
+    def node(self, index):
+        return index.internalPointer() if index.isValid() else self._root
+
+    def index(self, row, column, parent=QModelIndex()):
+        if not self.hasIndex(row, column, parent):
+            return QModelIndex()
+        return self.createIndex(row, column, self.node(parent).child(row))
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        parent = index.internalPointer().parent
+        if parent is None or parent is self._root:
+            return QModelIndex()
+        return self.createIndex(parent.row, 0, parent)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        if not parent.isValid():
+            return self._fetched
+        return self.node(parent).child_count()
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(self.COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.COLUMNS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        node = index.internalPointer()
+        if index.column() == 0:
+            return f"Mensaje {node.row + 1}" if node.parent is self._root else str(node.key)
+        return self._preview(node)
+
+    def index_for_path(self, path):
+        """Índice del nodo en la ruta de claves 'path', creando solo los nodos intermedios."""
+        if path:
+            self.fetch_until(path[0])
+        index = QModelIndex()
+        for key in path:
+            row = self.node(index).child_row(key)
+            if row is None:
+                return QModelIndex()
+            index = self.index(row, 0, index)
+        return index
+
+    def _preview(self, node):
+        value = node.value
+        if node.parent is self._root and isinstance(value, dict):
+            # Los mensajes de primer nivel se resumen con el comienzo de lo que escribió el usuario
+            sent = value.get("sent")
+            text = " ".join(message_text(sent).split()) if isinstance(sent, dict) else ""
+            return text[:self.PREVIEW_CHARS]
+        if isinstance(value, dict):
+            return f"{{…}} {node.child_count()} claves"
+        if isinstance(value, list):
+            return f"[…] {node.child_count()} elementos"
+        if isinstance(value, str):
+            if is_blob_ref(value):
+                return f"{value} (imagen)"
+            preview = json.dumps(value[:self.PREVIEW_CHARS], ensure_ascii=False)
+            if len(value) > self.PREVIEW_CHARS:
+                preview += f" … (+{len(value) - self.PREVIEW_CHARS} caracteres)"
+            return preview
+        return json.dumps(value)
+
+class RawMessagesDialog(QDialog):
+    """
+    Ventana con el árbol de mensajes raw, un buscador y el detalle del nodo seleccionado.
+
+    Las imágenes aparecen como referencias; con "Mostrar contenido de imágenes" el
+    detalle las sustituye por su base64, solo para el nodo seleccionado.
+    """
+
+    def __init__(self, raw_history, blob_store, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Mensajes Raw (JSON)")
+        self.setGeometry(150, 150, 700, 500)
+        # Al cerrarse se destruye con su modelo y suelta la referencia al historial
+        self.setAttribute(Qt.WA_DeleteOnClose)
+        self.raw_history = raw_history
+        self.blob_store = blob_store
+
+        layout = QVBoxLayout(self)
+
+        # Layout horizontal para los checkboxes de control
+        controls_layout = QHBoxLayout()
+        self.base64_checkbox = QCheckBox("Mostrar contenido de imágenes (base64)")
+        self.wrap_checkbox = QCheckBox("Habilitar Word Wrap")
+        controls_layout.addWidget(self.base64_checkbox)
+        controls_layout.addWidget(self.wrap_checkbox)
+
+        search_layout = QHBoxLayout()
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Buscar en los mensajes...")
+        self.search_button = QPushButton("Siguiente")
+        self.search_status = QLabel()
+        search_layout.addWidget(self.search_input)
+        search_layout.addWidget(self.search_button)
+        search_layout.addWidget(self.search_status)
+
+        self.model = RawMessagesModel(raw_history, self)
+        self.tree = QTreeView()
+        # Con filas de altura uniforme la vista solo consulta los nodos visibles
+        self.tree.setUniformRowHeights(True)
+        self.tree.setModel(self.model)
+        self.tree.header().setSectionResizeMode(0, QHeaderView.Interactive)
+        self.tree.header().resizeSection(0, 200)
+        self.tree.header().setStretchLastSection(True)
+
+        self.detail = QTextEdit()
+        self.detail.setReadOnly(True)
+        # Estado inicial sin ajuste de línea para mejor rendimiento
+        self.detail.setLineWrapMode(QTextEdit.NoWrap)
+
+        splitter = QSplitter(Qt.Vertical)
+        splitter.addWidget(self.tree)
+        splitter.addWidget(self.detail)
+        splitter.setStretchFactor(0, 3)
+        splitter.setStretchFactor(1, 1)
+
+        layout.addLayout(controls_layout)
+        layout.addLayout(search_layout)
+        layout.addWidget(splitter)
+
+        self.tree.selectionModel().currentChanged.connect(self._show_detail)
+        self.base64_checkbox.stateChanged.connect(lambda _state: self._show_detail(self.tree.currentIndex()))
+        self.wrap_checkbox.stateChanged.connect(self._toggle_word_wrap)
+        self.search_input.returnPressed.connect(self.find_next)
+        self.search_input.textChanged.connect(lambda _text: self.search_status.clear())
+        self.search_button.clicked.connect(self.find_next)
+
+    def _toggle_word_wrap(self, state):
+        if state == Qt.Checked:
+            self.detail.setLineWrapMode(QTextEdit.WidgetWidth)
+        else:
+            self.detail.setLineWrapMode(QTextEdit.NoWrap)
+
+    def _show_detail(self, index):
+        """Serializa solo el nodo seleccionado; las cadenas se muestran completas y sin escapar."""
+        if not index.isValid():
+            self.detail.clear()
+            return
+        value = self.model.node(index).value
+        if self.base64_checkbox.isChecked():
+            value = self._resolve_images(value)
+        if isinstance(value, str):
+            self.detail.setPlainText(value)
+        else:
+            self.detail.setPlainText(json.dumps(value, indent=2, ensure_ascii=False))
+
+    def _resolve_images(self, value):
+        """Copia del valor con las referencias a imágenes sustituidas por data URLs."""
+        if isinstance(value, str):
+            if is_blob_ref(value) and value in self.blob_store:
+                return self.blob_store.data_url(value)
+            return value
+        if isinstance(value, dict):
+            return {key: self._resolve_images(child) for key, child in value.items()}
+        if isinstance(value, list):
+            return [self._resolve_images(child) for child in value]
+        return value
+
+    def find_next(self):
+        """
+        Selecciona la siguiente coincidencia tras la selección actual, mensaje a mensaje y
+        volviendo al principio al llegar al final. No serializa el historial.
+        """
+        needle = self.search_input.text().strip().lower()
+        if not needle or not self.raw_history:
+            return
+        total = self.model.total_messages()
+        current = self.tree.currentIndex()
+        current_path = self.model.node(current).path() if current.isValid() else ()
+        start_row = current_path[0] if current_path else 0
+
+        for offset in range(total + 1):
+            row = (start_row + offset) % total
+            matches = _iter_matches(self.raw_history[row], (row,), needle)
+            if offset == 0 and current_path:
+                # En el mensaje seleccionado solo cuentan las coincidencias posteriores a la selección
+                matches = list(matches)
+                if current_path in matches:
+                    matches = matches[matches.index(current_path) + 1:]
+                elif len(current_path) > 1:
+                    matches = []
+            path = next(iter(matches), None)
+            if path is not None:
+                self._select_path(path)
+                self.search_status.setText(f"Mensaje {row + 1} de {total}")
+                return
+        self.search_status.setText("Sin resultados")
+
+    def _select_path(self, path):
+        index = self.model.index_for_path(path)
+        parent = index.parent()
+        while parent.isValid():
+            self.tree.expand(parent)
+            parent = parent.parent()
+        self.tree.setCurrentIndex(index)
+        self.tree.scrollTo(index)
@@ -0,0 +1,159 @@
+# request_body.py
+# Construcción incremental del cuerpo JSON de las peticiones a chat/completions.
+
+import base64
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from blob_store import BLOB_URL_PREFIX
+
+# Referencias a blobs dentro del JSON compacto de un mensaje. Solo se sustituyen
+# las que ocupan el valor completo de un campo "url".
+_BLOB_URL_PATTERN = re.compile(r'(?<="url":")' + re.escape(BLOB_URL_PREFIX) + r'[0-9a-f]{64}(?=")')
+
+# Bytes en bruto que se codifican de una vez al volcar una imagen (múltiplo de 3 para no partir el base64)
+_BLOB_CHUNK_SIZE = 3 * 64 * 1024
+
+class StreamedBody:
+    """
+    Cuerpo de petición que se genera a medida que http.client lo lee.
+
+    Se compone de fragmentos JSON ya serializados y de referencias a blobs cuyo
+    base64 se produce por bloques durante el envío, de modo que nunca existe una
+    copia completa del cuerpo en memoria. La longitud se conoce de antemano, así
+    que se envía con Content-Length normal. seek(0) permite reenviarlo al reintentar.
+
+    'first_read_at' y 'finished_at' guardan (con time.perf_counter) cuándo empezó y
+    terminó de leerse, es decir, cuándo la conexión quedó lista y cuándo se completó la subida.
+    """
+
+    def __init__(self, segments, blob_store=None):
+        self._segments = segments
+        self._blob_store = blob_store
+        self._length = sum(self._segment_length(segment) for segment in segments)
+        self.seek(0)
+
+    def __len__(self):
+        return self._length
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=0):
+        if offset != 0 or whence != 0:
+            raise ValueError("StreamedBody solo admite seek(0)")
+        self._position = 0
+        self._chunks = self._iter_chunks()
+        self._current = b""
+        self._offset = 0
+        self.first_read_at = None
+        self.finished_at = None
+
+    def read(self, size=-1):
+        if self.first_read_at is None:
+            self.first_read_at = time.perf_counter()
+        parts = []
+        remaining = size
+        while remaining != 0:
+            if self._offset >= len(self._current):
+                self._current = next(self._chunks, b"")
+                self._offset = 0
+                if not self._current:
+                    break
+            end = len(self._current) if remaining < 0 else min(len(self._current), self._offset + remaining)
+            parts.append(self._current[self._offset:end])
+            if remaining > 0:
+                remaining -= end - self._offset
+            self._offset = end
+
+        data = b"".join(parts)
+        self._position += len(data)
+        if self._position >= self._length and self.finished_at is None:
+            self.finished_at = time.perf_counter()
+        return data
+
+    def _iter_chunks(self):
+        for segment in self._segments:
+            if isinstance(segment, bytes):
+                yield segment
+                continue
+            _, mime_type = self._blob_store.info(segment)
+            yield f"data:{mime_type};base64,".encode("ascii")
+            for chunk in self._blob_store.iter_chunks(segment, _BLOB_CHUNK_SIZE):
+                yield base64.b64encode(chunk)
+
+    def _segment_length(self, segment):
+        if isinstance(segment, bytes):
+            return len(segment)
+        size, mime_type = self._blob_store.info(segment)
+        return len(f"data:{mime_type};base64,") + 4 * ((size + 2) // 3)
+
+class RequestBodyBuilder:
+    """
+    Serializa cada mensaje una sola vez y reutiliza su fragmento JSON en los turnos siguientes.
+
+    El historial solo crece por el final y sus mensajes no se modifican una vez
+    añadidos, así que el coste de serializar cada turno depende del mensaje nuevo
+    y no de la longitud de la conversación. Los fragmentos se indexan por la
+    identidad del mensaje; la caché guarda también el propio mensaje, lo que
+    impide que su id() se reutilice mientras la entrada exista.
+    """
+
+    def __init__(self, blob_store=None, max_entries=4096):
+        self.blob_store = blob_store
+        self.max_entries = max_entries
+        self._fragments = OrderedDict()
+        self._lock = threading.Lock()
+
+    def build(self, messages, params):
+        """
+        Devuelve un StreamedBody con {"messages": [...], **params}.
+
+        Args:
+            messages: Lista de mensajes (se recorre una vez, al llamar a este método).
+            params: Resto de campos del cuerpo (modelo, max_tokens, stream...).
+        """
+        segments = [b'{"messages":[']
+        for index, message in enumerate(messages):
+            if index:
+                segments.append(b",")
+            segments.extend(self._message_segments(message))
+
+        tail = json.dumps(params, ensure_ascii=False, separators=(",", ":"))
+        segments.append(b"]" + (b"," + tail[1:].encode("utf-8") if params else b"}"))
+        return StreamedBody(segments, self.blob_store)
+
+    def clear(self):
+        with self._lock:
+            self._fragments.clear()
+
+    def _message_segments(self, message):
+        key = id(message)
+        with self._lock:
+            entry = self._fragments.get(key)
+            if entry is not None and entry[0] is message:
+                self._fragments.move_to_end(key)
+                return entry[1]
+
+        segments = self._serialize(message)
+        with self._lock:
+            self._fragments[key] = (message, segments)
+            while len(self._fragments) > self.max_entries:
+                self._fragments.popitem(last=False)
+        return segments
+
+    @staticmethod
+    def _serialize(message):
+        """Serializa el mensaje separando las referencias a blobs en segmentos propios."""
+        text = json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+        segments = []
+        position = 0
+        for match in _BLOB_URL_PATTERN.finditer(text):
+            segments.append(text[position:match.start()].encode("utf-8"))
+            segments.append(match.group(0))
+            position = match.end()
+        segments.append(text[position:].encode("utf-8"))
+        return segments
@@ -0,0 +1,157 @@
+# request_executor.py
+# Ejecutor persistente de peticiones a la API con cola, identificadores y cancelación.
+
+import itertools
+import queue
+import threading
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from api_client import APIError, RequestCancelled
+
+# Prioridades de las peticiones: un número menor se atiende antes
+PRIORITY_FOREGROUND = 0
+PRIORITY_BACKGROUND = 1
+# Las señales de parada se anteponen a cualquier petición
+_PRIORITY_STOP = -1
+
+class _Job:
+    """Petición encolada en el ejecutor."""
+
+    def __init__(self, request_id, history, stream, metrics=None, priority=PRIORITY_FOREGROUND):
+        self.request_id = request_id
+        self.history = history
+        self.stream = stream
+        self.metrics = metrics
+        self.priority = priority
+        self.started = False
+        self.cancel_event = threading.Event()
+
+class RequestExecutor(QObject):
+    """
+    Mantiene un conjunto fijo de hilos de trabajo que atienden una cola de peticiones.
+
+    Los hilos se crean una sola vez y se reutilizan en cada turno. Cada petición
+    recibe un identificador que acompaña a todas sus señales, de modo que la UI
+    puede ignorar resultados de peticiones canceladas o ya sustituidas.
+
+    El número de hilos es el límite global de peticiones simultáneas. Las que
+    esperan se atienden por prioridad (la pestaña visible antes que las demás) y,
+    a igual prioridad, por orden de llegada.
+    """
+    request_started = pyqtSignal(int)
+    delta_received = pyqtSignal(int, str)
+    response_received = pyqtSignal(int, str)
+    error_occurred = pyqtSignal(int, str)
+    request_cancelled = pyqtSignal(int)
+    # Se emite justo antes de 'response_received' con el RequestMetrics de la petición
+    metrics_ready = pyqtSignal(int, object)
+
+    def __init__(self, api_client, max_workers=2, parent=None):
+        super().__init__(parent)
+        self.api_client = api_client
+        self._queue = queue.PriorityQueue()
+        # Desempata por orden de llegada y evita comparar los trabajos entre sí
+        self._sequence = itertools.count()
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+        self._threads = []
+        for index in range(max_workers):
+            thread = threading.Thread(target=self._work, name=f"request-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, history, stream=False, metrics=None, priority=PRIORITY_FOREGROUND):
+        """
+        Encola una petición y devuelve su identificador.
+
+        Args:
+            history: Lista de mensajes a enviar. No debe modificarse mientras esté encolada.
+            stream: Si es True, los fragmentos se emiten con 'delta_received'.
+            metrics: RequestMetrics opcional; si se indica, se rellena durante la petición
+                y se entrega con 'metrics_ready'.
+            priority: PRIORITY_FOREGROUND o PRIORITY_BACKGROUND.
+        """
+        job = _Job(next(self._ids), history, stream, metrics, priority)
+        with self._lock:
+            self._jobs[job.request_id] = job
+        self._queue.put((priority, next(self._sequence), job))
+        return job.request_id
+
+    def set_priority(self, request_id, priority):
+        """Cambia la prioridad de una petición que aún no ha empezado."""
+        with self._lock:
+            job = self._jobs.get(request_id)
+            if job is None or job.started or job.priority == priority:
+                return
+            job.priority = priority
+        # La entrada anterior queda obsoleta y se descarta al salir de la cola
+        self._queue.put((priority, next(self._sequence), job))
+
+    def cancel(self, request_id):
+        """
+        Cancela una petición. Si aún está en cola no llegará a enviarse; si está en
+        curso en modo streaming se corta y se entrega el texto parcial recibido.
+        """
+        with self._lock:
+            job = self._jobs.get(request_id)
+        if job is not None:
+            job.cancel_event.set()
+
+    def cancel_all(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            job.cancel_event.set()
+
+    def pending_count(self):
+        """Número de peticiones en cola o en curso."""
+        with self._lock:
+            return len(self._jobs)
+
+    def shutdown(self):
+        """Cancela todo y detiene los hilos de trabajo."""
+        self.cancel_all()
+        for _ in self._threads:
+            self._queue.put((_PRIORITY_STOP, next(self._sequence), None))
+
+    def _work(self):
+        while True:
+            priority, _sequence, job = self._queue.get()
+            if job is None:
+                return
+            with self._lock:
+                if job.started or priority != job.priority:
+                    continue
+                job.started = True
+            try:
+                self._run(job)
+            finally:
+                with self._lock:
+                    self._jobs.pop(job.request_id, None)
+
+    def _run(self, job):
+        if job.cancel_event.is_set():
+            self.request_cancelled.emit(job.request_id)
+            return
+
+        self.request_started.emit(job.request_id)
+        if job.metrics is not None:
+            # El tiempo de espera en la cola no forma parte de la petición
+            job.metrics.restart()
+        on_delta = (lambda delta: self.delta_received.emit(job.request_id, delta)) if job.stream else None
+        try:
+            content = self.api_client.complete(job.history, stream=job.stream, on_delta=on_delta,
+                                               cancel_event=job.cancel_event, metrics=job.metrics)
+        except RequestCancelled:
+            self.request_cancelled.emit(job.request_id)
+        except APIError as e:
+            self.error_occurred.emit(job.request_id, str(e))
+        except Exception as e:
+            # Un fallo inesperado no debe terminar con el hilo de trabajo
+            self.error_occurred.emit(job.request_id, f"Error inesperado: {e}")
+        else:
+            if job.metrics is not None:
+                self.metrics_ready.emit(job.request_id, job.metrics)
+            self.response_received.emit(job.request_id, content)
@@ -0,0 +1,130 @@
+# request_metrics.py
+# Desglose de tiempos, bytes y tokens de cada petición, y registro rotativo en disco.
+
+import json
+import time
+
+class RequestMetrics:
+    """
+    Mediciones de una petición. Los tiempos están en segundos y son relativos al
+    inicio de la petición; los que no aplican quedan a None.
+
+    Se crea solo si la instrumentación está activada: todo el código que mide
+    comprueba antes que el objeto exista, así que desactivada no cuesta nada.
+    """
+    FIELDS = (
+        "started_at", "endpoint", "stream", "cached", "prewarmed", "status_code",
+        "encode_s", "serialize_s", "connect_s", "upload_s", "ttft_s", "total_s",
+        "bytes_sent", "bytes_received", "prompt_tokens", "completion_tokens", "tokens_per_s",
+    )
+
+    def __init__(self, stream=False):
+        self.started_at = time.time()
+        self.stream = stream
+        # Servidor que atendió la petición cuando se usa un pool de servidores
+        self.endpoint = None
+        # True si la respuesta salió de la caché de respuestas sin llegar al servidor
+        self.cached = False
+        # True si el servidor recibió un precalentado del prefijo mientras se escribía el mensaje
+        self.prewarmed = False
+        self.status_code = None
+        self.encode_s = 0.0
+        self.serialize_s = None
+        self.connect_s = None
+        self.upload_s = None
+        self.ttft_s = None
+        self.total_s = None
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.prompt_tokens = None
+        self.completion_tokens = None
+        self.tokens_per_s = None
+        self._t0 = time.perf_counter()
+
+    def restart(self):
+        """Toma el instante actual como inicio de la petición."""
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+
+    def elapsed(self):
+        return time.perf_counter() - self._t0
+
+    def since_start(self, perf_counter_value):
+        """Convierte un instante de time.perf_counter() en segundos desde el inicio."""
+        return None if perf_counter_value is None else perf_counter_value - self._t0
+
+    def finish(self, usage):
+        """Cierra la medición con el bloque 'usage' de la respuesta."""
+        self.total_s = self.elapsed()
+        self.prompt_tokens = usage.get("prompt_tokens")
+        self.completion_tokens = usage.get("completion_tokens")
+        # Una respuesta de la caché no dice nada de la velocidad de generación
+        if self.completion_tokens and not self.cached:
+            # En streaming la velocidad de generación se mide desde el primer token; sin
+            # streaming el primer token llega con la respuesta completa y se usa el total
+            generation = self.total_s - (self.ttft_s or 0.0) if self.stream else self.total_s
+            if generation > 0:
+                self.tokens_per_s = self.completion_tokens / generation
+
+    def to_dict(self):
+        data = {}
+        for field in self.FIELDS:
+            value = getattr(self, field)
+            data[field] = round(value, 4) if isinstance(value, float) else value
+        return data
+
+    def summary(self):
+        """Resumen de una línea para la barra de estado."""
+        parts = ["Desde caché"] if self.cached else []
+        if self.prewarmed:
+            parts.append("Precalentado")
+        if self.ttft_s is not None:
+            parts.append(f"TTFT {self.ttft_s:.2f} s")
+        if self.total_s is not None:
+            parts.append(f"total {self.total_s:.2f} s")
+        if self.tokens_per_s is not None:
+            parts.append(f"{self.tokens_per_s:.1f} tok/s")
+        if self.prompt_tokens is not None and self.completion_tokens is not None:
+            parts.append(f"{self.prompt_tokens} + {self.completion_tokens} tokens")
+        parts.append(f"{self.bytes_sent / 1024:.0f} KB enviados")
+        return "  ·  ".join(parts)
+
+    def tooltip(self):
+        """Desglose completo, una medida por línea."""
+        labels = (
+            ("encode_s", "Preparar imágenes"), ("serialize_s", "Serializar"), ("connect_s", "Conectar"),
+            ("upload_s", "Enviar"), ("ttft_s", "Primer token"), ("total_s", "Total"),
+        )
+        lines = ["Respuesta servida desde la caché"] if self.cached else []
+        if self.prewarmed:
+            lines.append("Prefijo precalentado mientras se escribía")
+        lines += [f"{label}: {getattr(self, field) * 1000:.0f} ms"
+                  for field, label in labels if getattr(self, field) is not None]
+        if self.endpoint is not None:
+            lines.append(f"Servidor: {self.endpoint}")
+        lines.append(f"Bytes enviados/recibidos: {self.bytes_sent} / {self.bytes_received}")
+        if self.prompt_tokens is not None:
+            lines.append(f"Tokens prompt/respuesta: {self.prompt_tokens} / {self.completion_tokens}")
+        if self.tokens_per_s is not None:
+            lines.append(f"Velocidad: {self.tokens_per_s:.1f} tok/s")
+        return "\n".join(lines)
+
+class MetricsLog:
+    """Añade cada medición como una línea JSON a un archivo que rota al alcanzar 'max_bytes'."""
+
+    def __init__(self, path, max_bytes=5 * 1024 * 1024, backup_count=3):
+        # logging.handlers arrastra varios módulos; solo se carga si hay registro en disco
+        import logging
+        from logging.handlers import RotatingFileHandler
+        self._logger = logging.getLogger(f"lmstudio.metrics.{path}")
+        self._logger.setLevel(logging.INFO)
+        # Las mediciones no deben mezclarse con los logs normales de la aplicación
+        self._logger.propagate = False
+        if not self._logger.handlers:
+            handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count,
+                                          encoding="utf-8", delay=True)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._logger.addHandler(handler)
+
+    def write(self, metrics):
+        self._logger.info(json.dumps(metrics.to_dict()))
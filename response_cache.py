@@ -0,0 +1,148 @@
+# response_cache.py
+# Caché persistente de respuestas para peticiones deterministas.
+#
+# Al repetir exactamente la misma petición (mismo endpoint, modelo, parámetros de
+# muestreo y mensajes) la respuesta se sirve desde disco sin volver al modelo. Solo
+# tiene sentido si el muestreo es determinista; con temperatura distinta de 0 y sin
+# semilla cada petición puede dar una respuesta diferente y la caché se omite.
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+
+from blob_store import is_blob_ref
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    content TEXT NOT NULL,
+    usage TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_by_access ON responses(accessed_at);
+"""
+
+# Parámetros que no afectan al texto generado y no forman parte de la clave
+_IGNORED_PARAMS = ("stream",)
+
+# Trozos en que se reproduce una respuesta cacheada en modo streaming: una palabra con su espacio
+_REPLAY_PIECE = re.compile(r"\s*\S+\s*|\s+")
+
+def is_deterministic(params):
+    """True si los parámetros de muestreo producen siempre la misma respuesta."""
+    return params.get("temperature") == 0 or params.get("seed") is not None
+
+def _canonical_content(content):
+    """Sustituye las imágenes en línea (data URLs) por su hash para no usar el base64 en la clave."""
+    if not isinstance(content, list):
+        return content
+    parts = []
+    for part in content:
+        url = part.get("image_url", {}).get("url")
+        if url is not None and not is_blob_ref(url):
+            # Las referencias a blobs ya son un hash del contenido; el resto se resume igual
+            url = "sha256:" + hashlib.sha256(url.encode("utf-8")).hexdigest()
+            part = dict(part, image_url=dict(part["image_url"], url=url))
+        parts.append(part)
+    return parts
+
+def cache_key(endpoint, params, messages):
+    """Hash canónico de la petición: no depende del orden de las claves ni del modo streaming."""
+    canonical = {
+        "endpoint": endpoint,
+        "params": {name: value for name, value in params.items() if name not in _IGNORED_PARAMS},
+        "messages": [dict(message, content=_canonical_content(message.get("content"))) for message in messages],
+    }
+    encoded = json.dumps(canonical, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+def replay_pieces(content):
+    """Divide una respuesta cacheada en fragmentos para reproducirla como un stream."""
+    return _REPLAY_PIECE.findall(content)
+
+class ResponseCache:
+    """
+    Respuestas guardadas en SQLite con expulsión LRU por tamaño total y por antigüedad.
+
+    Es seguro usarla desde varios hilos. Los contadores de aciertos y fallos son de
+    la ejecución actual.
+    """
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024, max_age=30 * 24 * 3600, force=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        # Si es True también se cachean peticiones con muestreo no determinista
+        self.force = force
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(_SCHEMA)
+        with self._lock, self._connection:
+            self._expire()
+
+    def accepts(self, params):
+        return self.force or is_deterministic(params)
+
+    def get(self, key):
+        """Devuelve (contenido, usage) o None, y actualiza los contadores."""
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT content, usage FROM responses WHERE key = ? AND created_at >= ?",
+                (key, now - self.max_age)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            with self._connection:
+                self._connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        return row[0], json.loads(row[1])
+
+    def put(self, key, content, usage=None):
+        now = time.time()
+        usage_json = json.dumps(usage or {})
+        size = len(content.encode("utf-8")) + len(usage_json)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, content, usage, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)", (key, content, usage_json, size, now, now))
+            self._expire()
+
+    def stats(self):
+        """Devuelve un resumen con aciertos, fallos, entradas y bytes ocupados."""
+        with self._lock:
+            entries, total = self._connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": total}
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM responses")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _expire(self):
+        """Elimina las entradas caducadas y, si se supera el tamaño, las usadas hace más tiempo."""
+        self._connection.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age,))
+        total = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        removed = []
+        for key, size in self._connection.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+            removed.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self._connection.executemany("DELETE FROM responses WHERE key = ?", removed)
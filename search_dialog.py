@@ -0,0 +1,106 @@
+# search_dialog.py
+# Ventana de búsqueda semántica en las conversaciones guardadas.
+
+import threading
+import time
+from PyQt5.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QLineEdit, QPushButton, QLabel, QListWidget, QListWidgetItem
+from PyQt5.QtCore import Qt, pyqtSignal
+
+from api_client import APIError, RequestCancelled
+from session_store import message_text
+
+class SemanticSearchDialog(QDialog):
+    """
+    Busca mensajes parecidos a una consulta con el índice semántico. La consulta se
+    convierte en vector en un hilo aparte; del resultado solo se leen de la base de
+    datos los mensajes que se muestran. Doble clic abre la sesión del mensaje.
+    """
+    # Se pidió abrir una sesión: (id de sesión, título)
+    session_requested = pyqtSignal(int, str)
+    # Uso interno: resultado de una búsqueda hecha en segundo plano
+    _search_finished = pyqtSignal(int, object, float, str)
+
+    # Caracteres del mensaje que se muestran en cada resultado
+    SNIPPET_CHARS = 160
+
+    def __init__(self, index, api_client, session_store, results=20, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Buscar en las conversaciones")
+        self.setGeometry(150, 150, 700, 500)
+        self.index = index
+        self.api_client = api_client
+        self.session_store = session_store
+        self.results = results
+        # Número de la última búsqueda; las respuestas de búsquedas anteriores se ignoran
+        self._search_id = 0
+
+        layout = QVBoxLayout(self)
+        search_layout = QHBoxLayout()
+        self.query_input = QLineEdit()
+        self.query_input.setPlaceholderText("Describe lo que buscas...")
+        self.search_button = QPushButton("Buscar")
+        search_layout.addWidget(self.query_input)
+        search_layout.addWidget(self.search_button)
+        self.status_label = QLabel(f"{index.rows} mensajes indexados")
+        self.results_list = QListWidget()
+        self.results_list.setWordWrap(True)
+
+        layout.addLayout(search_layout)
+        layout.addWidget(self.status_label)
+        layout.addWidget(self.results_list)
+
+        self.query_input.returnPressed.connect(self.search)
+        self.search_button.clicked.connect(self.search)
+        self.results_list.itemActivated.connect(self._open_result)
+        self._search_finished.connect(self._show_results)
+
+    def showEvent(self, event):
+        # La ventana se reutiliza: si no hay resultados, el recuento refleja lo indexado desde entonces
+        if self.results_list.count() == 0 and self.status_label.text().endswith("mensajes indexados"):
+            self.status_label.setText(f"{self.index.rows} mensajes indexados")
+        super().showEvent(event)
+
+    def search(self):
+        query = self.query_input.text().strip()
+        if not query:
+            return
+        self._search_id += 1
+        search_id = self._search_id
+        self.status_label.setText("Buscando...")
+
+        def run():
+            try:
+                vector = self.api_client.embed([query], self.index.model)[0]
+                start = time.perf_counter()
+                results = self.index.search(vector, self.results)
+                self._search_finished.emit(search_id, results, time.perf_counter() - start, "")
+            except (APIError, RequestCancelled, ValueError) as e:
+                self._search_finished.emit(search_id, [], 0.0, str(e))
+
+        threading.Thread(target=run, name="semantic-search", daemon=True).start()
+
+    def _show_results(self, search_id, results, elapsed, error):
+        if search_id != self._search_id:
+            return
+        self.results_list.clear()
+        if error:
+            self.status_label.setText(f"No se pudo buscar: {error}")
+            return
+        messages = self.session_store.messages_by_id(message_id for message_id, _ in results)
+        for message_id, score in results:
+            if message_id not in messages:
+                continue
+            session_id, title, message = messages[message_id]
+            text = " ".join(message_text(message).split())
+            snippet = text[:self.SNIPPET_CHARS] + ("…" if len(text) > self.SNIPPET_CHARS else "")
+            label = "Usuario" if message["role"] == "user" else "Asistente"
+            item = QListWidgetItem(f"{score:.2f}  {title or 'Sin título'}\n{label}: {snippet}")
+            item.setData(Qt.UserRole, (session_id, title))
+            self.results_list.addItem(item)
+        self.status_label.setText(f"{self.results_list.count()} resultados en {elapsed * 1000:.1f} ms "
+                                  f"entre {self.index.rows} mensajes indexados")
+
+    def _open_result(self, item):
+        session_id, title = item.data(Qt.UserRole)
+        self.session_requested.emit(session_id, title)
+        self.accept()
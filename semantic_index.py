@@ -0,0 +1,287 @@
+# semantic_index.py
+# Búsqueda semántica sobre los mensajes de las sesiones guardadas.
+#
+# Cada mensaje con texto se convierte en un vector con el endpoint /embeddings del
+# servidor. Los vectores se guardan normalizados, uno por fila, en una matriz
+# float32 en disco que se abre con memoria mapeada: una búsqueda es un producto
+# matriz-vector (la similitud coseno) más la selección de los k mejores, sin leer
+# el texto de ningún mensaje salvo el de los resultados.
+
+import array
+import heapq
+import json
+import math
+import os
+import sqlite3
+import threading
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from api_client import APIError, RequestCancelled
+from session_store import SessionStore, message_text
+
+def _load_numpy():
+    """Devuelve el módulo numpy, o None si no está instalado."""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+class SemanticIndex:
+    """
+    Vectores de los mensajes guardados en 'directory':
+
+    - vectors.f32: matriz float32 con un vector normalizado por fila.
+    - message_ids.i64: el id del mensaje de cada fila.
+    - index.json: modelo, dimensión y último mensaje procesado.
+
+    Un hilo puede añadir filas mientras otros buscan. Con NumPy la búsqueda está
+    vectorizada; sin él se recorre la matriz por bloques en Python, lo que solo es
+    razonable con unos pocos miles de mensajes. Si cambia el modelo se empieza de cero.
+    """
+    # Filas que se leen de una vez al buscar sin NumPy
+    _PYTHON_CHUNK_ROWS = 4096
+
+    def __init__(self, directory, model):
+        self.directory = directory
+        self.model = model
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._ids_path = os.path.join(directory, "message_ids.i64")
+        self._metadata_path = os.path.join(directory, "index.json")
+        self._lock = threading.Lock()
+        self._numpy = _load_numpy()
+        # Matrices mapeadas de la última búsqueda; se vuelven a mapear cuando se añaden filas
+        self._matrix = None
+        self._ids = None
+        os.makedirs(directory, exist_ok=True)
+        self.dimension = None
+        self.last_message_id = 0
+        self.rows = 0
+        self._load()
+
+    def append(self, message_ids, vectors, last_message_id):
+        """
+        Añade los vectores de 'message_ids' y marca como procesados los mensajes hasta
+        'last_message_id' (también los que no tenían texto y no se indexaron).
+        """
+        if len(vectors) != len(message_ids):
+            raise ValueError(f"Hay {len(vectors)} vectores para {len(message_ids)} mensajes.")
+        with self._lock:
+            if len(vectors):
+                if self.dimension is None:
+                    self.dimension = len(vectors[0])
+                data = self._normalized_bytes(vectors)
+                self._append_rows(data, array.array("q", message_ids).tobytes())
+                self.rows += len(vectors)
+                self._matrix = None
+                self._ids = None
+            self.last_message_id = last_message_id
+            self._save_metadata()
+
+    def _append_rows(self, vector_data, id_data):
+        """Añade las filas a los dos archivos; si falla una escritura, los deja como estaban."""
+        sizes = [(path, os.path.getsize(path) if os.path.exists(path) else 0)
+                 for path in (self._vectors_path, self._ids_path)]
+        try:
+            with open(self._vectors_path, "ab") as f:
+                f.write(vector_data)
+            with open(self._ids_path, "ab") as f:
+                f.write(id_data)
+        except OSError:
+            # Con una escritura a medias las filas y sus ids quedarían desalineados
+            for path, size in sizes:
+                with open(path, "ab") as f:
+                    f.truncate(size)
+            raise
+
+    def _normalized_bytes(self, vectors):
+        """Filas float32 de los vectores divididos por su norma, listas para añadir a la matriz."""
+        for vector in vectors:
+            if len(vector) != self.dimension:
+                raise ValueError(f"Se esperaba un vector de {self.dimension} dimensiones y llegó uno de {len(vector)}.")
+        if self._numpy is not None:
+            numpy = self._numpy
+            matrix = numpy.asarray(vectors, dtype=numpy.float32)
+            norms = numpy.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            return (matrix / norms).astype(numpy.float32).tobytes()
+        data = array.array("f")
+        for vector in vectors:
+            norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+            data.extend(value / norm for value in vector)
+        return data.tobytes()
+
+    def search(self, query_vector, k=10):
+        """Devuelve hasta 'k' pares (id de mensaje, similitud coseno), del más parecido al menos."""
+        with self._lock:
+            rows, dimension = self.rows, self.dimension
+            if not rows or dimension is None:
+                return []
+            if len(query_vector) != dimension:
+                raise ValueError("El vector de la consulta no tiene la dimensión del índice; "
+                                 "¿ha cambiado el modelo de embeddings?")
+            if self._numpy is not None and self._matrix is None:
+                numpy = self._numpy
+                self._matrix = numpy.memmap(self._vectors_path, dtype=numpy.float32, mode="r",
+                                            shape=(rows, dimension))
+                self._ids = numpy.memmap(self._ids_path, dtype=numpy.int64, mode="r", shape=(rows,))
+            matrix, ids = self._matrix, self._ids
+
+        # Las filas solo se añaden al final, así que lo ya mapeado sigue siendo válido fuera del lock
+        if self._numpy is not None:
+            results = self._search_numpy(matrix, ids, query_vector, k)
+        else:
+            results = self._search_python(rows, dimension, query_vector, k)
+        # Un cierre a mitad de append() puede dejar filas repetidas de un mismo mensaje
+        unique = {}
+        for message_id, score in results:
+            unique.setdefault(message_id, score)
+        return list(unique.items())
+
+    def _search_numpy(self, matrix, ids, query_vector, k):
+        numpy = self._numpy
+        query = numpy.asarray(query_vector, dtype=numpy.float32)
+        norm = numpy.linalg.norm(query)
+        if norm:
+            query = query / norm
+        scores = matrix @ query
+        k = min(k, len(scores))
+        # argpartition es lineal; solo se ordenan los k elegidos
+        top = numpy.argpartition(-scores, k - 1)[:k]
+        top = top[numpy.argsort(-scores[top])]
+        return [(int(ids[row]), float(scores[row])) for row in top]
+
+    def _search_python(self, rows, dimension, query_vector, k):
+        norm = math.sqrt(sum(value * value for value in query_vector)) or 1.0
+        query = [value / norm for value in query_vector]
+        best = []
+        with open(self._vectors_path, "rb") as vectors_file, open(self._ids_path, "rb") as ids_file:
+            for start in range(0, rows, self._PYTHON_CHUNK_ROWS):
+                count = min(self._PYTHON_CHUNK_ROWS, rows - start)
+                vectors = array.array("f")
+                vectors.fromfile(vectors_file, count * dimension)
+                ids = array.array("q")
+                ids.fromfile(ids_file, count)
+                for row in range(count):
+                    offset = row * dimension
+                    score = sum(a * b for a, b in zip(vectors[offset:offset + dimension], query))
+                    item = (score, ids[row])
+                    if len(best) < k:
+                        heapq.heappush(best, item)
+                    elif item > best[0]:
+                        heapq.heapreplace(best, item)
+        return [(message_id, score) for score, message_id in sorted(best, reverse=True)]
+
+    def _load(self):
+        try:
+            with open(self._metadata_path, "r", encoding="utf-8") as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            metadata = {}
+        if metadata.get("model") != self.model:
+            # Vectores de otro modelo no son comparables; se reindexa todo
+            self._truncate(0)
+            self._save_metadata()
+            return
+        self.last_message_id = metadata.get("last_message_id", 0)
+        self.dimension = metadata.get("dimension")
+        if self.dimension is None:
+            self._truncate(0)
+            return
+        vector_rows = self._file_size(self._vectors_path) // (4 * self.dimension)
+        id_rows = self._file_size(self._ids_path) // 8
+        # Un cierre a mitad de una escritura puede dejar una fila incompleta
+        self.rows = min(vector_rows, id_rows)
+        self._truncate(self.rows)
+
+    def _truncate(self, rows):
+        dimension = self.dimension or 0
+        for path, size in ((self._vectors_path, rows * 4 * dimension), (self._ids_path, rows * 8)):
+            with open(path, "ab") as f:
+                f.truncate(size)
+
+    def _save_metadata(self):
+        metadata = {"model": self.model, "dimension": self.dimension, "last_message_id": self.last_message_id}
+        temporary_path = self._metadata_path + ".tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump(metadata, f)
+        os.replace(temporary_path, self._metadata_path)
+
+    @staticmethod
+    def _file_size(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+class EmbeddingIndexer(QObject):
+    """
+    Mantiene el índice al día en un hilo en segundo plano: lee de la base de datos de
+    sesiones los mensajes posteriores al último indexado y los envía a /embeddings
+    por lotes. notify() lo despierta cuando se guardan mensajes nuevos.
+
+    'progress' lleva el número de mensajes indexados; 'failed', el error si el
+    servidor no tiene un modelo de embeddings disponible (se reintenta más tarde).
+    """
+    progress = pyqtSignal(int)
+    failed = pyqtSignal(str)
+
+    def __init__(self, index, api_client, session_path, batch_size=32, max_chars=2000, retry_interval=60.0,
+                 parent=None):
+        super().__init__(parent)
+        self.index = index
+        self.api_client = api_client
+        self.session_path = session_path
+        self.batch_size = batch_size
+        # Los modelos de embeddings tienen un contexto corto; se usa el comienzo del mensaje
+        self.max_chars = max_chars
+        self.retry_interval = retry_interval
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="embedding-indexer", daemon=True)
+            self._thread.start()
+            self._wake.set()
+
+    def notify(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake.set()
+
+    def _run(self):
+        # Conexión propia: SessionStore no se comparte entre hilos
+        session_store = SessionStore(self.session_path)
+        try:
+            while not self._stop_event.is_set():
+                self._wake.wait()
+                self._wake.clear()
+                try:
+                    self._index_pending(session_store)
+                except RequestCancelled:
+                    return
+                except (APIError, ValueError, OSError, sqlite3.Error) as e:
+                    self.failed.emit(str(e))
+                    self._stop_event.wait(self.retry_interval)
+                    self._wake.set()
+        finally:
+            session_store.close()
+
+    def _index_pending(self, session_store):
+        while not self._stop_event.is_set():
+            page = session_store.messages_after(self.index.last_message_id, self.batch_size)
+            if not page:
+                return
+            message_ids, texts = [], []
+            for message_id, message in page:
+                text = message_text(message).strip()
+                if text:
+                    message_ids.append(message_id)
+                    texts.append(text[:self.max_chars])
+            vectors = self.api_client.embed(texts, self.index.model, self._stop_event) if texts else []
+            self.index.append(message_ids, vectors, page[-1][0])
+            self.progress.emit(self.index.rows)
@@ -0,0 +1,134 @@
+# session_store.py
+# Guarda las conversaciones en una base de datos SQLite para poder reabrirlas.
+#
+# Cada mensaje se añade como una fila al enviarse o recibirse, sin reescribir la
+# sesión. Las imágenes no se guardan en la base de datos: el contenido solo lleva su
+# referencia "blob:sha256:<hash>" y el archivo vive en un BlobStore persistente, así
+# que una misma imagen adjuntada varias veces ocupa disco una sola vez.
+
+import json
+import sqlite3
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL DEFAULT '',
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_by_session ON messages(session_id, id);
+CREATE INDEX IF NOT EXISTS sessions_by_update ON sessions(updated_at);
+"""
+
+# Longitud máxima del título que se deriva del primer mensaje del usuario
+TITLE_LENGTH = 60
+
+def message_text(message):
+    """Devuelve el texto de un mensaje, tanto si su contenido es una cadena como una lista de partes."""
+    content = message.get("content")
+    if isinstance(content, str):
+        return content
+    return "\n".join(part.get("text", "") for part in content or [] if part.get("type") == "text")
+
+def message_images(message):
+    """Devuelve las URLs (o referencias a blobs) de las imágenes de un mensaje."""
+    content = message.get("content")
+    if not isinstance(content, list):
+        return []
+    return [part["image_url"]["url"] for part in content if part.get("type") == "image_url"]
+
+class SessionStore:
+    """
+    Almacén de sesiones de chat. Las lecturas se hacen por páginas desde el final
+    para que reabrir una sesión larga cueste lo mismo que una corta.
+
+    No es seguro compartirlo entre hilos; se usa desde el hilo de la interfaz.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        # WAL con sincronización normal: cada mensaje añadido es una escritura corta
+        # que no espera a un fsync completo, sin riesgo de corromper la base de datos
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("PRAGMA foreign_keys=ON")
+        self._connection.executescript(_SCHEMA)
+
+    def create_session(self, title=""):
+        now = time.time()
+        with self._connection:
+            cursor = self._connection.execute(
+                "INSERT INTO sessions (title, created_at, updated_at) VALUES (?, ?, ?)", (title, now, now))
+        return cursor.lastrowid
+
+    def list_sessions(self, limit=20):
+        """Devuelve [(id, título, última modificación)] empezando por la más reciente."""
+        return self._connection.execute(
+            "SELECT id, title, updated_at FROM sessions ORDER BY updated_at DESC LIMIT ?", (limit,)).fetchall()
+
+    def latest_session(self):
+        """Identificador de la sesión modificada más recientemente, o None."""
+        row = self._connection.execute("SELECT id FROM sessions ORDER BY updated_at DESC LIMIT 1").fetchone()
+        return row[0] if row else None
+
+    def append_message(self, session_id, message):
+        """Añade un mensaje al final de la sesión y devuelve su identificador."""
+        now = time.time()
+        with self._connection:
+            cursor = self._connection.execute(
+                "INSERT INTO messages (session_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                (session_id, message["role"], json.dumps(message["content"], ensure_ascii=False), now))
+            self._connection.execute("UPDATE sessions SET updated_at = ? WHERE id = ?", (now, session_id))
+            if message["role"] == "user":
+                # La sesión toma como título el comienzo del primer mensaje con texto
+                title = " ".join(message_text(message).split())[:TITLE_LENGTH]
+                if title:
+                    self._connection.execute("UPDATE sessions SET title = ? WHERE id = ? AND title = ''",
+                                             (title, session_id))
+        return cursor.lastrowid
+
+    def load_page(self, session_id, before_id=None, limit=50):
+        """
+        Devuelve hasta 'limit' mensajes anteriores a 'before_id' (o los últimos de la
+        sesión si es None) como [(id, mensaje)], del más antiguo al más reciente.
+        """
+        if before_id is None:
+            rows = self._connection.execute(
+                "SELECT id, role, content FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+                (session_id, limit)).fetchall()
+        else:
+            rows = self._connection.execute(
+                "SELECT id, role, content FROM messages WHERE session_id = ? AND id < ? ORDER BY id DESC LIMIT ?",
+                (session_id, before_id, limit)).fetchall()
+        return [(row_id, {"role": role, "content": json.loads(content)}) for row_id, role, content in reversed(rows)]
+
+    def messages_after(self, after_id, limit=100):
+        """Devuelve hasta 'limit' mensajes de cualquier sesión con id mayor que 'after_id', como [(id, mensaje)]."""
+        rows = self._connection.execute(
+            "SELECT id, role, content FROM messages WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit)).fetchall()
+        return [(row_id, {"role": role, "content": json.loads(content)}) for row_id, role, content in rows]
+
+    def messages_by_id(self, message_ids):
+        """Devuelve {id: (id de sesión, título de la sesión, mensaje)} de los mensajes indicados."""
+        message_ids = list(message_ids)
+        if not message_ids:
+            return {}
+        placeholders = ",".join("?" * len(message_ids))
+        rows = self._connection.execute(
+            "SELECT messages.id, sessions.id, sessions.title, messages.role, messages.content "
+            "FROM messages JOIN sessions ON sessions.id = messages.session_id "
+            f"WHERE messages.id IN ({placeholders})", message_ids).fetchall()
+        return {row_id: (session_id, title, {"role": role, "content": json.loads(content)})
+                for row_id, session_id, title, role, content in rows}
+
+    def close(self):
+        self._connection.close()
@@ -1,18 +1,65 @@
-# settings_panel.py
-# Componente de la UI para configurar la dirección de la API.
-
-from PyQt5.QtWidgets import QWidget, QHBoxLayout, QLabel, QLineEdit, QPushButton
-
-class SettingsPanel(QWidget):
-    def __init__(self, initial_url, parent=None):
-        super().__init__(parent)
-        layout = QHBoxLayout(self)
-        layout.setContentsMargins(0, 0, 0, 0)
-
-        api_label = QLabel("Dirección API:")
-        self.api_input = QLineEdit(initial_url)
-        self.update_api_button = QPushButton("Actualizar")
-
-        layout.addWidget(api_label)
-        layout.addWidget(self.api_input)
-        layout.addWidget(self.update_api_button)
\ No newline at end of file
+# settings_panel.py
+# Componente de la UI para configurar la dirección de la API.
+
+from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton, QCheckBox,
+                             QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView)
+
+class SettingsPanel(QWidget):
+    ENDPOINT_COLUMNS = ("Servidor", "Estado", "En curso", "Latencia", "Peticiones", "Fallos")
+
+    def __init__(self, initial_url, stream_enabled=True, parent=None):
+        super().__init__(parent)
+        main_layout = QVBoxLayout(self)
+        main_layout.setContentsMargins(0, 0, 0, 0)
+        layout = QHBoxLayout()
+        main_layout.addLayout(layout)
+        # Tabla con el estado de cada servidor; solo se crea si se usa un pool de servidores
+        self.endpoints_table = None
+
+        api_label = QLabel("Dirección API:")
+        self.api_input = QLineEdit(initial_url)
+        self.update_api_button = QPushButton("Actualizar")
+        # Muestra la respuesta a medida que se genera en lugar de esperar a que termine
+        self.stream_checkbox = QCheckBox("Streaming")
+        self.stream_checkbox.setChecked(stream_enabled)
+
+        layout.addWidget(api_label)
+        layout.addWidget(self.api_input)
+        layout.addWidget(self.update_api_button)
+        layout.addWidget(self.stream_checkbox)
+
+    def set_endpoint_stats(self, stats):
+        """Muestra las estadísticas de los servidores del pool (ver EndpointPool.stats)."""
+        if self.endpoints_table is None:
+            self.endpoints_table = QTableWidget(0, len(self.ENDPOINT_COLUMNS))
+            self.endpoints_table.setHorizontalHeaderLabels(self.ENDPOINT_COLUMNS)
+            self.endpoints_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+            self.endpoints_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+            self.endpoints_table.verticalHeader().setVisible(False)
+            self.endpoints_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+            self.endpoints_table.setSelectionMode(QAbstractItemView.NoSelection)
+            self.layout().addWidget(self.endpoints_table)
+            # Con un pool la dirección única no se usa; los servidores se configuran en config.py
+            self.api_input.setEnabled(False)
+            self.update_api_button.setEnabled(False)
+            self.api_input.setToolTip("Se usan los servidores de API_ENDPOINTS en config.py")
+
+        self.endpoints_table.setRowCount(len(stats))
+        for row, endpoint in enumerate(stats):
+            latency = endpoint["latency_ms"]
+            values = (
+                f"{endpoint['url']} (peso {endpoint['weight']:g})",
+                "Disponible" if endpoint["healthy"] else "Sin respuesta",
+                str(endpoint["in_flight"]),
+                "-" if latency is None else f"{latency:.0f} ms",
+                str(endpoint["requests"]),
+                str(endpoint["failures"]),
+            )
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if column == 1 and endpoint["last_error"]:
+                    item.setToolTip(endpoint["last_error"])
+                self.endpoints_table.setItem(row, column, item)
+        header_height = self.endpoints_table.horizontalHeader().height()
+        self.endpoints_table.setFixedHeight(header_height + sum(
+            self.endpoints_table.rowHeight(row) for row in range(len(stats))) + 4)
@@ -0,0 +1,25 @@
+# startup_probe.py
+# Medición del arranque de la aplicación.
+#
+# app.py importa este módulo antes que cualquier otro, así que su importación marca
+# el origen de tiempos. Cada parte del arranque anota un hito con mark() y el
+# resultado se puede volcar con "python app.py --profile-startup" (ver benchmark.py).
+# No importa Qt ni nada pesado: no debe alterar lo que mide.
+
+import json
+import time
+
+_START = time.perf_counter()
+_milestones = []
+
+def mark(name):
+    """Anota el hito 'name' con los segundos transcurridos desde el inicio del arranque."""
+    _milestones.append((name, time.perf_counter() - _START))
+
+def milestones():
+    """Hitos anotados hasta ahora, en orden, como {nombre: milisegundos}."""
+    return {name: round(elapsed * 1000, 3) for name, elapsed in _milestones}
+
+def report():
+    """Los hitos como una línea JSON."""
+    return json.dumps(milestones())
@@ -0,0 +1,115 @@
+# thumbnail_loader.py
+# Decodificación de miniaturas en segundo plano con una caché limitada por tamaño.
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5.QtCore import QObject, pyqtSignal, QSize
+from PyQt5.QtGui import QImage, QImageReader, QPixmap
+
+from image_utils import target_size
+
+def thumbnail_size(image_path, size):
+    """
+    Tamaño que tendrá la miniatura de la imagen leyendo solo su cabecera.
+    Devuelve un QSize inválido si el archivo no es una imagen legible.
+    """
+    reader = QImageReader(image_path)
+    reader.setAutoTransform(True)
+    source_size = reader.size()
+    if not source_size.isValid():
+        return QSize()
+    width, height = source_size.width(), source_size.height()
+    # Las rotaciones de 90º intercambian ancho y alto
+    if int(reader.transformation()) & 4:
+        width, height = height, width
+    return QSize(*target_size(width, height, size))
+
+def load_thumbnail(image_path, size):
+    """
+    Decodifica la imagen directamente al tamaño de la miniatura, sin materializar la
+    resolución completa (en JPEG el escalado se hace durante la decodificación).
+    """
+    reader = QImageReader(image_path)
+    reader.setAutoTransform(True)
+    source_size = reader.size()
+    if not source_size.isValid():
+        return QImage()
+    # El tamaño escalado se aplica antes de la rotación EXIF, así que se calcula sobre el original
+    reader.setScaledSize(QSize(*target_size(source_size.width(), source_size.height(), size)))
+    return reader.read()
+
+class ThumbnailLoader(QObject):
+    """
+    Carga miniaturas en un pool de hilos y las guarda en una caché LRU limitada en bytes.
+
+    'thumbnail()' devuelve la miniatura si ya está en caché; si no, la encarga y
+    devuelve None. Cuando está lista se emite 'thumbnail_ready' con la ruta y el
+    tamaño solicitados para que la vista vuelva a pintar.
+    """
+    thumbnail_ready = pyqtSignal(str, int)
+    # Uso interno: lleva la QImage decodificada del hilo de trabajo al hilo de la UI
+    _image_loaded = pyqtSignal(str, int, QImage)
+
+    def __init__(self, cache_limit=32 * 1024 * 1024, max_workers=2, parent=None):
+        super().__init__(parent)
+        self.cache_limit = cache_limit
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._pending = set()
+        self._failed = set()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="thumbnails")
+        self._image_loaded.connect(self._store)
+
+    def thumbnail(self, image_path, size):
+        """Devuelve el QPixmap de la miniatura o None si aún no está cargada."""
+        key = (image_path, size)
+        pixmap = self._cache.get(key)
+        if pixmap is not None:
+            self._cache.move_to_end(key)
+            return pixmap
+
+        with self._lock:
+            if key not in self._pending and key not in self._failed:
+                self._pending.add(key)
+                self._pool.submit(self._load, image_path, size)
+        return None
+
+    def release(self, image_paths=None):
+        """Libera de la caché las miniaturas de las rutas indicadas (o todas)."""
+        if image_paths is None:
+            keys = list(self._cache)
+        else:
+            image_paths = set(image_paths)
+            keys = [key for key in self._cache if key[0] in image_paths]
+        for key in keys:
+            self._cache_bytes -= self._pixmap_bytes(self._cache.pop(key))
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
+
+    def _load(self, image_path, size):
+        self._image_loaded.emit(image_path, size, load_thumbnail(image_path, size))
+
+    def _store(self, image_path, size, image):
+        key = (image_path, size)
+        with self._lock:
+            self._pending.discard(key)
+            if image.isNull():
+                # No se reintenta en cada repintado una imagen que no se puede leer
+                self._failed.add(key)
+                return
+
+        # QPixmap solo puede crearse en el hilo de la UI
+        pixmap = QPixmap.fromImage(image)
+        self._cache[key] = pixmap
+        self._cache_bytes += self._pixmap_bytes(pixmap)
+        while self._cache_bytes > self.cache_limit and len(self._cache) > 1:
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_bytes -= self._pixmap_bytes(evicted)
+        self.thumbnail_ready.emit(image_path, size)
+
+    @staticmethod
+    def _pixmap_bytes(pixmap):
+        return pixmap.width() * pixmap.height() * max(1, pixmap.depth() // 8)